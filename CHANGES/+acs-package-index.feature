@@ -0,0 +1,5 @@
+ACS refresh now builds an index of the packages of each path by pkgId, which syncs use to find a
+whole batch of packages in the Alternate Content Sources with a single query. Other artifacts,
+and packages missing from the index, are still matched by any of their digests. Paths whose
+repomd.xml has not changed since their last refresh are skipped.
+When several sources provide a package, the ACS whose name sorts first is used.
@@ -0,0 +1,4 @@
+Added the `ADAPTIVE_DOWNLOAD_CONCURRENCY` setting: the number of downloads in flight from each host
+is adapted to its throughput, latency and errors, within `ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN` and
+`ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX`. Waiting downloads are started in order, but large ones let a
+number of smaller ones go first.
@@ -0,0 +1,3 @@
+PublishedArtifacts are now created in fixed-size batches while the content is streamed from the
+database, both for regular and `mirror_complete` publications, so memory use no longer grows with
+the number of packages published.
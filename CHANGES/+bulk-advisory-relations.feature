@@ -0,0 +1 @@
+Saving advisories during sync checks which of them already have collections or references with one query per batch instead of two queries per advisory.
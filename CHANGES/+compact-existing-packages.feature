@@ -0,0 +1 @@
+Syncing into a repository with many packages needs much less memory and starts faster: existing packages are indexed by pkgId with only the fields needed to pass them on, instead of loading full Package objects.
@@ -0,0 +1,3 @@
+Reduced the memory used while parsing the packages of large repositories: pkgIds are tracked as
+64-bit hashes, each NEVRA string is shared by all the indices of its package, and only the
+retained versions of each package are kept for `retain_package_versions`.
@@ -0,0 +1 @@
+Added the `MAX_SUBREPO_SYNC_WORKERS` setting to probe and sync the sub-repositories of kickstart trees concurrently.
@@ -0,0 +1,3 @@
+Optimized syncs now ask the server whether `repomd.xml` and the treeinfo file changed since the
+previous sync with `If-None-Match` / `If-Modified-Since` requests, and are skipped without
+downloading any metadata when nothing did.
@@ -0,0 +1 @@
+Advisories, comps entries, modulemds and modulemd defaults which already exist (by digest) are no longer built into full model objects with all of their relations on every sync.
@@ -0,0 +1,2 @@
+Sped up parsing modular metadata: the documents are split while streaming the file, parsed with
+the libyaml-backed loader when available, and validated by a schema validator built only once.
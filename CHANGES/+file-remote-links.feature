@@ -0,0 +1,3 @@
+Added the `FILE_REMOTE_LINK_MODE` setting: files synced from `file://` remotes can be reflinked or
+hardlinked into the working directory instead of copied, when the filesystem allows it. Their
+checksums are still validated, and they are copied when linking isn't possible.
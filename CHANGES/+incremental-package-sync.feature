@@ -0,0 +1 @@
+Optimized syncs now carry packages which are unchanged since the previous sync over into the new repository version without sending them through the sync pipeline.
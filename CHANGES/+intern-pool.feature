@@ -0,0 +1,3 @@
+Package file lists and dependencies are interned in a bounded pool shared by the whole sync,
+instead of caches cleared whenever the package name changes, reducing the memory used to sync
+large repositories.
@@ -0,0 +1 @@
+Syncing repositories with many modular packages needs less memory: modulemds no longer keep the parsed packages alive until the end of the sync.
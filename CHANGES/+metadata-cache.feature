@@ -0,0 +1,3 @@
+Added an on-disk cache of repodata files, addressed by the checksum listed in `repomd.xml`, so
+that repositories synced from the same upstream download each metadata file only once. It is
+disabled by default, see the `METADATA_CACHE_DIR` and `METADATA_CACHE_MAX_SIZE` settings.
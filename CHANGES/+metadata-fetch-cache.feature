@@ -0,0 +1 @@
+Within one sync, repomd.xml and treeinfo files are now downloaded only once.
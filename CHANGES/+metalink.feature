@@ -0,0 +1 @@
+Added support for metalinks as the remote url. The repomd.xml of the mirrors is verified against the checksums in the metalink, and the artifact downloads are spread across the best METALINK_DOWNLOAD_MIRRORS mirrors, falling back to the next mirror if a download fails.
@@ -0,0 +1,3 @@
+The metadata files and package locations kept for `mirror_complete` syncs are now stored in a
+task-scoped sqlite database instead of process-wide dictionaries, so workers no longer accumulate
+them across syncs. Nothing is kept for syncs which don't mirror the metadata.
@@ -0,0 +1 @@
+Mirrors from a mirrorlist are now probed concurrently and ranked by metadata freshness and latency, the picked mirror is remembered for `MIRRORLIST_CACHE_TTL` seconds.
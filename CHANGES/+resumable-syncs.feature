@@ -0,0 +1,3 @@
+Optimized syncs now record their progress in a checkpoint: a retry of a failed or interrupted sync
+of the same repository metadata resumes with the new packages which were already saved, instead of
+processing them again.
@@ -0,0 +1 @@
+Package metadata is now parsed only once during sync, the packages are spooled to disk while the skip decisions are made and replayed afterwards.
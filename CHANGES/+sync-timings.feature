@@ -0,0 +1,3 @@
+Added per-stage timings to syncs: wall time, items processed, time spent waiting on the queues
+and peak batch size of each pipeline stage and metadata parsing phase are shown in the task's
+progress reports and saved in the repository's `last_sync_details`.
@@ -0,0 +1,3 @@
+ULN session keys are cached per account for the whole worker process and renewed when they expire
+or are rejected, and the login reuses the HTTP session of the downloads, so a ULN sync no longer
+logs in and sets up an XML-RPC client for every download.
@@ -0,0 +1,4 @@
+Packages which are unchanged since the previous sync now skip the whole pipeline even when their
+url changed, only their RemoteArtifact urls are updated, in bulk. Outside of mirror mode they are
+no longer passed to content association at all, since the new repository version contains them
+already.
@@ -0,0 +1 @@
+Package metadata and modules are now downloaded as zchunk deltas when the repository publishes zchunk metadata: the zchunk files of the previous sync are kept in the metadata cache (see `METADATA_CACHE_MAX_SIZE`) and only the changed chunks are fetched with HTTP range requests. Requires createrepo_c with zchunk support and the metadata cache, otherwise the regular metadata is downloaded as before.
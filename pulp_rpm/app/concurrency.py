@@ -0,0 +1,194 @@
+import asyncio
+import heapq
+import time
+import weakref
+from logging import getLogger
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+log = getLogger(__name__)
+
+# Downloads of at least this size are admitted after smaller ones which arrive later...
+LARGE_DOWNLOAD_SIZE = 64 * 1024 * 1024
+# ...but only after at most this many of them, so that they are not starved.
+LARGE_DOWNLOAD_DELAY = 50
+# The limit is raised while the throughput grows by at least this factor,
+THROUGHPUT_GAIN = 1.05
+# and lowered when it drops below this factor of the best one seen.
+THROUGHPUT_LOSS = 0.9
+# The limit is lowered when the latency grows beyond this factor of the lowest one seen.
+LATENCY_GROWTH = 2.0
+
+
+class HostConcurrency:
+    """
+    Adapts the number of downloads in flight from a host to how well the host copes with them.
+
+    The completed downloads are evaluated in windows of `limit` downloads (at least 4). After a
+    window with errors hinting at an overloaded host (429, 5xx, timeouts), the limit is halved.
+    Otherwise it is raised by one as long as the throughput keeps growing, and lowered by one if
+    the throughput drops or the latency grows, which means that the downloads queue up at the host.
+    The limit always stays between `minimum` and `maximum`.
+
+    Downloads waiting for a slot are admitted in the order they arrived, except that a download
+    of LARGE_DOWNLOAD_SIZE or more lets up to LARGE_DOWNLOAD_DELAY later ones pass, so that small
+    packages keep flowing through the pipeline while large ones are downloaded.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        """
+        Args:
+            initial (int): The number of downloads in flight to start with.
+            minimum (int): The lowest limit.
+            maximum (int): The highest limit.
+        """
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial, minimum), maximum)
+        self.in_flight = 0
+        self._waiters = []
+        self._seq = 0
+        self._best_throughput = 0.0
+        self._lowest_latency = None
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_started = time.monotonic()
+        self._window_downloads = 0
+        self._window_bytes = 0
+        self._window_latency = 0.0
+        self._window_errors = 0
+
+    async def acquire(self, size=None):
+        """
+        Wait for a download slot.
+
+        Args:
+            size (int): The expected size of the download, if known.
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        self._seq += 1
+        delay = LARGE_DOWNLOAD_DELAY if size and size >= LARGE_DOWNLOAD_SIZE else 0
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (self._seq + delay, self._seq, future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # the slot was granted before the cancellation came through
+                self.release()
+            raise
+
+    def release(self):
+        """Free a download slot."""
+        self.in_flight -= 1
+        self._admit()
+
+    def _admit(self):
+        while self._waiters and self.in_flight < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def record(self, size, latency):
+        """
+        Record a completed download.
+
+        Args:
+            size (int): Bytes downloaded.
+            latency (float): Seconds until the response headers were received.
+        """
+        self._window_downloads += 1
+        self._window_bytes += size
+        self._window_latency += latency
+        self._evaluate()
+
+    def record_error(self):
+        """Record a download which failed because the host is overloaded."""
+        self._window_downloads += 1
+        self._window_errors += 1
+        self._evaluate()
+
+    def _evaluate(self):
+        if self._window_downloads < max(self.limit, 4):
+            return
+        elapsed = max(time.monotonic() - self._window_started, 1e-6)
+        throughput = self._window_bytes / elapsed
+        successes = self._window_downloads - self._window_errors
+        latency = self._window_latency / successes if successes else None
+        previous = self.limit
+
+        latency_grew = (
+            latency is not None
+            and self._lowest_latency is not None
+            and latency > self._lowest_latency * LATENCY_GROWTH
+        )
+
+        if self._window_errors:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._best_throughput = throughput
+        elif latency_grew or throughput < self._best_throughput * THROUGHPUT_LOSS:
+            self.limit = max(self.minimum, self.limit - 1)
+            self._best_throughput = throughput
+        elif throughput >= self._best_throughput * THROUGHPUT_GAIN:
+            self._best_throughput = throughput
+            self.limit = min(self.maximum, self.limit + 1)
+
+        if latency is not None and (self._lowest_latency is None or latency < self._lowest_latency):
+            self._lowest_latency = latency
+        if self.limit != previous:
+            log.debug(
+                "Download concurrency {} -> {} ({:.0f} B/s, {} errors)".format(
+                    previous, self.limit, throughput, self._window_errors
+                )
+            )
+        self._reset_window()
+        self._admit()
+
+
+class AdaptiveConcurrency:
+    """
+    The adaptive download concurrency of a remote, tracked separately for each host.
+    """
+
+    def __init__(self, initial, minimum, maximum):
+        """
+        Args:
+            initial (int): The number of downloads in flight from a host to start with.
+            minimum (int): The lowest limit for a host.
+            maximum (int): The highest limit for a host.
+        """
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        # asyncio futures can't be shared by event loops
+        self._hosts = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls, initial):
+        """
+        Return the adaptive concurrency configured in the settings, or None if it is disabled.
+
+        Args:
+            initial (int): The configured download concurrency of the remote.
+        """
+        if not settings.ADAPTIVE_DOWNLOAD_CONCURRENCY:
+            return None
+        return cls(
+            initial,
+            settings.ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN,
+            settings.ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX,
+        )
+
+    def for_url(self, url):
+        """Return the HostConcurrency of the host of the url, in the running loop."""
+        hosts = self._hosts.setdefault(asyncio.get_running_loop(), {})
+        host = urlparse(url).netloc
+        if host not in hosts:
+            hosts[host] = HostConcurrency(self.initial, self.minimum, self.maximum)
+        return hosts[host]
@@ -1,18 +1,95 @@
 import asyncio
+import fcntl
+import hashlib
 import os
+import time
+import uuid
+import weakref
 from logging import getLogger
 from urllib.parse import quote, unquote, urlparse
 
+from aiohttp import ClientError, ClientResponseError
 from aiohttp_xmlrpc.client import ServerProxy, _Method
+from django.conf import settings
 from lxml import etree
 
-from pulpcore.plugin.download import FileDownloader, HttpDownloader
+from pulpcore.plugin.download import DownloadResult, FileDownloader, HttpDownloader
+from pulpcore.plugin.exceptions import (
+    DigestValidationError,
+    SizeValidationError,
+    TimeoutException,
+)
 
 from pulp_rpm.app.exceptions import UlnCredentialsError
 from pulp_rpm.app.shared_utils import urlpath_sanitize
 
 log = getLogger(__name__)
 
+# Errors after which a download is tried on the next mirror, if there is one.
+MIRROR_FALLBACK_ERRORS = (
+    asyncio.TimeoutError,
+    ClientError,
+    DigestValidationError,
+    FileNotFoundError,
+    SizeValidationError,
+    TimeoutException,
+)
+
+# Response statuses of an overloaded server, after which the adaptive concurrency is lowered.
+OVERLOADED_STATUSES = (429, 502, 503, 504)
+
+# ioctl request which clones a file sharing its data (a reflink), on filesystems supporting it.
+FICLONE = 0x40049409
+READ_CHUNK_SIZE = 1024 * 1024
+
+# How long a ULN session key is used before logging in again, ULN sessions expire after a while.
+ULN_SESSION_KEY_LIFETIME = 15 * 60
+# Responses of the ULN server to a request with an expired or invalidated session key.
+ULN_SESSION_EXPIRED_STATUSES = (401, 403)
+
+
+class NotModified(Exception):
+    """
+    Raised when a conditional request is answered with 304 Not Modified.
+    """
+
+
+def link_file(source, destination, hardlink=False):
+    """
+    Create a file sharing the data of another one, without copying it.
+
+    A reflink is tried first: the new file is independent of the source, the filesystem only
+    copies data that is written to later. If that's not supported and `hardlink` is allowed, the
+    file is hardlinked, i.e. both paths refer to the very same file.
+
+    Args:
+        source (str): Path of the existing file.
+        destination (str): Path of the file to create, which must not exist.
+        hardlink (bool): Whether a hardlink is acceptable.
+
+    Returns:
+        bool: True if the file was created, False if the filesystem doesn't allow it.
+
+    """
+    created = False
+    try:
+        with open(source, "rb") as src:
+            with open(destination, "xb") as dst:
+                created = True
+                fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError:
+        if created:
+            os.remove(destination)
+
+    if hardlink:
+        try:
+            os.link(source, destination)
+            return True
+        except OSError:
+            pass
+    return False
+
 
 class RpmFileDownloader(FileDownloader):
     """
@@ -23,6 +100,10 @@ class RpmFileDownloader(FileDownloader):
     so passing a kwarg into get_downloader() will pass it to constructor for any downloader.
 
     TODO: https://pulp.plan.io/issues/7352
+
+    Depending on the FILE_REMOTE_LINK_MODE setting, the file is reflinked (or hardlinked) into the
+    working directory instead of copied when the filesystem allows it, and only read once to
+    validate its digests. Otherwise it is copied like any other download.
     """
 
     def __init__(self, *args, **kwargs):
@@ -30,8 +111,44 @@ class RpmFileDownloader(FileDownloader):
         Initialize the downloader.
         """
         kwargs.pop("silence_errors_for_response_status_codes", None)
+        kwargs.pop("fallback_urls", None)
+        kwargs.pop("validators", None)
+        kwargs.pop("concurrency", None)
+        self.link_mode = settings.FILE_REMOTE_LINK_MODE
         super().__init__(*args, **kwargs)
 
+    async def _run(self, extra_data=None):
+        """
+        Link the file into the working directory if possible, copy it otherwise.
+
+        This method provides the same return object type and documented in
+        :meth:`~pulpcore.plugin.download.BaseDownloader._run`.
+        """
+        if self.link_mode in ("reflink", "hardlink"):
+            path = os.path.abspath(uuid.uuid4().hex)
+            if link_file(self._path, path, hardlink=self.link_mode == "hardlink"):
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, self._validate, path)
+                except BaseException:
+                    os.remove(path)
+                    raise
+                self.path = path
+                return DownloadResult(
+                    path=path,
+                    artifact_attributes=self.artifact_attributes,
+                    url=self.url,
+                    headers=None,
+                )
+        return await super()._run(extra_data=extra_data)
+
+    def _validate(self, path):
+        """Compute the size and digests of the linked file, and validate them."""
+        with open(path, "rb") as f:
+            while chunk := f.read(READ_CHUNK_SIZE):
+                self._record_size_and_digests_for_data(chunk)
+        self.validate_digests()
+        self.validate_size()
+
 
 class RpmDownloader(HttpDownloader):
     """
@@ -41,9 +158,18 @@ class RpmDownloader(HttpDownloader):
         silence_errors_for_response_status_codes (iterable): An iterable of response exception
             codes to be ignored when raising exception. e.g. `{404}`
         sles_auth_token (str): SLES authentication token.
+        fallback_urls (list): Urls of the same file on other mirrors, tried one after another if
+            the download from `url` fails.
+        byte_range (tuple): (start, end) offsets (both inclusive) to download only a part of the
+            file with an HTTP range request.
+        validators (dict): The "etag" and "last_modified" response headers of a previous download
+            of the url, to download it only if it has changed since.
+        concurrency (AdaptiveConcurrency): Limits the downloads in flight from each host instead
+            of the fixed `semaphore`, adapting the limit to how the host copes with them.
 
     Raises:
         FileNotFoundError: If aiohttp response status is 404 and silenced.
+        NotModified: If `validators` are given and the file has not changed.
     """
 
     def __init__(
@@ -52,12 +178,19 @@ class RpmDownloader(HttpDownloader):
         silence_errors_for_response_status_codes=None,
         sles_auth_token=None,
         urlencode=True,
+        fallback_urls=None,
+        byte_range=None,
+        validators=None,
+        concurrency=None,
         **kwargs,
     ):
         """
         Initialize the downloader.
         """
         self.sles_auth_token = sles_auth_token
+        self.byte_range = byte_range
+        self.validators = validators
+        self.concurrency = concurrency
 
         if silence_errors_for_response_status_codes is None:
             silence_errors_for_response_status_codes = set()
@@ -65,7 +198,11 @@ class RpmDownloader(HttpDownloader):
 
         super().__init__(*args, **kwargs)
 
-        new_url = self.url
+        self.url = self._prepare_url(self.url, urlencode)
+        self.fallback_urls = [self._prepare_url(url, urlencode) for url in fallback_urls or []]
+
+    def _prepare_url(self, url, urlencode):
+        new_url = url
         if urlencode:
             # Some upstream-repos (eg, Amazon) require url-encoded paths for things like "libc++"
             # Let's make them happy.
@@ -78,16 +215,45 @@ class RpmDownloader(HttpDownloader):
             #  (like, say, uln:) as "can't take relative paths", and throws away everything
             #  **except** the path-portion
             # So, we have a pretty ugly workaround.
-            parsed = urlparse(self.url)
+            parsed = urlparse(url)
             # two pieces of the URL: pre- and post-path
-            before_path, after_path = self.url.split(parsed.path)
+            before_path, after_path = url.split(parsed.path)
             new_path = quote(unquote(parsed.path), safe=":/")  # fix the path
             new_url = "{}{}{}".format(before_path, new_path, after_path)  # rebuild
         if self.sles_auth_token:
             auth_param = f"?{self.sles_auth_token}"
-            self.url = urlpath_sanitize(new_url) + auth_param
-        else:
-            self.url = new_url
+            return urlpath_sanitize(new_url) + auth_param
+        return new_url
+
+    async def run(self, extra_data=None):
+        """
+        Run the download, trying the `fallback_urls` one after another if it fails.
+
+        Each url gets the usual retries, only then the next mirror is tried. With an adaptive
+        `concurrency`, each url first waits for a slot of its own host.
+        """
+        urls = [self.url] + self.fallback_urls
+        for url in urls:
+            self.url = url
+            try:
+                return await self._run_on_host(extra_data=extra_data)
+            except MIRROR_FALLBACK_ERRORS as exc:
+                if url == urls[-1]:
+                    raise
+                log.warning(
+                    "Download of '{}' failed, trying the next mirror: {!r}".format(url, exc)
+                )
+
+    async def _run_on_host(self, extra_data=None):
+        if self.concurrency is None:
+            return await super().run(extra_data=extra_data)
+
+        host_concurrency = self.concurrency.for_url(self.url)
+        await host_concurrency.acquire(self.expected_size)
+        try:
+            return await super().run(extra_data=extra_data)
+        finally:
+            host_concurrency.release()
 
     def raise_for_status(self, response):
         """
@@ -112,23 +278,104 @@ class RpmDownloader(HttpDownloader):
         This method provides the same return object type and documented in
         :meth:`~pulpcore.plugin.download.BaseDownloader._run`.
         """
-        async with self.session.get(
-            self.url, proxy=self.proxy, proxy_auth=self.proxy_auth, auth=self.auth
-        ) as response:
-            self.raise_for_status(response)
-            to_return = await self._handle_response(response)
-            await response.release()
-            self.response_headers = response.headers
+        headers = {}
+        if self.byte_range:
+            headers["Range"] = "bytes={}-{}".format(*self.byte_range)
+        if self.validators:
+            if self.validators.get("etag"):
+                headers["If-None-Match"] = self.validators["etag"]
+            if self.validators.get("last_modified"):
+                headers["If-Modified-Since"] = self.validators["last_modified"]
+        host_concurrency = self.concurrency and self.concurrency.for_url(self.url)
+        started = time.monotonic()
+        try:
+            async with self.session.get(
+                self.url,
+                proxy=self.proxy,
+                proxy_auth=self.proxy_auth,
+                auth=self.auth,
+                headers=headers or None,
+            ) as response:
+                latency = time.monotonic() - started
+                if response.status == 304:
+                    raise NotModified()
+                self.raise_for_status(response)
+                to_return = await self._handle_response(response)
+                await response.release()
+                self.response_headers = response.headers
+        except (ClientResponseError, asyncio.TimeoutError, TimeoutException) as exc:
+            if host_concurrency and getattr(exc, "status", None) in (None, *OVERLOADED_STATUSES):
+                host_concurrency.record_error()
+            raise
+        if host_concurrency:
+            host_concurrency.record(to_return.artifact_attributes["size"], latency)
 
         if self._close_session_on_finalize:
             self.session.close()
         return to_return
 
 
+class UlnSessionKeys:
+    """
+    Process-wide cache of ULN session keys, shared by all the downloads of the same account.
+
+    The keys are cached by server url and credentials, and expire after `lifetime` seconds. Only
+    one download per account and event loop logs in at a time, the others wait for its key.
+    """
+
+    def __init__(self, lifetime=ULN_SESSION_KEY_LIFETIME):
+        """
+        Args:
+            lifetime (int or float): Seconds after which a session key is renewed.
+        """
+        self.lifetime = lifetime
+        self._keys = {}
+        # asyncio locks can't be shared by event loops, a task runs its own loop
+        self._locks = weakref.WeakKeyDictionary()
+
+    @staticmethod
+    def account(server_url, username, password):
+        """Return the cache key of an account, without holding on to the password itself."""
+        password_digest = hashlib.sha256((password or "").encode()).hexdigest()
+        return server_url, username, password_digest
+
+    def get(self, account):
+        """Return the session key of an account, or None if there is none or it has expired."""
+        entry = self._keys.get(account)
+        if entry is None:
+            return None
+        session_key, expires = entry
+        if time.monotonic() >= expires:
+            return None
+        return session_key
+
+    def set(self, account, session_key):
+        """Cache a new session key of an account."""
+        self._keys[account] = (session_key, time.monotonic() + self.lifetime)
+
+    def invalidate(self, account, session_key):
+        """Forget a session key rejected by the server, unless it has been renewed already."""
+        entry = self._keys.get(account)
+        if entry is not None and entry[0] == session_key:
+            del self._keys[account]
+
+    def lock(self, account):
+        """Return the lock which serializes the logins to an account in the running loop."""
+        locks = self._locks.setdefault(asyncio.get_running_loop(), {})
+        return locks.setdefault(account, asyncio.Lock())
+
+
+uln_session_keys = UlnSessionKeys()
+
+
 class UlnDownloader(RpmDownloader):
     """
     Custom Downloader for ULN repositories.
 
+    The session keys are shared by all the downloaders of the process (see `UlnSessionKeys`), and
+    the login uses the HTTP session of the downloader, so that a sync logs in only once. A key
+    rejected by the server is renewed and the download retried once.
+
     Args:
         username (str): Username for authentication in ULN network
         password (str): password for authentication in ULN network
@@ -153,48 +400,83 @@ class UlnDownloader(RpmDownloader):
 
         super().__init__(*args, **kwargs)
 
+    async def _get_session_key(self, server_url, account):
+        """
+        Return the cached session key of the account, logging in if there is none.
+        """
+        session_key = uln_session_keys.get(account)
+        if session_key:
+            return session_key
+        async with uln_session_keys.lock(account):
+            # another download may have logged in while this one was waiting
+            session_key = uln_session_keys.get(account)
+            if session_key:
+                return session_key
+            # the XML-RPC client shares the HTTP session of the downloads, it must not be closed
+            client = AllowProxyServerProxy(
+                server_url,
+                proxy=self.proxy,
+                proxy_auth=self.proxy_auth,
+                auth=self.auth,
+                client=self.session,
+            )
+            session_key = await self._login_and_retry(client)
+            if len(session_key) != 43:
+                raise UlnCredentialsError()
+            uln_session_keys.set(account, session_key)
+            return session_key
+
     async def _run(self, extra_data=None):
         """
         Download, validate, and compute digests on the `url`. This is a coroutine.
 
-        Once per session the coroutine logs into the ULN account using the
-        ULN username and password. The returned key is used for authentification
-        for all other downloads.
+        The ULN session key of the account is used for authentification, logging in first if
+        there is no valid one yet. If the server rejects the key, it is renewed and the download
+        retried once.
 
         This method provides the same return object type and documented in
         :meth:`~pulpcore.plugin.download.BaseDownloader._run`.
         """
         parsed = urlparse(self.url)
+        url = self.url
+        account = None
 
         if parsed.scheme == "uln":
             # get ULN Session-key
-            SERVER_URL = os.path.join(self.uln_server_base_url, "rpc/api")
-
-            # set proxy for authentification
-            client = AllowProxyServerProxy(
-                SERVER_URL, proxy=self.proxy, proxy_auth=self.proxy_auth, auth=self.auth
-            )
-            if not self.session_key:
-                self.session_key = await self._login_and_retry(client)
-                if len(self.session_key) != 43:
-                    raise UlnCredentialsError()
-                self.headers = {"X-ULN-API-User-Key": self.session_key}
-                await client.close()
+            server_url = os.path.join(self.uln_server_base_url, "rpc/api")
+            account = uln_session_keys.account(server_url, self.username, self.password)
+            self.session_key = await self._get_session_key(server_url, account)
             # build request url from input uri
             channelLabel = parsed.netloc
             path = parsed.path.lstrip("/")
             url = os.path.join(self.uln_server_base_url, "XMLRPC/GET-REQ", channelLabel, path)
-        async with self.session.get(
-            url, proxy=self.proxy, proxy_auth=self.proxy_auth, auth=self.auth, headers=self.headers
-        ) as response:
-            self.raise_for_status(response)
-            to_return = await self._handle_response(response)
-            await response.release()
-            self.response_headers = response.headers
+
+        renewed = False
+        while True:
+            if self.session_key:
+                self.headers = {"X-ULN-API-User-Key": self.session_key}
+            async with self.session.get(
+                url,
+                proxy=self.proxy,
+                proxy_auth=self.proxy_auth,
+                auth=self.auth,
+                headers=self.headers,
+            ) as response:
+                if account and not renewed and response.status in ULN_SESSION_EXPIRED_STATUSES:
+                    await response.release()
+                    log.info("ULN session key rejected, logging in again")
+                    uln_session_keys.invalidate(account, self.session_key)
+                    self.session_key = await self._get_session_key(server_url, account)
+                    renewed = True
+                    continue
+                self.raise_for_status(response)
+                to_return = await self._handle_response(response)
+                await response.release()
+                self.response_headers = response.headers
+            break
 
         if self._close_session_on_finalize:
             self.session.close()
-            client.close()
         return to_return
 
     async def _login_and_retry(self, client, max_attempts=4, delay=1):
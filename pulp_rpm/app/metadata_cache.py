@@ -0,0 +1,154 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+
+from django.conf import settings
+
+log = logging.getLogger(__name__)
+
+CACHE_DIRECTORY_NAME = "rpm-metadata-cache"
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class MetadataCache:
+    """
+    An on-disk cache of repodata files, addressed by the checksum published in repomd.xml.
+
+    Repositories synced from the same upstream share their metadata files, so they need only be
+    downloaded once. The files are kept at <directory>/<checksum type>/<checksum>, written
+    atomically so that several workers can share the directory. When the cache grows larger than
+    its maximum size, the least recently used files are removed.
+    """
+
+    def __init__(self, directory, max_size):
+        """
+        Args:
+            directory (str): Directory the files are cached in.
+            max_size (int): Size in bytes above which the least recently used files are removed.
+        """
+        self.directory = directory
+        self.max_size = max_size
+
+    @classmethod
+    def from_settings(cls):
+        """
+        Return the cache configured in the settings, or None if it is disabled.
+        """
+        max_size = settings.METADATA_CACHE_MAX_SIZE
+        if not max_size:
+            return None
+        directory = settings.METADATA_CACHE_DIR or os.path.join(
+            settings.WORKING_DIRECTORY, CACHE_DIRECTORY_NAME
+        )
+        return cls(directory, max_size)
+
+    def _path(self, checksum_type, checksum):
+        return os.path.join(self.directory, checksum_type, checksum)
+
+    def get(self, checksum_type, checksum):
+        """
+        Take a file out of the cache.
+
+        The file is verified against its checksum, an entry which doesn't match is removed.
+
+        Args:
+            checksum_type (str): The checksum type, e.g. "sha256".
+            checksum (str): The checksum of the file.
+
+        Returns:
+            str: Path of a copy of the file in the current directory, or None if it isn't cached.
+
+        """
+        cached_path = self._path(checksum_type, checksum)
+        path = os.path.abspath(uuid.uuid4().hex)
+        try:
+            # a hard link is as good as a copy, the cached files are never changed in place
+            os.link(cached_path, path)
+        except FileNotFoundError:
+            return None
+        except OSError:
+            try:
+                shutil.copyfile(cached_path, path)
+            except FileNotFoundError:
+                return None
+
+        if file_digest(path, checksum_type) != checksum:
+            log.warning("Removing corrupted file '{}' from the metadata cache".format(cached_path))
+            os.remove(path)
+            self._remove(cached_path)
+            return None
+
+        try:
+            # record the use for the LRU eviction
+            os.utime(cached_path)
+        except FileNotFoundError:
+            pass
+        return path
+
+    def add(self, checksum_type, checksum, path):
+        """
+        Add a downloaded (and verified) file to the cache, then evict files if it got too big.
+
+        Args:
+            checksum_type (str): The checksum type, e.g. "sha256".
+            checksum (str): The checksum of the file.
+            path (str): Path of the file.
+
+        """
+        cached_path = self._path(checksum_type, checksum)
+        if os.path.exists(cached_path):
+            return
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path), prefix=".")
+        os.close(fd)
+        try:
+            shutil.copyfile(path, tmp_path)
+            os.replace(tmp_path, cached_path)
+        except BaseException:
+            self._remove(tmp_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits in its maximum size."""
+        entries = []
+        total_size = 0
+        for checksum_type in os.scandir(self.directory):
+            if not checksum_type.is_dir():
+                continue
+            for entry in os.scandir(checksum_type.path):
+                if entry.name.startswith("."):
+                    # being written
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.max_size:
+                break
+            self._remove(path)
+            total_size -= size
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def file_digest(path, checksum_type):
+    """Return the hex digest of a file."""
+    digest = hashlib.new(checksum_type)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,128 @@
+import hashlib
+from typing import NamedTuple
+
+from lxml import etree
+
+METALINK_NS = "{http://www.metalinker.org/}"
+MIRRORMANAGER_NS = "{http://fedorahosted.org/mirrormanager}"
+REPOMD_PATH = "repodata/repomd.xml"
+
+
+class Metalink(NamedTuple):
+    """
+    The parts of a metalink (as published by MirrorManager) which describe repomd.xml.
+
+    Attributes:
+        hashes (list): Dicts of {checksum type: digest} of the repomd.xml files which are
+            accepted, the current one first and the alternates after it.
+        size (int): Size of the current repomd.xml, or None if not published.
+        mirror_urls (list): Base urls of the repositories on the mirrors, most preferred first.
+    """
+
+    hashes: list
+    size: int | None
+    mirror_urls: list
+
+
+def is_metalink(path):
+    """
+    Check whether the file is a metalink rather than a line-based mirrorlist.
+
+    Args:
+        path (str): Path of the downloaded mirrorlist or metalink.
+
+    Returns:
+        bool: True if the file is a metalink document.
+
+    """
+    with open(path, "rb") as f:
+        head = f.read(1024).lstrip()
+    return head.startswith(b"<") and b"<metalink" in head
+
+
+def parse_metalink(path):
+    """
+    Parse the repomd.xml entry of a metalink.
+
+    Args:
+        path (str): Path of the downloaded metalink.
+
+    Returns:
+        Metalink: The accepted checksums and the mirrors of repomd.xml, or None if the metalink
+            has no entry for repomd.xml.
+
+    """
+    tree = etree.parse(path, parser=etree.XMLParser(resolve_entities=False))
+    for file_element in tree.iter(f"{METALINK_NS}file"):
+        if file_element.get("name") != "repomd.xml":
+            continue
+
+        hashes = [_parse_hashes(file_element.find(f"{METALINK_NS}verification"))]
+        alternates = file_element.find(f"{MIRRORMANAGER_NS}alternates")
+        if alternates is not None:
+            for alternate in alternates.iter(f"{MIRRORMANAGER_NS}alternate"):
+                hashes.append(_parse_hashes(alternate))
+
+        size = file_element.findtext(f"{METALINK_NS}size")
+
+        resources = []
+        for url_element in file_element.iter(f"{METALINK_NS}url"):
+            url = (url_element.text or "").strip()
+            if url_element.get("protocol") not in ("http", "https"):
+                continue
+            if not url.split("?")[0].endswith(REPOMD_PATH):
+                continue
+            preference = int(url_element.get("preference") or 0)
+            resources.append((preference, url.split("?")[0][: -len(REPOMD_PATH)]))
+        # sorted() is stable, mirrors with the same preference keep the metalink's order
+        mirror_urls = [url for _, url in sorted(resources, key=lambda r: -r[0])]
+
+        return Metalink(
+            hashes=[h for h in hashes if h],
+            size=int(size) if size and size.isdigit() else None,
+            mirror_urls=mirror_urls,
+        )
+    return None
+
+
+def _parse_hashes(element):
+    if element is None:
+        return {}
+    return {
+        hash_element.get("type"): (hash_element.text or "").strip().lower()
+        for hash_element in element.iter(f"{METALINK_NS}hash")
+        if hash_element.get("type") in hashlib.algorithms_guaranteed
+    }
+
+
+def verify_repomd(metalink, path):
+    """
+    Check a downloaded repomd.xml against the checksums published in the metalink.
+
+    The strongest checksum type available is used. A repomd.xml matching one of the alternates
+    is accepted too, mirrors may lag behind a little.
+
+    Args:
+        metalink (Metalink): The parsed metalink.
+        path (str): Path of the downloaded repomd.xml.
+
+    Returns:
+        bool: True if the repomd.xml matches one of the published checksums.
+
+    """
+    if not metalink.hashes:
+        return False
+
+    with open(path, "rb") as f:
+        content = f.read()
+
+    digests = {}
+    for accepted in metalink.hashes:
+        for checksum_type in ("sha512", "sha256", "sha1", "md5"):
+            if checksum_type in accepted:
+                if checksum_type not in digests:
+                    digests[checksum_type] = hashlib.new(checksum_type, content).hexdigest()
+                if digests[checksum_type] == accepted[checksum_type]:
+                    return True
+                break
+    return False
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-17 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import pulpcore.app.models.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rpm', '0072_fix_evr_version_sorting'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RpmMirrorlistCache',
+            fields=[
+                ('pulp_id', models.UUIDField(default=pulpcore.app.models.base.pulp_uuid, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('mirrorlist_url', models.TextField()),
+                ('mirror_urls', models.JSONField(default=list)),
+                ('metalink', models.BooleanField(default=False)),
+                ('expires', models.DateTimeField()),
+                ('remote', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rpm_rpmmirrorlistcache', to='rpm.rpmremote')),
+            ],
+            options={
+                'default_related_name': '%(app_label)s_%(model_name)s',
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
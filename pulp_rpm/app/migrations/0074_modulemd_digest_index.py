@@ -0,0 +1,18 @@
+# Generated by Django 5.2.11 on 2026-10-17 11:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rpm', '0073_rpmmirrorlistcache'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='modulemd',
+            name='digest',
+            field=models.TextField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.11 on 2026-10-17 14:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import pulpcore.app.models.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0106_alter_artifactdistribution_distribution_ptr_and_more'),
+        ('rpm', '0074_modulemd_digest_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RpmAlternateContentSourcePackage',
+            fields=[
+                ('pulp_id', models.UUIDField(default=pulpcore.app.models.base.pulp_uuid, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('pkgId', models.TextField(db_index=True)),
+                ('location_href', models.TextField()),
+                ('acs_path', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rpm_rpmalternatecontentsourcepackage', to='core.alternatecontentsourcepath')),
+            ],
+            options={
+                'default_related_name': '%(app_label)s_%(model_name)s',
+                'unique_together': {('acs_path', 'pkgId')},
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.11 on 2026-10-17 16:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import pulpcore.app.models.base
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0106_alter_artifactdistribution_distribution_ptr_and_more'),
+        ('rpm', '0075_rpmalternatecontentsourcepackage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RpmSyncCheckpoint',
+            fields=[
+                ('pulp_id', models.UUIDField(default=pulpcore.app.models.base.pulp_uuid, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('repomd_checksum', models.TextField()),
+                ('download_policy', models.TextField()),
+                ('remote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rpm_rpmsynccheckpoint', to='core.remote')),
+                ('repository', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='rpm_rpmsynccheckpoint', to='rpm.rpmrepository')),
+            ],
+            options={
+                'default_related_name': '%(app_label)s_%(model_name)s',
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+        migrations.CreateModel(
+            name='RpmSyncCheckpointPackage',
+            fields=[
+                ('pulp_id', models.UUIDField(default=pulpcore.app.models.base.pulp_uuid, editable=False, primary_key=True, serialize=False)),
+                ('pulp_created', models.DateTimeField(auto_now_add=True)),
+                ('pulp_last_updated', models.DateTimeField(auto_now=True, null=True)),
+                ('pkgId', models.TextField()),
+                ('checkpoint', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='packages', to='rpm.rpmsynccheckpoint')),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.content')),
+            ],
+            options={
+                'unique_together': {('checkpoint', 'pkgId')},
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
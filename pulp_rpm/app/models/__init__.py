@@ -10,7 +10,15 @@ from .custom_metadata import RepoMetadataFile  # noqa
 from .distribution import Addon, Checksum, DistributionTree, Image, Variant  # noqa
 from .modulemd import Modulemd, ModulemdDefaults, ModulemdObsolete  # noqa
 from .package import Package, format_nevra, format_nevra_short, format_nvra  # noqa
-from .repository import RpmDistribution, RpmPublication, RpmRemote, UlnRemote, RpmRepository  # noqa
+from .repository import (  # noqa
+    RpmDistribution,
+    RpmMirrorlistCache,
+    RpmPublication,
+    RpmRemote,
+    UlnRemote,
+    RpmRepository,
+)
+from .checkpoint import RpmSyncCheckpoint, RpmSyncCheckpointPackage  # noqa
 
 # at the end to avoid circular import as ACS needs import RpmRemote
-from .acs import RpmAlternateContentSource  # noqa
+from .acs import RpmAlternateContentSource, RpmAlternateContentSourcePackage  # noqa
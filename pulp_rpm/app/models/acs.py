@@ -1,6 +1,13 @@
 from logging import getLogger
 
-from pulpcore.plugin.models import AlternateContentSource, AutoAddObjPermsMixin
+from django.db import models
+
+from pulpcore.plugin.models import (
+    AlternateContentSource,
+    AlternateContentSourcePath,
+    AutoAddObjPermsMixin,
+    BaseModel,
+)
 
 from pulp_rpm.app.models import RpmRemote
 
@@ -21,3 +28,30 @@ class RpmAlternateContentSource(AlternateContentSource, AutoAddObjPermsMixin):
             ("refresh_rpmalternatecontentsource", "Refresh an Alternate Content Source"),
             ("manage_roles_rpmalternatecontentsource", "Can manage roles on ACS"),
         ]
+
+
+class RpmAlternateContentSourcePackage(BaseModel):
+    """
+    An index of the packages available from the paths of the RPM Alternate Content Sources.
+
+    It is built when a path is refreshed, so that a sync can find the packages of a whole batch
+    in the ACSs with a single indexed query on their pkgIds.
+
+    Fields:
+        pkgId (Text):
+            Checksum of the package file.
+        location_href (Text):
+            Location of the package, relative to the url of the ACS path.
+
+    Relations:
+        acs_path (ForeignKey):
+            The ACS path the package is available from.
+    """
+
+    pkgId = models.TextField(db_index=True)
+    location_href = models.TextField()
+    acs_path = models.ForeignKey(AlternateContentSourcePath, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+        unique_together = ("acs_path", "pkgId")
@@ -0,0 +1,99 @@
+from django.db import models
+
+from pulpcore.plugin.models import BaseModel, Content, Remote
+
+from pulp_rpm.app.models.repository import RpmRepository
+
+
+class RpmSyncCheckpoint(BaseModel):
+    """
+    The progress of a sync of a repository which has not completed (yet).
+
+    The packages new to the repository which went all the way through the sync pipeline are
+    recorded. If the sync is interrupted and then retried with the same metadata, it resumes with
+    them instead of processing them again. Only optimized syncs keep a checkpoint, and it is
+    removed once the sync has completed.
+
+    Fields:
+        repomd_checksum (Text):
+            The sha256 of the repomd.xml being synced, which covers the checksums of all the
+            other metadata files.
+        download_policy (Text):
+            The download policy of the remote during the sync.
+
+    Relations:
+        repository (OneToOneField):
+            The repository being synced.
+        remote (ForeignKey):
+            The remote being synced from.
+    """
+
+    repomd_checksum = models.TextField()
+    download_policy = models.TextField()
+    repository = models.OneToOneField(RpmRepository, on_delete=models.CASCADE)
+    remote = models.ForeignKey(Remote, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+
+    @classmethod
+    def for_sync(cls, repository, remote, repomd_checksum):
+        """
+        Return the checkpoint of an interrupted sync of the same metadata, or a new one.
+
+        A checkpoint left by a sync of different metadata, from another remote or with another
+        download policy, is useless and replaced.
+
+        Args:
+            repository (RpmRepository): The repository being synced.
+            remote (RpmRemote or UlnRemote): The remote being synced from.
+            repomd_checksum (str): The sha256 of the repomd.xml being synced.
+
+        Returns:
+            RpmSyncCheckpoint: The checkpoint to resume from and record the progress in.
+
+        """
+        checkpoint = cls.objects.filter(repository=repository).first()
+        if checkpoint is not None:
+            if (
+                checkpoint.remote_id == remote.pk
+                and checkpoint.repomd_checksum == repomd_checksum
+                and checkpoint.download_policy == remote.policy
+            ):
+                return checkpoint
+            checkpoint.delete()
+        return cls.objects.create(
+            repository=repository,
+            remote=remote,
+            repomd_checksum=repomd_checksum,
+            download_policy=remote.policy,
+        )
+
+    def get_packages(self):
+        """Return the pks of the recorded packages, by pkgId."""
+        return dict(self.packages.values_list("pkgId", "content_id"))
+
+
+class RpmSyncCheckpointPackage(BaseModel):
+    """
+    A package recorded in a sync checkpoint, it was saved with its artifacts.
+
+    Fields:
+        pkgId (Text):
+            Checksum of the package file.
+
+    Relations:
+        checkpoint (ForeignKey):
+            The checkpoint.
+        content (ForeignKey):
+            The saved package.
+    """
+
+    pkgId = models.TextField()
+    checkpoint = models.ForeignKey(
+        RpmSyncCheckpoint, on_delete=models.CASCADE, related_name="packages"
+    )
+    content = models.ForeignKey(Content, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        unique_together = ("checkpoint", "pkgId")
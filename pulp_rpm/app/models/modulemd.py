@@ -65,7 +65,7 @@ class Modulemd(Content):
     packages = models.ManyToManyField(Package)
     profiles = models.JSONField(default=dict)
     description = models.TextField()
-    digest = models.TextField()
+    digest = models.TextField(db_index=True)
 
     snippet = models.TextField()
     repo_key_fields = ("name", "stream", "version", "context", "arch")
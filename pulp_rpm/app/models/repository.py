@@ -1,6 +1,8 @@
+import contextlib
 import os
 import re
 import textwrap
+import zlib
 from gettext import gettext as _
 from logging import getLogger
 
@@ -14,6 +16,7 @@ from pulpcore.plugin.models import (
     Artifact,
     AsciiArmoredDetachedSigningService,
     AutoAddObjPermsMixin,
+    BaseModel,
     Content,
     ContentArtifact,
     Distribution,
@@ -31,6 +34,7 @@ from pulpcore.plugin.repo_version_utils import (
     validate_version_paths,
 )
 
+from pulp_rpm.app.concurrency import AdaptiveConcurrency
 from pulp_rpm.app.constants import (
     CHECKSUM_CHOICES,
     COMPRESSION_CHOICES,
@@ -61,6 +65,15 @@ log = getLogger(__name__)
 class RpmRemote(Remote, AutoAddObjPermsMixin):
     """
     Remote for "rpm" content.
+
+    Fields:
+        sles_auth_token (String): Authentication token for SLES repositories.
+
+    Attributes:
+        download_mirror_urls (list): Base urls of the mirrors the artifact downloads of the
+            running sync are spread across. Only set while syncing from a metalink.
+        adaptive_concurrency (AdaptiveConcurrency): Limits the http(s) downloads in flight from
+            each host, or None if ADAPTIVE_DOWNLOAD_CONCURRENCY is disabled.
     """
 
     TYPE = "rpm"
@@ -69,6 +82,8 @@ class RpmRemote(Remote, AutoAddObjPermsMixin):
     DEFAULT_DOWNLOAD_CONCURRENCY = 7
     DEFAULT_MAX_RETRIES = 4
 
+    download_mirror_urls = None
+
     @property
     def download_factory(self):
         """
@@ -92,6 +107,19 @@ class RpmRemote(Remote, AutoAddObjPermsMixin):
             )
             return self._download_factory
 
+    @property
+    def adaptive_concurrency(self):
+        """
+        Return the AdaptiveConcurrency of the http(s) downloads, or None if it is disabled.
+        """
+        try:
+            return self._adaptive_concurrency
+        except AttributeError:
+            self._adaptive_concurrency = AdaptiveConcurrency.from_settings(
+                self.download_concurrency or self.DEFAULT_DOWNLOAD_CONCURRENCY
+            )
+            return self._adaptive_concurrency
+
     def get_downloader(self, remote_artifact=None, url=None, **kwargs):
         """
         Get a downloader from either a RemoteArtifact or URL that is configured with this Remote.
@@ -114,8 +142,34 @@ class RpmRemote(Remote, AutoAddObjPermsMixin):
         """
         if self.sles_auth_token:
             kwargs["sles_auth_token"] = self.sles_auth_token
+        if self.download_mirror_urls and url:
+            mirror_urls = self._get_mirror_urls(url)
+            if mirror_urls:
+                url, kwargs["fallback_urls"] = mirror_urls[0], mirror_urls[1:]
+        download_url = url or (remote_artifact and remote_artifact.url) or ""
+        if self.adaptive_concurrency and download_url.startswith("http"):
+            kwargs["concurrency"] = self.adaptive_concurrency
+            # the adaptive limits replace the fixed one of the downloader factory
+            kwargs.setdefault("semaphore", contextlib.nullcontext())
         return super().get_downloader(remote_artifact=remote_artifact, url=url, **kwargs)
 
+    def _get_mirror_urls(self, url):
+        """
+        Return the urls of the file on all the download mirrors, in the order to try them.
+
+        The first mirror is picked from a hash of the path, so the downloads are spread evenly
+        across the mirrors and the same file always starts at the same mirror.
+        """
+        for base_url in self.download_mirror_urls:
+            if url.startswith(base_url):
+                relative_path = url[len(base_url) :]
+                break
+        else:
+            return []
+        start = zlib.crc32(relative_path.encode()) % len(self.download_mirror_urls)
+        mirror_urls = self.download_mirror_urls[start:] + self.download_mirror_urls[:start]
+        return [base_url + relative_path for base_url in mirror_urls]
+
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
         permissions = [
@@ -123,6 +177,32 @@ class RpmRemote(Remote, AutoAddObjPermsMixin):
         ]
 
 
+class RpmMirrorlistCache(BaseModel):
+    """
+    The mirrors picked from the mirrorlist of an RpmRemote, reused without probing them again.
+
+    It is kept apart from the remote, which syncs only read.
+
+    Fields:
+        mirrorlist_url (Text): The url of the mirrorlist the mirrors were picked from.
+        mirror_urls (JSON): The picked mirror urls, best first.
+        metalink (Boolean): Whether the mirrorlist is a metalink.
+        expires (DateTime): Until when the mirrors may be reused.
+
+    Relations:
+        remote (OneToOneField): The remote.
+    """
+
+    mirrorlist_url = models.TextField()
+    mirror_urls = models.JSONField(default=list)
+    metalink = models.BooleanField(default=False)
+    expires = models.DateTimeField()
+    remote = models.OneToOneField(RpmRemote, on_delete=models.CASCADE)
+
+    class Meta:
+        default_related_name = "%(app_label)s_%(model_name)s"
+
+
 class UlnRemote(Remote, AutoAddObjPermsMixin):
     """
     Remote for "uln" content.
@@ -1,3 +1,4 @@
+import functools
 import hashlib
 import logging
 import os
@@ -21,6 +22,31 @@ from pulp_rpm.app.schema import MODULEMD_SCHEMA
 
 log = logging.getLogger(__name__)
 
+FLOAT_TAG = "tag:yaml.org,2002:float"
+INT_TAG = "tag:yaml.org,2002:int"
+
+
+def _string_constructor(loader, node):
+    return node.value
+
+
+class ModulemdLoader(getattr(yaml, "CSafeLoader", yaml.SafeLoader)):
+    """
+    A SafeLoader which keeps unquoted numbers as strings, see disable_pyyaml_magic_casting.
+
+    It is backed by libyaml when PyYAML was built with it.
+    """
+
+
+ModulemdLoader.add_constructor(FLOAT_TAG, _string_constructor)
+ModulemdLoader.add_constructor(INT_TAG, _string_constructor)
+
+
+@functools.cache
+def get_modulemd_validator():
+    """Return the validator of modulemd documents, it is only built once per process."""
+    return Draft7Validator(MODULEMD_SCHEMA)
+
 
 def resolve_module_packages(version, previous_version):
     """
@@ -66,21 +92,37 @@ def split_modulemd_file(file: str):
     """
     Helper method to preserve original formatting of modulemd.
 
+    The file is read line by line, documents begin at lines starting with "---", so that only
+    one document at a time is kept in memory.
+
     Args:
         file: Absolute path to file
     """
+
+    def normalize(lines):
+        # strip any spaces or newlines from either side, strip the document end marking,
+        # then strip again so we have only the document text w/o newlines
+        stripped = "".join(lines).strip().rstrip("...").rstrip()
+        if stripped:
+            # add the document begin/end markers backs
+            return "---\n{}\n...".format(stripped)
+
     with tempfile.TemporaryDirectory(dir=".") as tf:
         decompressed_path = os.path.join(tf, "modulemd.yaml")
         cr.decompress_file(file, decompressed_path, cr.AUTO_DETECT_COMPRESSION)
         with open(decompressed_path) as modulemd_file:
-            for doc in modulemd_file.read().split("---"):
-                # strip any spaces or newlines from either side, strip the document end marking,
-                # then strip again so we have only the document text w/o newlines
-                stripped = doc.strip().rstrip("...").rstrip()
-                if stripped:
-                    # add the document begin/end markers backs
-                    normalized = "---\n{}\n...".format(stripped)
-                    yield normalized
+            lines = []
+            for line in modulemd_file:
+                if line.startswith("---"):
+                    document = normalize(lines)
+                    if document:
+                        yield document
+                    lines = [line[3:]]
+                else:
+                    lines.append(line)
+            document = normalize(lines)
+            if document:
+                yield document
 
 
 def check_mandatory_module_fields(module, required_fields):
@@ -191,8 +233,7 @@ def parse_modular(file: str):
     modulemd_obsoletes_all = []
 
     for module in split_modulemd_file(file):
-        with disable_pyyaml_magic_casting():
-            parsed_data = yaml.load(module, Loader=yaml.SafeLoader)
+        parsed_data = yaml.load(module, Loader=ModulemdLoader)
         # here we check the modulemd document as we don't store all info, so serializers
         # are not enough then we only need to take required data from dict which is
         # parsed by pyyaml library
@@ -202,7 +243,7 @@ def parse_modular(file: str):
             # https://bugs.rockylinux.org/view.php?id=2575
             # further discussion on this issue can be found here:
             # https://github.com/pulp/pulp_rpm/issues/2998
-            validator = Draft7Validator(MODULEMD_SCHEMA)
+            validator = get_modulemd_validator()
             err = []
             for error in sorted(validator.iter_errors(parsed_data["data"]), key=str):
                 err.append(error.message)
@@ -230,16 +271,11 @@ def disable_pyyaml_magic_casting():
     # It's implemented in a context manager to avoid surprise side-effects if
     # by any chance the loader is called in other context where the default
     # pyyaml behavior is expected.
-    FLOAT_TAG = "tag:yaml.org,2002:float"
-    INT_TAG = "tag:yaml.org,2002:int"
     float_old_constructor = yaml.SafeLoader.yaml_constructors[FLOAT_TAG]
     int_old_constructor = yaml.SafeLoader.yaml_constructors[INT_TAG]
 
-    def string_constructor(self, node):
-        return node.value
-
-    yaml.SafeLoader.yaml_constructors[FLOAT_TAG] = string_constructor
-    yaml.SafeLoader.yaml_constructors[INT_TAG] = string_constructor
+    yaml.SafeLoader.yaml_constructors[FLOAT_TAG] = _string_constructor
+    yaml.SafeLoader.yaml_constructors[INT_TAG] = _string_constructor
     yield
     yaml.SafeLoader.yaml_constructors[FLOAT_TAG] = float_old_constructor
     yaml.SafeLoader.yaml_constructors[INT_TAG] = int_old_constructor
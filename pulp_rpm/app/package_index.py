@@ -0,0 +1,100 @@
+import heapq
+import sys
+
+# How many values the InternPool of a sync holds at most
+INTERN_POOL_SIZE = 200_000
+
+
+def compact_key(value):
+    """
+    Return a 64-bit integer hash of a string, much smaller in memory than the string itself.
+
+    The keys are only stable within the process (string hashing is randomized per process), they
+    must not be stored.
+    """
+    return hash(value)
+
+
+class RetainedVersions:
+    """
+    Keep track of the newest N versions of each package name and arch.
+
+    Only the N newest versions seen so far are kept (in a min-heap), a version pushed out of them
+    is returned right away to be skipped. Among equal versions the one seen first is retained.
+    """
+
+    def __init__(self, retain_package_versions):
+        """
+        Args:
+            retain_package_versions (int): How many versions of each package to keep.
+        """
+        self.retain_package_versions = retain_package_versions
+        self._heaps = {}
+        self._seen = 0
+
+    def add(self, arch, name, evr, key):
+        """
+        Add a version of a package.
+
+        Args:
+            arch (str): The package arch, packages of different arches are not comparable.
+            name (str): The package name.
+            evr (tuple): The sort key of the package's EVR.
+            key: The key of the package's NEVRA.
+
+        Returns:
+            The key of the package version to skip because it's too old, or None.
+
+        """
+        self._seen += 1
+        heap = self._heaps.setdefault((sys.intern(arch), sys.intern(name)), [])
+        entry = (evr, -self._seen, key)
+        if len(heap) < self.retain_package_versions:
+            heapq.heappush(heap, entry)
+            return None
+        return heapq.heappushpop(heap, entry)[2]
+
+
+class InternPool:
+    """
+    A bounded pool of interned values, shared by all the packages parsed in a sync.
+
+    Equal directories, file names, file entries and dependencies found in different packages are
+    replaced by a single shared object. The pool approximates LRU eviction with two generations:
+    values are added to the recent generation, which becomes the older one once it holds half of
+    `max_size` values, dropping the previous older generation. A value found in the older
+    generation is moved back to the recent one, so only values unused for a while are evicted.
+    """
+
+    def __init__(self, max_size=INTERN_POOL_SIZE):
+        """
+        Args:
+            max_size (int): How many values the pool holds at most.
+        """
+        self.max_size = max_size
+        self._recent = {}
+        self._older = {}
+
+    def __len__(self):
+        return len(self._recent) + len(self._older)
+
+    def intern(self, value):
+        """Return the pooled object equal to the value, adding the value if there is none."""
+        pooled = self._recent.get(value)
+        if pooled is None:
+            pooled = self._older.get(value, value)
+            self._recent[value] = pooled
+            if len(self._recent) >= self.max_size // 2:
+                self._older = self._recent
+                self._recent = {}
+        return pooled
+
+    def intern_files(self, files):
+        """Intern the (type, parent directory, name) file entries of a package."""
+        intern = self.intern
+        return [intern((typ, intern(parent_dir), intern(name))) for typ, parent_dir, name in files]
+
+    def intern_dependencies(self, dependencies):
+        """Intern the (name, flags, epoch, version, release, pre) dependencies of a package."""
+        intern = self.intern
+        return [intern((intern(name), *rest)) for name, *rest in dependencies]
@@ -20,4 +20,14 @@ PRUNE_WORKERS_MAX = 5
 # workaround for: https://github.com/pulp/pulp_rpm/issues/4125
 SPECTACULAR_SETTINGS__OAS_VERSION = "3.0.1"
 MAX_PACKAGE_SIGNING_WORKERS = 5
+MAX_SUBREPO_SYNC_WORKERS = 1
+MIRRORLIST_PROBE_TIMEOUT = 10
+MIRRORLIST_CACHE_TTL = 3600
+METALINK_DOWNLOAD_MIRRORS = 3
+METADATA_CACHE_DIR = None
+METADATA_CACHE_MAX_SIZE = 0
+FILE_REMOTE_LINK_MODE = "copy"
+ADAPTIVE_DOWNLOAD_CONCURRENCY = False
+ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN = 2
+ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX = 32
 RPM_SIGNING_COPY_LABELS = True
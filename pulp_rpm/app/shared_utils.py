@@ -1,3 +1,4 @@
+import os
 import shutil
 import tempfile
 from hashlib import sha256
@@ -128,6 +129,17 @@ def urlpath_sanitize(*args):
     return "/".join(segments)
 
 
+def acs_path_url(remote_url, path):
+    """
+    Return the url of a path of an Alternate Content Source.
+
+    Args:
+        remote_url (str): The url of the remote of the ACS.
+        path (str): The path, relative to the remote url, or an empty string.
+    """
+    return os.path.join(remote_url, path) if path else remote_url
+
+
 def get_sha256(file_path):
     """
     Get sha256 of file.
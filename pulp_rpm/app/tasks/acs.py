@@ -0,0 +1,122 @@
+import tempfile
+from logging import getLogger
+
+from django.db import transaction
+
+from pulpcore.plugin.models import AlternateContentSourcePath, ProgressReport
+
+from pulp_rpm.app.constants import SYNC_POLICIES
+from pulp_rpm.app.models import Package, RpmAlternateContentSourcePackage, RpmRepository
+from pulp_rpm.app.shared_utils import acs_path_url, get_sha256, urlpath_sanitize
+from pulp_rpm.app.tasks.synchronizing import get_repomd_file, synchronize
+
+log = getLogger(__name__)
+
+INDEX_BATCH_SIZE = 2000
+
+
+def index_acs_path(acs_path):
+    """
+    Bring the package index of an ACS path up to date with the packages synced from it.
+
+    The packages are found through the remote artifacts of the ACS remote below the url of the
+    path, which covers the sub-repositories of distribution trees as well.
+
+    Args:
+        acs_path (AlternateContentSourcePath): The refreshed path.
+
+    """
+    remote = acs_path.alternate_content_source.remote
+    prefix = urlpath_sanitize(acs_path_url(remote.url, acs_path.path)) + "/"
+    location_hrefs = {
+        pkgid: url[len(prefix) :]
+        for pkgid, url in Package.objects.filter(
+            contentartifact__remoteartifact__remote=remote,
+            contentartifact__remoteartifact__url__startswith=prefix,
+        )
+        .values_list("pkgId", "contentartifact__remoteartifact__url")
+        .iterator(chunk_size=INDEX_BATCH_SIZE)
+    }
+
+    indexed = RpmAlternateContentSourcePackage.objects.filter(acs_path=acs_path)
+    stale = []
+    moved = []
+    for entry in indexed.only("pk", "pkgId", "location_href").iterator(chunk_size=INDEX_BATCH_SIZE):
+        location_href = location_hrefs.pop(entry.pkgId, None)
+        if location_href is None:
+            stale.append(entry.pk)
+        elif location_href != entry.location_href:
+            entry.location_href = location_href
+            moved.append(entry)
+
+    with transaction.atomic():
+        for i in range(0, len(stale), INDEX_BATCH_SIZE):
+            indexed.filter(pk__in=stale[i : i + INDEX_BATCH_SIZE]).delete()
+        RpmAlternateContentSourcePackage.objects.bulk_update(
+            moved, fields=["location_href"], batch_size=INDEX_BATCH_SIZE
+        )
+        RpmAlternateContentSourcePackage.objects.bulk_create(
+            [
+                RpmAlternateContentSourcePackage(
+                    acs_path=acs_path, pkgId=pkgid, location_href=location_href
+                )
+                for pkgid, location_href in location_hrefs.items()
+            ],
+            batch_size=INDEX_BATCH_SIZE,
+        )
+    log.info(
+        "ACS path index: {} added, {} moved, {} removed".format(
+            len(location_hrefs), len(moved), len(stale)
+        )
+    )
+
+
+def refresh_acs_path(acs_path_pk, remote_pk, repository_pk, skip_types, optimize, url):
+    """
+    Refresh a path of an RPM Alternate Content Source.
+
+    The path is synced into its hidden repository, then its package index is updated. A path
+    whose repomd.xml has not changed since it was last indexed is skipped altogether.
+
+    Args:
+        acs_path_pk (str): The AlternateContentSourcePath PK.
+        remote_pk (str): The PK of the remote of the ACS.
+        repository_pk (str): The PK of the hidden repository of the path.
+        skip_types (list): List of content to skip.
+        optimize (bool): Optimize mode.
+        url (str): The url of the path.
+
+    """
+    acs_path = AlternateContentSourcePath.objects.select_related(
+        "alternate_content_source__remote"
+    ).get(pk=acs_path_pk)
+    repository = RpmRepository.objects.get(pk=repository_pk)
+
+    last_sync_details = repository.last_sync_details
+    indexed_version = last_sync_details.get("acs_indexed_version")
+    if optimize and indexed_version == repository.latest_version().number:
+        remote = acs_path.alternate_content_source.remote.cast()
+        with tempfile.TemporaryDirectory(dir="."):
+            repomd_checksum = get_sha256(get_repomd_file(remote, url).path)
+        if repomd_checksum == last_sync_details.get("repomd_checksum"):
+            with ProgressReport(
+                message="Skipping ACS Path Refresh (no change from previous refresh)",
+                code="acs.refresh.was_skipped",
+            ) as pb:
+                pb.done = 1
+                pb.total = 1
+            return
+
+    synchronize(
+        remote_pk,
+        repository_pk,
+        SYNC_POLICIES.MIRROR_CONTENT_ONLY,
+        skip_types,
+        optimize,
+        url=url,
+    )
+    index_acs_path(acs_path)
+
+    repository.refresh_from_db()
+    repository.last_sync_details["acs_indexed_version"] = repository.latest_version().number
+    repository.save()
@@ -62,6 +62,9 @@ REPODATA_PATH = "repodata"
 ALLOWED_CONTENT_CHECKSUMS = settings.ALLOWED_CONTENT_CHECKSUMS
 RPM_METADATA_USE_REPO_PACKAGE_TIME = settings.RPM_METADATA_USE_REPO_PACKAGE_TIME
 
+# How many PublishedArtifacts are kept in memory before they are saved
+PUBLISHED_ARTIFACT_BATCH_SIZE = 2000
+
 
 class PackageInfo(NamedTuple):
     """
@@ -160,6 +163,82 @@ class _CollisionManager:
         return [pkg.cid for pkg in self._nevra_to_pkg.values() if pkg.cid not in self._banned_cids]
 
 
+class PublishedArtifactWriter:
+    """
+    Save the PublishedArtifacts of a publication in fixed-size batches.
+
+    Use it as a context manager, the PublishedArtifacts left in the buffer are saved on exit.
+    """
+
+    def __init__(self, publication, batch_size=PUBLISHED_ARTIFACT_BATCH_SIZE):
+        """
+        Args:
+            publication (pulpcore.plugin.models.Publication): The publication being created.
+            batch_size (int): How many PublishedArtifacts are buffered before they are saved.
+        """
+        self.publication = publication
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, content_artifact_id, relative_path):
+        """Publish a ContentArtifact at a relative path."""
+        self.buffer.append(
+            PublishedArtifact(
+                relative_path=relative_path,
+                publication=self.publication,
+                content_artifact_id=content_artifact_id,
+            )
+        )
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Save the buffered PublishedArtifacts."""
+        if self.buffer:
+            PublishedArtifact.objects.bulk_create(self.buffer)
+            self.buffer = []
+
+
+def publish_non_package_artifacts(writer, content):
+    """
+    Publish the artifacts of content other than packages, at their own relative paths.
+
+    Metadata (which is generated, or mirrored from the remote) and treeinfo files are skipped.
+
+    Args:
+        writer (PublishedArtifactWriter): Saves the PublishedArtifacts.
+        content (pulpcore.plugin.models.Content): content set.
+    """
+    is_treeinfo = Q(relative_path__in=["treeinfo", ".treeinfo"])
+    unpublishable_types = Q(
+        content__pulp_type__in=[
+            RepoMetadataFile.get_pulp_type(),
+            Modulemd.get_pulp_type(),
+            ModulemdDefaults.get_pulp_type(),
+            # dealt with separately
+            Package.get_pulp_type(),
+        ]
+    )
+
+    contentartifact_qs = (
+        ContentArtifact.objects.filter(content__in=content)
+        .exclude(unpublishable_types)
+        .exclude(is_treeinfo)
+    )
+
+    for pk, relative_path in contentartifact_qs.values_list("pk", "relative_path").iterator(
+        chunk_size=writer.batch_size
+    ):
+        writer.add(pk, relative_path)
+
+
 class PublicationData:
     """
     Encapsulates data relative to publication.
@@ -304,7 +383,6 @@ class PublicationData:
             """Returns the path to use for flat layout. Define to keep it close to the others."""
             return os.path.join(PACKAGES_DIRECTORY, pkg_filename)
 
-        published_artifacts = []
         requested_checksum_type = get_checksum_type(self.checksum_types)
         layout = self.publication.layout
         collision_manager = _CollisionManager()
@@ -333,7 +411,9 @@ class PublicationData:
             artifact_checksum = f"artifact__{requested_checksum_type}"
             fields.append(artifact_checksum)
 
-        for row in contentartifact_qs.values(*fields).iterator():
+        for row in contentartifact_qs.values(*fields).iterator(
+            chunk_size=PUBLISHED_ARTIFACT_BATCH_SIZE
+        ):
             # content_id is the same as the Package PK, which is used later when generating repo
             # metadata. The contentartifact PK is different, and is used here for PublishedArtifact.
             # There is no such thing as a multi-Artifact RPM Package, so in practice these are 1:1,
@@ -395,44 +475,13 @@ class PublicationData:
         retained_cids = collision_manager.retained_cids()
         cid_to_pkginfo = {k: cid_to_pkginfo[k] for k in retained_cids}
 
-        # Finally create the PublishedArtifacts for the remaining packages
-        for cid, pkg_info in cid_to_pkginfo.items():
-            published_artifacts.append(
-                PublishedArtifact(
-                    relative_path=os.path.join(prefix, pkg_info.path),
-                    publication=self.publication,
-                    content_artifact_id=pkg_info.caid,
-                )
-            )
-
-        # Handle the non-packages
-        is_treeinfo = Q(relative_path__in=["treeinfo", ".treeinfo"])
-        unpublishable_types = Q(
-            content__pulp_type__in=[
-                RepoMetadataFile.get_pulp_type(),
-                Modulemd.get_pulp_type(),
-                ModulemdDefaults.get_pulp_type(),
-                # already dealt with
-                Package.get_pulp_type(),
-            ]
-        )
+        # Finally create the PublishedArtifacts for the remaining packages, and the non-packages
+        with PublishedArtifactWriter(self.publication) as writer:
+            for pkg_info in cid_to_pkginfo.values():
+                writer.add(pkg_info.caid, os.path.join(prefix, pkg_info.path))
 
-        contentartifact_qs = (
-            ContentArtifact.objects.filter(content__in=content)
-            .exclude(unpublishable_types)
-            .exclude(is_treeinfo)
-        )
-
-        for content_artifact in contentartifact_qs.values("pk", "relative_path").iterator():
-            published_artifacts.append(
-                PublishedArtifact(
-                    relative_path=content_artifact["relative_path"],
-                    publication=self.publication,
-                    content_artifact_id=content_artifact["pk"],
-                )
-            )
+            publish_non_package_artifacts(writer, content)
 
-        PublishedArtifact.objects.bulk_create(published_artifacts, batch_size=2000)
         return cid_to_pkginfo
 
     def handle_sub_repos(self, distribution_tree):
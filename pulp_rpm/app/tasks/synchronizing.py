@@ -1,13 +1,21 @@
 import asyncio
 import collections
+import contextlib
+import contextvars
 import functools
 import json
 import logging
 import os
+import pickle
 import re
+import sqlite3
 import tempfile
+import threading
+import time
 import uuid
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 from gettext import gettext as _  # noqa:F401
 
 import createrepo_c as cr
@@ -17,21 +25,22 @@ from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.files import File
-from django.db import transaction
+from django.db import connection, transaction
 from django.db.models import Q
+from django.utils import timezone
 from rpm_rs import Evr
 
+from pulpcore.plugin.download import DownloadResult
 from pulpcore.plugin.exceptions import SyncError
 from pulpcore.plugin.models import (
     Artifact,
     ContentArtifact,
     ProgressReport,
-    PublishedArtifact,
     PublishedMetadata,
     Remote,
+    RemoteArtifact,
 )
 from pulpcore.plugin.stages import (
-    ACSArtifactHandler,
     ArtifactDownloader,
     ArtifactResourceBudget,
     ArtifactSaver,
@@ -56,9 +65,12 @@ from pulp_rpm.app.constants import (
     PACKAGE_DB_REPODATA,
     PACKAGE_REPODATA,
     PULP_MODULE_ATTR,
+    PULP_MODULEDEFAULTS_ATTR,
+    PULP_PACKAGE_ATTRS,
     SYNC_POLICIES,
     UPDATE_REPODATA,
 )
+from pulp_rpm.app.downloaders import NotModified
 from pulp_rpm.app.exceptions import (
     MirrorIncompatibleRepositoryError,
     MissingPrimaryMetadataError,
@@ -66,6 +78,8 @@ from pulp_rpm.app.exceptions import (
     UnsupportedModularCompressionError,
 )
 from pulp_rpm.app.kickstart.treeinfo import PulpTreeInfo, TreeinfoData
+from pulp_rpm.app.metadata_cache import MetadataCache
+from pulp_rpm.app.metalink import is_metalink, parse_metalink, verify_repomd
 from pulp_rpm.app.models import (
     Addon,
     Checksum,
@@ -80,9 +94,14 @@ from pulp_rpm.app.models import (
     PackageGroup,
     PackageLangpacks,
     RepoMetadataFile,
+    RpmAlternateContentSource,
+    RpmAlternateContentSourcePackage,
+    RpmMirrorlistCache,
     RpmPublication,
     RpmRemote,
     RpmRepository,
+    RpmSyncCheckpoint,
+    RpmSyncCheckpointPackage,
     UlnRemote,
     UpdateCollection,
     UpdateCollectionPackage,
@@ -91,23 +110,26 @@ from pulp_rpm.app.models import (
     Variant,
 )
 from pulp_rpm.app.modulemd import parse_modular
+from pulp_rpm.app.package_index import InternPool, RetainedVersions, compact_key
 from pulp_rpm.app.shared_utils import (
+    acs_path_url,
     get_sha256,
     is_previous_version,
     urlpath_sanitize,
 )
+from pulp_rpm.app.tasks.publishing import PublishedArtifactWriter, publish_non_package_artifacts
+from pulp_rpm.app.zchunk import decompress as decompress_zchunk
+from pulp_rpm.app.zchunk import download_zchunk, zchunk_supported
 
 log = logging.getLogger(__name__)
 
 
-# TODO: https://pulp.plan.io/issues/8687
-# A global dictionary for storing data about the remote's metadata files, used for mirroring
-# Indexed by repository.pk due to sub-repos.
-metadata_files_for_mirroring = collections.defaultdict(dict)
-# A global dictionary for storing data mapping pkgid to location_href for all packages, used
-# for mirroring. Indexed by repository.pk due to sub-repos.
-pkgid_to_location_href = collections.defaultdict(functools.partial(collections.defaultdict, set))
+# The MirroringStore of the running sync task, if it mirrors the metadata. It is a context variable
+# so that it follows the sync into the threads syncing sub-repos and into the pipeline.
+mirroring_store = contextvars.ContextVar("mirroring_store", default=None)
 
+# How many rows of existing content are fetched from (or looked up in) the database at a time.
+EXISTING_CONTENT_BATCH_SIZE = 5000
 
 MIRROR_INCOMPATIBLE_REPO_ERR_MSG = (
     "This repository uses features which are incompatible with 'mirror' sync. "
@@ -127,38 +149,202 @@ ALLOWED_CONTENT_CHECKSUMS = settings.ALLOWED_CONTENT_CHECKSUMS
 # sentinel
 ALREADY_SEEN = object()
 
+# The dependency lists of a package, interned with the sync's InternPool
+DEPENDENCY_ATTRS = (
+    PULP_PACKAGE_ATTRS.CONFLICTS,
+    PULP_PACKAGE_ATTRS.ENHANCES,
+    PULP_PACKAGE_ATTRS.OBSOLETES,
+    PULP_PACKAGE_ATTRS.PROVIDES,
+    PULP_PACKAGE_ATTRS.RECOMMENDS,
+    PULP_PACKAGE_ATTRS.REQUIRES,
+    PULP_PACKAGE_ATTRS.SUGGESTS,
+    PULP_PACKAGE_ATTRS.SUPPLEMENTS,
+)
+
+
+class MirroringStore:
+    """
+    Data about the remote's metadata files and packages, used for mirroring.
+
+    It is kept in an sqlite database in the task's working directory, so that it is discarded
+    with the task and memory use does not grow with the size of the synced repositories.
+    Indexed by repository.pk due to sub-repos.
+    """
+
+    # Stay below the limit on the number of parameters of an sqlite query
+    QUERY_BATCH_SIZE = 500
+
+    def __init__(self, path=None):
+        """
+        Create the database.
+
+        Args:
+            path (str): Path of the database, a new file in the current directory by default.
+        """
+        if path is None:
+            fd, path = tempfile.mkstemp(dir=".", suffix=".sqlite3")
+            os.close(fd)
+        self.path = path
+        # The sub-repos are synced in threads, they share the connection
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # It's scratch data, don't spend time on making it durable
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS metadata_files ("
+            "repo TEXT, relative_path TEXT, path TEXT, PRIMARY KEY (repo, relative_path)"
+            ") WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS package_locations ("
+            "repo TEXT, pkgid TEXT, location_href TEXT, PRIMARY KEY (repo, pkgid, location_href)"
+            ") WITHOUT ROWID"
+        )
+
+    def add_metadata_file(self, repo_pk, relative_path, path):
+        """Store the path of a downloaded metadata file, replacing the one stored before."""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO metadata_files VALUES (?, ?, ?)",
+                (str(repo_pk), relative_path, path),
+            )
+
+    def get_metadata_files(self, repo_pk):
+        """Return a list of (relative path, path) of the metadata files of a repository."""
+        with self.lock:
+            return self.connection.execute(
+                "SELECT relative_path, path FROM metadata_files WHERE repo = ?", (str(repo_pk),)
+            ).fetchall()
+
+    def has_metadata_file(self, repo_pk, relative_path):
+        """Whether a metadata file has been stored at this relative path for a repository."""
+        with self.lock:
+            return (
+                self.connection.execute(
+                    "SELECT 1 FROM metadata_files WHERE repo = ? AND relative_path = ?",
+                    (str(repo_pk), relative_path),
+                ).fetchone()
+                is not None
+            )
+
+    def add_package_location(self, repo_pk, pkgid, location_href):
+        """Store a location of a package within a repository."""
+        with self.lock:
+            self.connection.execute(
+                "INSERT OR IGNORE INTO package_locations VALUES (?, ?, ?)",
+                (str(repo_pk), pkgid, location_href),
+            )
+
+    def get_package_locations(self, repo_pk, pkgids):
+        """
+        Look up the locations of packages within a repository.
+
+        Args:
+            repo_pk: The repository the packages were synced into.
+            pkgids (iterable): The checksums of the packages.
+
+        Returns:
+            dict: {pkgid: [location_href, ...]} of the packages with a location stored.
+
+        """
+        pkgids = list(pkgids)
+        locations = collections.defaultdict(list)
+        with self.lock:
+            for i in range(0, len(pkgids), self.QUERY_BATCH_SIZE):
+                batch = pkgids[i : i + self.QUERY_BATCH_SIZE]
+                rows = self.connection.execute(
+                    "SELECT pkgid, location_href FROM package_locations "
+                    "WHERE repo = ? AND pkgid IN ({})".format(", ".join("?" * len(batch))),
+                    [str(repo_pk), *batch],
+                )
+                for pkgid, location_href in rows:
+                    locations[pkgid].append(location_href)
+        return locations
+
+    def close(self):
+        """Close the database and remove it."""
+        self.connection.close()
+        os.remove(self.path)
+
 
 def store_metadata_for_mirroring(repo, md_path, relative_path):
     """Used to store data about the downloaded metadata for mirror-publishing after the sync.
 
+    Nothing is stored unless the running sync mirrors the metadata.
+
     Args:
         repo: Which repository the metadata is associated with
         md_path: The path to the metadata file
         relative_path: The relative path to the metadata file within the repository
     """
-    global metadata_files_for_mirroring
-    metadata_files_for_mirroring[str(repo.pk)][relative_path] = md_path
+    store = mirroring_store.get()
+    if store is not None:
+        store.add_metadata_file(repo.pk, relative_path, md_path)
+
+
+def get_existing_content_by_digest(model, digests):
+    """
+    Look up which of the digests already exist as content of the model in the current domain.
+
+    The digest is a hash of the whole content, so content sharing a digest is assumed to be the
+    same, and any one of them is returned. It is only unique per domain for some models; for
+    Modulemd it is part of a wider unique_together.
+
+    Args:
+        model: A content model with an indexed `digest` field.
+        digests (iterable): The digests to look up.
+
+    Returns:
+        dict: {digest: pk} of the existing content.
+
+    """
+    digests = list(digests)
+    existing = {}
+    for i in range(0, len(digests), EXISTING_CONTENT_BATCH_SIZE):
+        existing.update(
+            model.objects.filter(
+                _pulp_domain=get_domain(), digest__in=digests[i : i + EXISTING_CONTENT_BATCH_SIZE]
+            ).values_list("digest", "pk")
+        )
+    return existing
+
+
+def saved_content(model, pk, **fields):
+    """
+    Create an instance of content which exists in the database already, without fetching it.
+
+    Such instances are skipped by QueryExistingContents and ContentSaver, only the pk is used to
+    add them to the new repository version.
+    """
+    content = model(pk=pk, **fields)
+    content._state.adding = False
+    return content
 
 
 def store_package_for_mirroring(repo, pkgid, location_href):
     """Used to store data about the packages for mirror-publishing after the sync.
 
+    Nothing is stored unless the running sync mirrors the metadata.
+
     Args:
         repo: Which repository the metadata is associated with
         pkgid: The checksum of the package
         location_href: The relative path to the package within the repository
     """
-    global pkgid_to_location_href
+    store = mirroring_store.get()
+    if store is None:
+        return
     # this shouldn't really add the location_href to a list, really it ought to set the value
     # but unfortunately some repositories have the same packages present in multiple places
     # same pkgid, >1 different location_hrefs
-    pkgid_to_location_href[str(repo.pk)][pkgid].add(location_href)
+    store.add_package_location(repo.pk, pkgid, location_href)
 
 
 def add_metadata_to_publication(publication, version, prefix=""):
     """Create a mirrored publication for the given repository version.
 
-    Uses the `metadata_files` global data.
+    Uses the data in the `MirroringStore` of the running sync.
 
     Args:
         publication: The publication to add downloaded repo metadata to
@@ -166,9 +352,10 @@ def add_metadata_to_publication(publication, version, prefix=""):
     Kwargs:
         prefix: Subdirectory underneath the root repository (if a sub-repo)
     """
-    repo_metadata_files = metadata_files_for_mirroring[str(version.repository.pk)]
+    store = mirroring_store.get()
+    repo_pk = version.repository.pk
 
-    for relative_path, metadata_file_path in repo_metadata_files.items():
+    for relative_path, metadata_file_path in store.get_metadata_files(repo_pk):
         with open(metadata_file_path, "rb") as metadata_fd:
             PublishedMetadata.create_from_file(
                 file=File(metadata_fd),
@@ -176,109 +363,432 @@ def add_metadata_to_publication(publication, version, prefix=""):
                 publication=publication,
             )
 
-    published_artifacts = []
-
-    # Handle packages
-    pkg_data = ContentArtifact.objects.filter(
-        content__in=version.content, content__pulp_type=Package.get_pulp_type()
-    ).values("pk", "content__rpm_package__pkgId")
-    for ca in pkg_data.iterator():
-        for relative_path in pkgid_to_location_href[str(version.repository.pk)][
-            ca["content__rpm_package__pkgId"]
-        ]:
-            pa = PublishedArtifact(
-                content_artifact_id=ca["pk"],
-                relative_path=os.path.join(prefix, relative_path),
-                publication=publication,
-            )
-            published_artifacts.append(pa)
-
-    # Handle everything else
-    # TODO: this code is copied directly from publication, we should deduplicate it later
-    # (if possible)
-    is_treeinfo = Q(relative_path__in=["treeinfo", ".treeinfo"])
-    unpublishable_types = Q(
-        content__pulp_type__in=[
-            RepoMetadataFile.get_pulp_type(),
-            Modulemd.get_pulp_type(),
-            ModulemdDefaults.get_pulp_type(),
-            # already dealt with
-            Package.get_pulp_type(),
-        ]
-    )
+    def add_package_batch(writer, package_batch):
+        locations = store.get_package_locations(repo_pk, {pkgid for pkgid, _ in package_batch})
+        for pkgid, ca_pk in package_batch:
+            for relative_path in locations.get(pkgid, ()):
+                writer.add(ca_pk, os.path.join(prefix, relative_path))
+
+    with PublishedArtifactWriter(publication) as writer:
+        # Handle packages, looking up their locations a batch at a time
+        pkg_data = ContentArtifact.objects.filter(
+            content__in=version.content, content__pulp_type=Package.get_pulp_type()
+        ).values_list("content__rpm_package__pkgId", "pk")
+        package_batch = []
+        for pkgid, ca_pk in pkg_data.iterator(chunk_size=writer.batch_size):
+            package_batch.append((pkgid, ca_pk))
+            if len(package_batch) >= writer.batch_size:
+                add_package_batch(writer, package_batch)
+                package_batch = []
+        add_package_batch(writer, package_batch)
+
+        # Handle everything else
+        publish_non_package_artifacts(writer, version.content)
+
+
+class SyncTimings:
+    """
+    Wall time, items, queue wait time and peak batch size of the stages and phases of a sync.
 
-    contentartifact_qs = (
-        ContentArtifact.objects.filter(content__in=version.content)
-        .exclude(unpublishable_types)
-        .exclude(is_treeinfo)
-    )
+    Stages are instrumented with `instrument`, which wraps their `run`, `batches` and `put`.
+    The phases of the first stage are timed with `phase`.
+    """
 
-    for content_artifact in contentartifact_qs.values("pk", "relative_path").iterator():
-        published_artifacts.append(
-            PublishedArtifact(
-                relative_path=content_artifact["relative_path"],
-                publication=publication,
-                content_artifact_id=content_artifact["pk"],
-            )
+    def __init__(self):
+        """Start with no data."""
+        self.stats = {}
+
+    def _get_stats(self, name):
+        return self.stats.setdefault(
+            name,
+            {
+                "wall_time": 0.0,
+                "items": 0,
+                "input_wait": 0.0,
+                "output_wait": 0.0,
+                "peak_batch_size": 0,
+            },
         )
 
-    PublishedArtifact.objects.bulk_create(published_artifacts, batch_size=2000)
+    @contextlib.contextmanager
+    def phase(self, name, counter=None):
+        """
+        Time a phase of a stage.
+
+        Args:
+            name (str): Name of the phase.
+            counter (callable): Returns a running count of items, the items processed in the phase
+                are the difference between its value at the start and at the end. The caller
+                can add to "items" of the yielded stats as well.
+        """
+        stats = self._get_stats(name)
+        started = time.monotonic()
+        count = counter() if counter else 0
+        try:
+            yield stats
+        finally:
+            stats["wall_time"] += time.monotonic() - started
+            if counter:
+                stats["items"] += counter() - count
+
+    def instrument(self, stage):
+        """Record the timings of a pipeline stage while it runs."""
+        stats = self._get_stats(type(stage).__name__)
+        run, items, batches, put = stage.run, stage.items, stage.batches, stage.put
+
+        async def timed_input(iterator, batched):
+            iterator = aiter(iterator)
+            while True:
+                started = time.monotonic()
+                try:
+                    received = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+                finally:
+                    stats["input_wait"] += time.monotonic() - started
+                batch_size = len(received) if batched else 1
+                stats["peak_batch_size"] = max(stats["peak_batch_size"], batch_size)
+                yield received
+
+        async def timed_run():
+            started = time.monotonic()
+            try:
+                await run()
+            finally:
+                stats["wall_time"] += time.monotonic() - started
+
+        def timed_items():
+            return timed_input(items(), batched=False)
+
+        def timed_batches(*args, **kwargs):
+            return timed_input(batches(*args, **kwargs), batched=True)
+
+        async def timed_put(item):
+            started = time.monotonic()
+            await put(item)
+            stats["output_wait"] += time.monotonic() - started
+            stats["items"] += 1
+
+        stage.run, stage.items, stage.batches = timed_run, timed_items, timed_batches
+        stage.put = timed_put
+        return stage
 
+    def summary(self):
+        """
+        Return the timings, rounded and with the throughput, as a JSON serializable dict.
+        """
+        summary = {}
+        for name, stats in self.stats.items():
+            wall_time = stats["wall_time"]
+            summary[name] = {
+                "wall_time": round(wall_time, 3),
+                "items": stats["items"],
+                "items_per_second": round(stats["items"] / wall_time, 1) if wall_time else 0,
+                "input_wait": round(stats["input_wait"], 3),
+                "output_wait": round(stats["output_wait"], 3),
+                "peak_batch_size": stats["peak_batch_size"],
+            }
+        return summary
+
+    def report(self):
+        """Add a progress report with the timings of each stage and phase to the task."""
+        for name, stats in self.summary().items():
+            message = (
+                "Timing {}: {}s, {} items ({}/s), waited {}s for input and {}s for output, "
+                "peak batch size {}"
+            ).format(
+                name,
+                stats["wall_time"],
+                stats["items"],
+                stats["items_per_second"],
+                stats["input_wait"],
+                stats["output_wait"],
+                stats["peak_batch_size"],
+            )
+            with ProgressReport(message=message, code="sync.timing") as pb:
+                pb.total = stats["items"]
+                pb.done = stats["items"]
+
+
+class MetadataFetchCache:
+    """
+    A per-sync cache of downloaded repomd.xml files and parsed treeinfo data, keyed by url.
 
-def get_repomd_file(remote, url):
+    One sync looks at the same repomd.xml and treeinfo several times: to resolve the url of the
+    remote, to decide whether the sync can be skipped and finally to sync. With this cache they
+    are downloaded only once. It is a plain memo: a file which changes upstream during the sync
+    is not noticed.
+    """
+
+    def __init__(self):
+        self._results = {}
+        self._treeinfo = {}
+        # {url: validators} of the files the sync depends on, see is_unmodified_since_last_sync
+        self.http_validators = {}
+
+    def get_result(self, url):
+        """Return the cached download result for the url, or None."""
+        return self._results.get(url)
+
+    def add_result(self, url, result):
+        """Cache the download result for the url."""
+        self._results[url] = result
+        return result
+
+    def get_treeinfo(self, url):
+        """Return the cached treeinfo data for the repository url, or None."""
+        return self._treeinfo.get(url)
+
+    def add_treeinfo(self, url, treeinfo_data):
+        """Cache the treeinfo data for the repository url."""
+        self._treeinfo[url] = treeinfo_data
+        return treeinfo_data
+
+    def add_http_validators(self, url, result):
+        """
+        Remember the ETag and Last-Modified of a file the sync depends on.
+
+        Args:
+            url (str): The url of the file.
+            result (DownloadResult): Its download, or None if the file was not found.
+        """
+        if result is None:
+            self.http_validators[url] = {"missing": True}
+            return
+        headers = result.headers or {}
+        self.http_validators[url] = {
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+        }
+
+
+def get_repomd_url(url):
+    """Return the url of the repomd.xml of the repository at url."""
+    # URLs, esp mirrorlist URLs, can come into this method with parameters attached.
+    # This causes the urlpath_sanitize() below to return something like
+    # "http://path?param&param/repodata/repomd.xml", which is **not** an expected/useful response.
+    # Make sure we're only looking for the repomd.xml file, no matter what weirdness comes
+    # in. See https://pulp.plan.io/issues/8981 for more details.
+    return urlpath_sanitize(url.split("?")[0], "repodata/repomd.xml")
+
+
+def get_repomd_file(remote, url, fetch_cache=None):
     """
     Check if repodata exists.
 
     Args:
         remote (RpmRemote or UlnRemote): An RpmRemote or UlnRemote to download with.
         url (str): A remote repository URL
+        fetch_cache (MetadataFetchCache): A cache to re-use an already downloaded repomd.xml from
 
     Returns:
         pulpcore.plugin.download.DownloadResult: downloaded repomd.xml
 
     """
-    # URLs, esp mirrorlist URLs, can come into this method with parameters attached.
-    # This causes the urlpath_sanitize() below to return something like
-    # "http://path?param&param/repodata/repomd.xml", which is **not** an expected/useful response.
-    # Make sure we're only looking for the repomd.xml file, no matter what weirdness comes
-    # in. See https://pulp.plan.io/issues/8981 for more details.
-    url = url.split("?")[0]
-    downloader = remote.get_downloader(url=urlpath_sanitize(url, "repodata/repomd.xml"))
-    return downloader.fetch()
+    url = get_repomd_url(url)
+    if fetch_cache is not None:
+        result = fetch_cache.get_result(url)
+        if result is not None:
+            return result
+    downloader = remote.get_downloader(url=url)
+    result = downloader.fetch()
+    if fetch_cache is not None:
+        fetch_cache.add_result(url, result)
+    return result
 
 
-def fetch_mirror(remote):
-    """Fetch the first valid mirror from a list of all available mirrors from a mirror list feed.
+MIRRORLIST_URL_PATTERN = re.compile(r"(^|^[\w\s=]+\s)((http(s)?)://.*)")
+
+
+def rank_mirrors(probes):
+    """
+    Order the mirrors which answered, the freshest and fastest first.
+
+    Mirrors serving a newer repomd.xml revision are always preferred, because a lagging mirror
+    would sync outdated content. Among mirrors with the same revision, the lowest latency wins.
+    Revisions which are not numeric (timestamps) cannot be compared and only the latency counts.
+
+    Args:
+        probes (list): (mirror_url, latency, revision) tuples of the mirrors which answered.
+
+    Returns:
+        list: The mirror urls, best first.
+
+    """
+
+    def sort_key(probe):
+        _, latency, revision = probe
+        freshness = -int(revision) if revision and revision.isdigit() else 0
+        return freshness, latency
+
+    return [mirror_url for mirror_url, _, _ in sorted(probes, key=sort_key)]
+
+
+def get_cached_mirror(remote):
+    """
+    Return the mirrors previously picked from the remote's mirrorlist, if still valid.
+
+    Returns:
+        tuple: The mirror urls (best first, empty if there are none) and whether they were
+            picked from a metalink.
+
+    """
+    if not isinstance(remote, RpmRemote):
+        return [], False
+    cached = RpmMirrorlistCache.objects.filter(
+        remote_id=remote.pk, mirrorlist_url=remote.url, expires__gt=timezone.now()
+    ).first()
+    if cached is None:
+        return [], False
+    return cached.mirror_urls, cached.metalink
+
+
+def cache_mirror(remote, mirror_urls, metalink=False):
+    """Remember the mirrors picked from the remote's mirrorlist for MIRRORLIST_CACHE_TTL."""
+    if not isinstance(remote, RpmRemote) or not settings.MIRRORLIST_CACHE_TTL:
+        return
+    # an upsert, concurrent syncs from the same remote may pick their mirrors at the same time
+    RpmMirrorlistCache.objects.bulk_create(
+        [
+            RpmMirrorlistCache(
+                remote_id=remote.pk,
+                mirrorlist_url=remote.url,
+                mirror_urls=mirror_urls,
+                metalink=metalink,
+                expires=timezone.now() + timedelta(seconds=settings.MIRRORLIST_CACHE_TTL),
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["remote"],
+        update_fields=["mirrorlist_url", "mirror_urls", "metalink", "expires"],
+    )
+
+
+def fetch_metalink(remote):
+    """
+    Download the remote's mirrorlist and parse it if it is a metalink.
+
+    Returns:
+        tuple: The path of the downloaded file and the parsed Metalink, or None for a plain
+            mirrorlist.
 
-    URLs which are commented out or have any punctuations in front of them are being ignored.
     """
     downloader = remote.get_downloader(url=remote.url.rstrip("/"), urlencode=False)
     result = downloader.fetch()
+    metalink = parse_metalink(result.path) if is_metalink(result.path) else None
+    return result.path, metalink
 
-    url_pattern = re.compile(r"(^|^[\w\s=]+\s)((http(s)?)://.*)")
-    with open(result.path) as mirror_list_file:
-        for mirror in mirror_list_file:
-            match = re.match(url_pattern, mirror)
-            if not match:
-                continue
 
-            mirror_url = match.group(2)
-            try:
-                get_repomd_file(remote, mirror_url)
-                # just check if the metadata exists
-                return mirror_url
-            except Exception as exc:
-                log.warning(
-                    "Url '{}' from mirrorlist was tried and failed with error: {}".format(
-                        mirror_url, exc
-                    )
+def use_download_mirrors(remote, mirror_urls):
+    """
+    Spread the artifact downloads of this sync across the given mirrors.
+
+    Only the mirrors of a metalink are used this way, their repomd.xml was verified to be the
+    same one. See `RpmRemote.get_downloader`.
+    """
+    if isinstance(remote, RpmRemote) and len(mirror_urls) > 1:
+        remote.download_mirror_urls = [mirror_url.rstrip("/") + "/" for mirror_url in mirror_urls]
+
+
+def fetch_mirror(remote, fetch_cache=None):
+    """Fetch the best mirror from a list of all available mirrors from a mirror list feed.
+
+    URLs which are commented out or have any punctuations in front of them are being ignored.
+
+    All mirrors are probed concurrently (with a timeout) by downloading their repomd.xml and
+    ranked by the freshness of the metadata and their latency, see `rank_mirrors`. The picked
+    mirror is cached for the remote, later syncs only check that it still answers.
+
+    If the remote url serves a metalink instead, only mirrors whose repomd.xml matches the
+    checksums published in it are used, and the artifact downloads are spread across the best
+    METALINK_DOWNLOAD_MIRRORS of them.
+    """
+    cached_mirror_urls, cached_metalink = get_cached_mirror(remote)
+    if cached_mirror_urls:
+        try:
+            metalink = None
+            if cached_metalink:
+                # The metalink is small, always check the cached mirror against its checksums.
+                _, metalink = fetch_metalink(remote)
+            result = get_repomd_file(remote, cached_mirror_urls[0], fetch_cache=fetch_cache)
+            if metalink is None or verify_repomd(metalink, result.path):
+                if metalink is not None:
+                    use_download_mirrors(remote, cached_mirror_urls)
+                return cached_mirror_urls[0]
+            log.warning(
+                "Cached url '{}' from metalink serves outdated metadata".format(
+                    cached_mirror_urls[0]
                 )
-                continue
+            )
+        except Exception as exc:
+            log.warning(
+                "Cached url '{}' from mirrorlist failed with error: {}".format(
+                    cached_mirror_urls[0], exc
+                )
+            )
 
-    return None
+    mirror_list_path, metalink = fetch_metalink(remote)
+
+    mirror_urls = []
+    if metalink is not None:
+        mirror_urls = metalink.mirror_urls
+    else:
+        with open(mirror_list_path) as mirror_list_file:
+            for mirror in mirror_list_file:
+                match = re.match(MIRRORLIST_URL_PATTERN, mirror)
+                if match:
+                    mirror_urls.append(match.group(2))
+
+    async def probe(mirror_url, semaphore):
+        async with semaphore:
+            url = urlpath_sanitize(mirror_url.split("?")[0], "repodata/repomd.xml")
+            started = time.monotonic()
+            result = await asyncio.wait_for(
+                remote.get_downloader(url=url).run(), timeout=settings.MIRRORLIST_PROBE_TIMEOUT
+            )
+            latency = time.monotonic() - started
+            if metalink is not None and not verify_repomd(metalink, result.path):
+                raise ValueError("repomd.xml does not match the checksums in the metalink")
+            if fetch_cache is not None:
+                fetch_cache.add_result(url, result)
+            return latency, cr.Repomd(result.path).revision
+
+    async def probe_all():
+        # Don't start more probes than the remote allows concurrent downloads, so that the
+        # measured latency does not include time spent waiting for a free download slot.
+        semaphore = asyncio.Semaphore(
+            remote.download_concurrency or remote.DEFAULT_DOWNLOAD_CONCURRENCY
+        )
+        return await asyncio.gather(
+            *(probe(mirror_url, semaphore) for mirror_url in mirror_urls), return_exceptions=True
+        )
 
+    probes = []
+    for mirror_url, probe_result in zip(mirror_urls, asyncio.run(probe_all())):
+        if isinstance(probe_result, Exception):
+            log.warning(
+                "Url '{}' from mirrorlist was tried and failed with error: {!r}".format(
+                    mirror_url, probe_result
+                )
+            )
+            continue
+        latency, revision = probe_result
+        probes.append((mirror_url, latency, revision))
+
+    ranked_mirror_urls = rank_mirrors(probes)
+    if not ranked_mirror_urls:
+        return None
 
-def fetch_remote_url(remote, custom_url=None):
+    if metalink is not None:
+        ranked_mirror_urls = ranked_mirror_urls[: settings.METALINK_DOWNLOAD_MIRRORS]
+        use_download_mirrors(remote, ranked_mirror_urls)
+        cache_mirror(remote, ranked_mirror_urls, metalink=True)
+    else:
+        cache_mirror(remote, ranked_mirror_urls[:1])
+    return ranked_mirror_urls[0]
+
+
+def fetch_remote_url(remote, custom_url=None, fetch_cache=None):
     """Fetch a single remote from which can be content synced."""
 
     def normalize_url(url_to_normalize):
@@ -288,7 +798,7 @@ def fetch_remote_url(remote, custom_url=None):
 
     try:
         normalized_remote_url = normalize_url(url)
-        get_repomd_file(remote, normalized_remote_url)
+        get_repomd_file(remote, normalized_remote_url, fetch_cache=fetch_cache)
         # just check if the metadata exists
         return normalized_remote_url
     except ClientResponseError as exc:
@@ -301,7 +811,7 @@ def fetch_remote_url(remote, custom_url=None):
         log.info(
             _("Attempting to resolve a true url from potential mirrolist url '{}'").format(url)
         )
-        remote_url = fetch_mirror(remote)
+        remote_url = fetch_mirror(remote, fetch_cache=fetch_cache)
         if remote_url:
             log.info(
                 _("Using url '{}' from mirrorlist in place of the provided url {}").format(
@@ -313,6 +823,42 @@ def fetch_remote_url(remote, custom_url=None):
         raise RemoteFetchError(url, exc.status, exc.message)
 
 
+def run_concurrently(calls, max_workers=1):
+    """
+    Call each of the given callables and return their results in the same order.
+
+    With more than one worker the callables run in a thread pool. Each thread gets its own event
+    loop for the downloaders and the stages pipeline, and closes its database connection when
+    done. The context (current task, domain) is copied into the threads.
+
+    Args:
+        calls (list): Callables taking no arguments.
+        max_workers (int): How many callables may run at the same time.
+
+    Returns:
+        list: The results of the callables.
+
+    """
+    if max_workers <= 1 or len(calls) <= 1:
+        return [call() for call in calls]
+
+    def run_in_thread(call):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            return call()
+        finally:
+            loop.close()
+            asyncio.set_event_loop(None)
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(contextvars.copy_context().run, run_in_thread, call) for call in calls
+        ]
+        return [future.result() for future in futures]
+
+
 def should_optimize_sync(sync_details, last_sync_details):
     """
     Check whether the sync should be optimized by comparing its parameters with the previous sync.
@@ -360,6 +906,70 @@ def should_optimize_sync(sync_details, last_sync_details):
     return True
 
 
+def is_unmodified_since_last_sync(remote, repository, sync_policy):
+    """
+    Check with conditional requests whether a sync would find nothing changed.
+
+    The ETag and Last-Modified of the repomd.xml and treeinfo files of the previous sync are
+    stored in its `last_sync_details`. If the server answers 304 Not Modified for all of them
+    (and 404 again for those which were not found), and the sync parameters are the same, the
+    sync can be skipped without downloading anything.
+
+    Args:
+        remote (RpmRemote or UlnRemote): The remote to sync from.
+        repository (RpmRepository): The repository to sync into.
+        sync_policy (str): How to perform the sync.
+
+    Returns:
+        bool: True if the sync can be skipped.
+
+    """
+    last_sync_details = repository.last_sync_details
+    http_validators = last_sync_details.get("http_validators")
+    if not http_validators:
+        return False
+
+    # Nothing was downloaded, the checksums compared by should_optimize_sync are the previous ones
+    sync_details = {
+        **last_sync_details,
+        "url": remote.url,
+        "download_policy": remote.policy,
+        "sync_policy": sync_policy,
+        "most_recent_version": repository.latest_version().number,
+        "retain_package_versions": repository.retain_package_versions,
+    }
+    if not should_optimize_sync(sync_details, last_sync_details):
+        return False
+
+    with tempfile.TemporaryDirectory(dir="."):
+        for url, validators in http_validators.items():
+            if validators.get("missing"):
+                downloader = remote.get_downloader(
+                    url=url, silence_errors_for_response_status_codes={403, 404}
+                )
+            elif validators.get("etag") or validators.get("last_modified"):
+                downloader = remote.get_downloader(url=url, validators=validators)
+            else:
+                # the server doesn't support conditional requests for this file
+                return False
+
+            try:
+                downloader.fetch()
+            except NotModified:
+                continue
+            except FileNotFoundError:
+                if validators.get("missing"):
+                    continue
+                return False
+            except Exception as exc:
+                log.debug("Conditional request for {} failed: {!r}".format(url, exc))
+                return False
+            log.debug("{} has changed since the previous sync.".format(url))
+            return False
+
+    return True
+
+
 def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url=None, **kwargs):
     """
     Sync content from the remote repository.
@@ -404,6 +1014,8 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
 
     deferred_download = remote.policy != Remote.IMMEDIATE  # Interpret download policy
     skip_treeinfo = "treeinfo" in skip_types
+    # repomd.xml and treeinfo are looked at several times during a sync, only download them once
+    fetch_cache = MetadataFetchCache()
 
     def get_treeinfo_data(remote, remote_url):
         """Get Treeinfo data from remote."""
@@ -411,6 +1023,10 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
         if skip_treeinfo:
             return treeinfo_serialized
 
+        cached_treeinfo = fetch_cache.get_treeinfo(remote_url)
+        if cached_treeinfo is not None:
+            return cached_treeinfo
+
         namespaces = [".treeinfo", "treeinfo"]
         for namespace in namespaces:
             treeinfo_url = urlpath_sanitize(remote_url, namespace)
@@ -422,7 +1038,9 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
             try:
                 result = downloader.fetch()
             except FileNotFoundError:
+                fetch_cache.add_http_validators(treeinfo_url, None)
                 continue
+            fetch_cache.add_http_validators(treeinfo_url, result)
 
             treeinfo = PulpTreeInfo()
             with open(result.path, "r") as f:
@@ -457,12 +1075,13 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
             store_metadata_for_mirroring(repository, treeinfo_file.name, namespace)
             break
 
-        return treeinfo_serialized
+        return fetch_cache.add_treeinfo(remote_url, treeinfo_serialized)
 
     def get_sync_details(remote, url, sync_policy, repository):
         version = repository.latest_version()
         with tempfile.TemporaryDirectory(dir="."):
-            result = get_repomd_file(remote, url)
+            result = get_repomd_file(remote, url, fetch_cache=fetch_cache)
+            fetch_cache.add_http_validators(get_repomd_url(url), result)
             repomd_path = result.path
             repomd = cr.Repomd(repomd_path)
             repomd_checksum = get_sha256(repomd_path)
@@ -480,8 +1099,18 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
             "retain_package_versions": repository.retain_package_versions,
         }
 
+    # Ask the server whether anything changed before downloading any metadata at all
+    if optimize and not url and is_unmodified_since_last_sync(remote, repository, sync_policy):
+        with ProgressReport(
+            message="Skipping Sync (no change from previous sync)", code="sync.was_skipped"
+        ) as pb:
+            pb.done = 1
+            pb.total = 1
+        return
+
     mirror = sync_policy.startswith("mirror")
     mirror_metadata = sync_policy == SYNC_POLICIES.MIRROR_COMPLETE
+    mirroring_store.set(MirroringStore() if mirror_metadata else None)
 
     repo_sync_config = {}
     # this is the "directory" of the repo within the target repo location - for the primary
@@ -491,10 +1120,23 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
     def is_subrepo(directory):
         return directory != PRIMARY_REPO
 
+    # Sub-repos are probed and synced concurrently when more than one worker is allowed. The
+    # aiohttp session of a remote is bound to the event loop it was created in, so every thread
+    # needs its own remote instance (and with it, its own downloader factory).
+    subrepo_sync_workers = settings.MAX_SUBREPO_SYNC_WORKERS
+
+    def get_remote_for_thread():
+        if subrepo_sync_workers > 1:
+            thread_remote = type(remote).objects.get(pk=remote.pk)
+            thread_remote.download_mirror_urls = getattr(remote, "download_mirror_urls", None)
+            return thread_remote
+        return remote
+
     with tempfile.TemporaryDirectory(dir="."):
-        remote_url = fetch_remote_url(remote, url)
+        remote_url = fetch_remote_url(remote, url, fetch_cache=fetch_cache)
 
         # Find and set up to deal with any subtrees
+        subrepos = []
         treeinfo = get_treeinfo_data(remote, remote_url)
         if treeinfo:
             treeinfo["repositories"] = {}
@@ -510,32 +1152,36 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
                 treeinfo["repositories"].update({directory: str(sub_repo.pk)})
                 path = f"{repodata}/"
                 new_url = urlpath_sanitize(remote_url, path)
+                subrepos.append((directory, new_url, sub_repo))
 
-                try:
-                    subrepo_sync_details = get_sync_details(remote, new_url, sync_policy, sub_repo)
-                except ClientResponseError as exc:
-                    if is_subrepo(directory) and exc.status == 404:
-                        log.warning("Unable to sync sub-repo '{}' from treeinfo.".format(directory))
-                        continue
-                    raise exc
-
-                repo_sync_config[directory] = {
-                    "should_skip": should_optimize_sync(
-                        subrepo_sync_details, sub_repo.last_sync_details
-                    ),
-                    "sync_details": subrepo_sync_details,
-                    "url": new_url,
-                    "repo": sub_repo,
-                }
-
-        # Set up to deal with the primary repository
-        sync_details = get_sync_details(remote, remote_url, sync_policy, repository)
-        repo_sync_config[PRIMARY_REPO] = {
-            "should_skip": should_optimize_sync(sync_details, repository.last_sync_details),
-            "sync_details": sync_details,
-            "url": remote_url,
-            "repo": repository,
-        }
+        def probe(directory, repo_url, repo):
+            try:
+                return get_sync_details(get_remote_for_thread(), repo_url, sync_policy, repo)
+            except ClientResponseError as exc:
+                if is_subrepo(directory) and exc.status == 404:
+                    log.warning("Unable to sync sub-repo '{}' from treeinfo.".format(directory))
+                    return None
+                raise exc
+
+        # Set up to deal with the sub-repos and the primary repository. The primary repository
+        # must be inserted last, see below.
+        repos_to_probe = subrepos + [(PRIMARY_REPO, remote_url, repository)]
+        all_sync_details = run_concurrently(
+            [functools.partial(probe, *repo_to_probe) for repo_to_probe in repos_to_probe],
+            max_workers=subrepo_sync_workers,
+        )
+        for (directory, repo_url, repo), repo_sync_details in zip(repos_to_probe, all_sync_details):
+            if repo_sync_details is None:
+                continue
+            if directory == PRIMARY_REPO:
+                # the primary repository keeps those of the sub-repos as well
+                repo_sync_details["http_validators"] = fetch_cache.http_validators
+            repo_sync_config[directory] = {
+                "should_skip": should_optimize_sync(repo_sync_details, repo.last_sync_details),
+                "sync_details": repo_sync_details,
+                "url": repo_url,
+                "repo": repo,
+            }
 
         # If all repos are exactly the same, we should skip all further processing, even in
         # metadata-mirror mode
@@ -550,18 +1196,17 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
         skipped_syncs = 0
         repo_sync_results = {}
 
-        # If some repos need to be synced and others do not, we go through them all
-        # items() returns in insertion-order - make sure PRIMARY is the LAST thing we process
-        # here, or autopublish will fail to find any subrepo-content.
-        for directory, repo_config in repo_sync_config.items():
+        def sync_repo(directory, repo_config):
             repo = repo_config["repo"]
-            # If metadata_mirroring is enabled we cannot skip any syncs, because the generated
-            # publication needs to contain exactly the same metadata at the same paths.
-            if not mirror_metadata and optimize and repo_config["should_skip"]:
-                skipped_syncs += 1
-                repo_sync_results[directory] = repo.latest_version()
-                continue
-
+            remote = get_remote_for_thread()
+            timings = SyncTimings()
+            # the progress of an interrupted sync of the same metadata, to resume from. Only an
+            # optimized sync can resume, a full one re-processes every package anyway.
+            checkpoint = None
+            if optimize:
+                checkpoint = RpmSyncCheckpoint.for_sync(
+                    repo, remote, repo_config["sync_details"]["repomd_checksum"]
+                )
             stage = RpmFirstStage(
                 remote,
                 repo,
@@ -571,17 +1216,54 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
                 new_url=repo_config["url"],
                 treeinfo=(treeinfo if not is_subrepo(directory) else None),
                 namespace=directory,
+                optimize=optimize,
+                fetch_cache=fetch_cache,
+                timings=timings,
+                checkpoint=checkpoint,
             )
 
-            dv = RpmDeclarativeVersion(first_stage=stage, repository=repo, mirror=mirror)
+            dv = RpmDeclarativeVersion(
+                first_stage=stage, repository=repo, mirror=mirror, timings=timings
+            )
             repo_version = dv.create() or repo.latest_version()
+            if checkpoint is not None:
+                checkpoint.delete()
+            timings.report()
 
             repo_config["sync_details"]["most_recent_version"] = repo_version.number
+            repo_config["sync_details"]["zck_files"] = stage.zck_files
+            repo_config["sync_details"]["timings"] = timings.summary()
             repo.last_sync_details = repo_config["sync_details"]
             repo.save()
 
+            return repo_version
+
+        # If some repos need to be synced and others do not, we go through them all
+        repos_to_sync = []
+        for directory, repo_config in repo_sync_config.items():
+            # If metadata_mirroring is enabled we cannot skip any syncs, because the generated
+            # publication needs to contain exactly the same metadata at the same paths.
+            if not mirror_metadata and optimize and repo_config["should_skip"]:
+                skipped_syncs += 1
+                repo_sync_results[directory] = repo_config["repo"].latest_version()
+            else:
+                repos_to_sync.append((directory, repo_config))
+
+        # Make sure PRIMARY is the LAST thing we process here, after all the sub-repos have
+        # finished, or autopublish will fail to find any subrepo-content.
+        subrepos_to_sync = [item for item in repos_to_sync if is_subrepo(item[0])]
+        subrepo_versions = run_concurrently(
+            [functools.partial(sync_repo, *item) for item in subrepos_to_sync],
+            max_workers=subrepo_sync_workers,
+        )
+        for (directory, repo_config), repo_version in zip(subrepos_to_sync, subrepo_versions):
             repo_sync_results[directory] = repo_version
 
+        if PRIMARY_REPO not in repo_sync_results:
+            repo_sync_results[PRIMARY_REPO] = sync_repo(
+                PRIMARY_REPO, repo_sync_config[PRIMARY_REPO]
+            )
+
     if skipped_syncs:
         with ProgressReport(
             message="Skipping Sync (no change from previous sync)", code="sync.was_skipped"
@@ -594,8 +1276,8 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
             repo_sync_results[PRIMARY_REPO], pass_through=False
         ) as publication:
             gpgcheck = repository.repo_config.get("gpgcheck", 0)
-            has_repomd_signature = (
-                "repodata/repomd.xml.asc" in metadata_files_for_mirroring[str(repository.pk)].keys()
+            has_repomd_signature = mirroring_store.get().has_metadata_file(
+                repository.pk, "repodata/repomd.xml.asc"
             )
             repo_gpgcheck = has_repomd_signature and repository.repo_config.get("repo_gpgcheck", 0)
 
@@ -607,6 +1289,8 @@ def synchronize(remote_pk, repository_pk, sync_policy, skip_types, optimize, url
 
             for path, repo_version in repo_sync_results.items():
                 add_metadata_to_publication(publication, repo_version, prefix=path)
+        mirroring_store.get().close()
+        mirroring_store.set(None)
 
     try:
         # This isn't exported for plugins until core/3.88 - but neither is the deprecation around
@@ -627,13 +1311,17 @@ class RpmDeclarativeVersion(DeclarativeVersion):
     Subclassed Declarative version creates a custom pipeline for RPM sync.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, timings=None, **kwargs):
         """
         Adding support for ACS.
 
         Adding it here, because we call RpmDeclarativeVersion multiple times in sync.
+
+        Keyword Args:
+            timings (SyncTimings): Collects the timings of the pipeline stages, if given.
         """
         kwargs["acs"] = True
+        self.timings = timings
         super().__init__(*args, **kwargs)
 
     def pipeline_stages(self, new_version):
@@ -657,7 +1345,7 @@ class RpmDeclarativeVersion(DeclarativeVersion):
             QueryExistingArtifacts(),
         ]
         if self.acs:
-            pipeline.append(ACSArtifactHandler())
+            pipeline.append(RpmACSArtifactHandler())
         pipeline.extend(
             [
                 ArtifactDownloader(resource_budget=resource_budget),
@@ -666,8 +1354,12 @@ class RpmDeclarativeVersion(DeclarativeVersion):
                 RpmContentSaver(),
                 RpmInterrelateContent(),
                 RemoteArtifactSaver(fix_mismatched_remote_artifacts=True),
+                RpmCheckpointSaver(self.first_stage.checkpoint),
+                RpmCarryOverContent(self.first_stage, mirror=self.mirror),
             ]
         )
+        if self.timings is not None:
+            pipeline = [self.timings.instrument(stage) for stage in pipeline]
         return pipeline
 
 
@@ -689,6 +1381,10 @@ class RpmFirstStage(Stage):
         new_url=None,
         treeinfo=None,
         namespace="",
+        optimize=False,
+        fetch_cache=None,
+        timings=None,
+        checkpoint=None,
     ):
         """
         The first stage of a pulp_rpm sync pipeline.
@@ -706,6 +1402,12 @@ class RpmFirstStage(Stage):
             new_url(str): URL to replace remote url
             treeinfo(dict): Treeinfo data
             namespace(str): Path where this repo is located relative to some parent repo.
+            optimize(bool): If True, packages which are unchanged since the previous sync from
+                this remote are carried over into the new version without being processed.
+            fetch_cache(MetadataFetchCache): A cache to re-use an already downloaded repomd.xml from
+            timings(SyncTimings): Collects the timings of the parse phases
+            checkpoint(RpmSyncCheckpoint): The progress of an interrupted sync to resume from, and
+                to record the progress of this one in. Only given for optimized syncs.
 
         """
         super().__init__()
@@ -724,9 +1426,59 @@ class RpmFirstStage(Stage):
         self.skip_types = [] if skip_types is None else skip_types
 
         self.remote_url = new_url or self.remote.url
+        self.optimize = optimize
+        self.fetch_cache = fetch_cache
+        self.timings = timings or SyncTimings()
+        self.checkpoint = checkpoint
+        self.metadata_cache = MetadataCache.from_settings()
+        self.emitted = 0
+        # shared by all the packages of the sync, see parse_packages
+        self.intern_pool = InternPool()
+
+        # pks of packages found unchanged since the previous sync, see RpmCarryOverContent
+        self.unchanged_package_pks = []
+        # pks of packages saved by an interrupted sync, see RpmCarryOverContent
+        self.resumed_package_pks = []
+        # (pk, url) of the RemoteArtifacts of unchanged packages whose url has changed
+        self.moved_remote_artifacts = []
+        # zchunk metadata downloaded in this sync, {data type: (checksum type, checksum)}
+        self.zck_files = {}
 
         self.nevra_to_module = defaultdict(dict)
-        self.pkgname_to_groups = defaultdict(list)
+
+    def uses_zchunk(self):
+        """
+        Whether metadata can be downloaded as zchunk deltas.
+
+        The metadata must be published exactly as upstream has it in metadata mirror mode, and
+        range requests need an http(s) remote. The zchunk files are kept for the next sync in the
+        metadata cache, without it there would be nothing to download a delta against.
+        """
+        return (
+            self.metadata_cache is not None
+            and not self.mirror_metadata
+            and self.remote_url.startswith(("http://", "https://"))
+            and zchunk_supported()
+        )
+
+    def get_previous_zck_files(self):
+        """
+        Take the zchunk metadata of the previous sync out of the metadata cache.
+
+        The checksums of the zchunk files are recorded in the `last_sync_details` of the
+        repository, see `synchronize`. Files evicted from the cache since are downloaded in full.
+
+        Returns:
+            dict: {data type: path} of the zchunk files of the previous sync still cached.
+
+        """
+        zck_files = {}
+        previous = (self.repository.last_sync_details or {}).get("zck_files", {})
+        for data_type, (checksum_type, checksum) in previous.items():
+            path = self.metadata_cache.get(checksum_type, checksum)
+            if path is not None:
+                zck_files[data_type] = path
+        return zck_files
 
     def is_illegal_relative_path(self, path):
         """Whether a relative path points outside the repository being synced."""
@@ -756,146 +1508,257 @@ class RpmFirstStage(Stage):
             progress_data = dict(
                 message="Downloading Metadata Files", code="sync.downloading.metadata"
             )
-            async with ProgressReport(**progress_data) as metadata_pb:
-                # download repomd.xml
-                downloader = self.remote.get_downloader(
-                    url=urlpath_sanitize(self.remote_url, "repodata/repomd.xml")
-                )
-                result = await downloader.run()
-                store_metadata_for_mirroring(self.repository, result.path, "repodata/repomd.xml")
-                await metadata_pb.aincrement()
-
-                repomd_path = result.path
-                repomd = cr.Repomd(repomd_path)
-
-                if repomd.warnings:
-                    for warn_type, warn_msg in repomd.warnings:
-                        log.warn(warn_msg)
-                    msg = (
-                        "Problems encountered parsing repomd.xml - proxy used: {}, url: {}".format(
+            with self.timings.phase("download_metadata") as download_stats:
+                async with ProgressReport(**progress_data) as metadata_pb:
+                    # download repomd.xml, unless it was already downloaded earlier in this sync
+                    repomd_url = urlpath_sanitize(self.remote_url, "repodata/repomd.xml")
+                    result = None
+                    if self.fetch_cache is not None:
+                        result = self.fetch_cache.get_result(repomd_url)
+                    if result is None:
+                        downloader = self.remote.get_downloader(url=repomd_url)
+                        result = await downloader.run()
+                    store_metadata_for_mirroring(
+                        self.repository, result.path, "repodata/repomd.xml"
+                    )
+                    await metadata_pb.aincrement()
+
+                    repomd_path = result.path
+                    repomd = cr.Repomd(repomd_path)
+
+                    if repomd.warnings:
+                        for warn_type, warn_msg in repomd.warnings:
+                            log.warn(warn_msg)
+                        msg = (
+                            "Problems encountered parsing repomd.xml - proxy used: {}, url: {}"
+                        ).format(
                             self.remote.proxy_url,
                             result.url,
                         )
+                        log.warn(msg)
+
+                    checksum_types = {}
+                    repomd_downloaders = {}
+                    repomd_files = {}
+
+                    types_to_download = (
+                        set(PACKAGE_REPODATA)
+                        | set(UPDATE_REPODATA)
+                        | set(COMPS_REPODATA)
+                        | set(MODULAR_REPODATA)
                     )
-                    log.warn(msg)
 
-                checksum_types = {}
-                repomd_downloaders = {}
-                repomd_files = {}
-
-                types_to_download = (
-                    set(PACKAGE_REPODATA)
-                    | set(UPDATE_REPODATA)
-                    | set(COMPS_REPODATA)
-                    | set(MODULAR_REPODATA)
-                )
+                    async def run_repomdrecord_download(name, location_href, downloader):
+                        result = await downloader.run()
+                        if self.metadata_cache is not None:
+                            ((checksum_type, checksum),) = downloader.expected_digests.items()
+                            await asyncio.to_thread(
+                                self.metadata_cache.add, checksum_type, checksum, result.path
+                            )
+                        return name, location_href, result
 
-                async def run_repomdrecord_download(name, location_href, downloader):
-                    result = await downloader.run()
-                    return name, location_href, result
+                    async def run_cached_download(record, downloader, download):
+                        """Take the file from the metadata cache, or else call download()."""
+                        if self.metadata_cache is not None:
+                            path = await asyncio.to_thread(
+                                self.metadata_cache.get, record.checksum_type, record.checksum
+                            )
+                            if path is not None:
+                                result = DownloadResult(
+                                    url=downloader.url,
+                                    artifact_attributes={},
+                                    path=path,
+                                    headers=None,
+                                )
+                                return record.type, record.location_href, result
+                        return await download()
+
+                    # Fetch the zchunk variant of the metadata where there is one, only its
+                    # chunks which changed since the previous sync are downloaded. The regular file
+                    # is still downloaded if anything goes wrong with it.
+                    zck_records = {}
+                    previous_zck_files = {}
+                    if self.uses_zchunk():
+                        zck_records = {
+                            record.type: record
+                            for record in repomd.records
+                            if record.type.endswith("_zck")
+                        }
+                    if zck_records:
+                        previous_zck_files = await asyncio.to_thread(self.get_previous_zck_files)
+
+                    async def run_zchunk_download(record, zck_record, downloader):
+                        try:
+                            zck_url = urlpath_sanitize(
+                                zck_record.location_base or self.remote_url,
+                                zck_record.location_href,
+                            )
+                            zck_checksum_type = getattr(
+                                CHECKSUM_TYPES, zck_record.checksum_type.upper()
+                            )
+                            zck_path, _ = await download_zchunk(
+                                self.remote,
+                                zck_url,
+                                zck_record.header_size,
+                                {zck_checksum_type: zck_record.checksum},
+                                old_path=previous_zck_files.get(zck_record.type),
+                            )
+                            open_checksum_type = getattr(
+                                CHECKSUM_TYPES, zck_record.checksum_open_type.upper()
+                            )
+                            path = await asyncio.to_thread(
+                                decompress_zchunk,
+                                zck_path,
+                                {open_checksum_type: zck_record.checksum_open},
+                            )
+                        except Exception as exc:
+                            log.warning(
+                                "Downloading '{}' as zchunk failed, downloading '{}' instead: "
+                                "{!r}".format(zck_record.location_href, record.location_href, exc)
+                            )
+                            return await run_repomdrecord_download(
+                                record.type, record.location_href, downloader
+                            )
+                        # keep it to download the next version of it as a delta
+                        await asyncio.to_thread(
+                            self.metadata_cache.add,
+                            zck_checksum_type,
+                            zck_record.checksum,
+                            zck_path,
+                        )
+                        self.zck_files[zck_record.type] = (zck_checksum_type, zck_record.checksum)
+                        result = DownloadResult(
+                            url=downloader.url, artifact_attributes={}, path=path, headers=None
+                        )
+                        return record.type, record.location_href, result
 
-                for record in repomd.records:
-                    record_checksum_type = getattr(CHECKSUM_TYPES, record.checksum_type.upper())
-                    checksum_types[record.type] = record_checksum_type
-                    record.checksum_type = record_checksum_type
+                    for record in repomd.records:
+                        record_checksum_type = getattr(CHECKSUM_TYPES, record.checksum_type.upper())
+                        checksum_types[record.type] = record_checksum_type
+                        record.checksum_type = record_checksum_type
 
-                    if self.mirror_metadata:
-                        uses_base_url = record.location_base
-                        illegal_relative_path = self.is_illegal_relative_path(record.location_href)
+                        if self.mirror_metadata:
+                            uses_base_url = record.location_base
+                            illegal_relative_path = self.is_illegal_relative_path(
+                                record.location_href
+                            )
 
-                        if (
-                            uses_base_url
-                            or illegal_relative_path
-                            or record.type in RepoMetadataFile.UNSUPPORTED_METADATA
-                        ):
-                            raise MirrorIncompatibleRepositoryError()
+                            if (
+                                uses_base_url
+                                or illegal_relative_path
+                                or record.type in RepoMetadataFile.UNSUPPORTED_METADATA
+                            ):
+                                raise MirrorIncompatibleRepositoryError()
 
-                    if not self.mirror_metadata and record.type not in types_to_download:
-                        continue
+                        if not self.mirror_metadata and record.type not in types_to_download:
+                            continue
 
-                    base_url = record.location_base or self.remote_url
-                    downloader = self.remote.get_downloader(
-                        url=urlpath_sanitize(base_url, record.location_href),
-                        expected_size=record.size,
-                        expected_digests={record_checksum_type: record.checksum},
-                    )
-                    repomd_downloaders[record.type] = asyncio.ensure_future(
-                        run_repomdrecord_download(record.type, record.location_href, downloader)
-                    )
+                        base_url = record.location_base or self.remote_url
+                        downloader = self.remote.get_downloader(
+                            url=urlpath_sanitize(base_url, record.location_href),
+                            expected_size=record.size,
+                            expected_digests={record_checksum_type: record.checksum},
+                        )
+                        zck_record = zck_records.get(f"{record.type}_zck")
+                        if zck_record and record.type in types_to_download:
+                            download = functools.partial(
+                                run_zchunk_download, record, zck_record, downloader
+                            )
+                        else:
+                            download = functools.partial(
+                                run_repomdrecord_download,
+                                record.type,
+                                record.location_href,
+                                downloader,
+                            )
+                        repomd_downloaders[record.type] = asyncio.ensure_future(
+                            run_cached_download(record, downloader, download)
+                        )
 
-                try:
-                    for future in asyncio.as_completed(list(repomd_downloaders.values())):
-                        name, location_href, result = await future
-                        store_metadata_for_mirroring(self.repository, result.path, location_href)
-                        repomd_files[name] = result
-                        await metadata_pb.aincrement()
-                except ClientResponseError as exc:
-                    raise RemoteFetchError(
-                        url=str(exc.request_info.url),
-                        status=exc.status,
-                        message=exc.message,
-                    )
-                except FileNotFoundError:
-                    raise
+                    try:
+                        for future in asyncio.as_completed(list(repomd_downloaders.values())):
+                            name, location_href, result = await future
+                            store_metadata_for_mirroring(
+                                self.repository, result.path, location_href
+                            )
+                            repomd_files[name] = result
+                            await metadata_pb.aincrement()
+                    except ClientResponseError as exc:
+                        raise RemoteFetchError(
+                            url=str(exc.request_info.url),
+                            status=exc.status,
+                            message=exc.message,
+                        )
+                    except FileNotFoundError:
+                        raise
 
-                if self.mirror_metadata:
-                    # optional signature and key files for repomd metadata
-                    for file_href in ["repodata/repomd.xml.asc", "repodata/repomd.xml.key"]:
+                    if self.mirror_metadata:
+                        # optional signature and key files for repomd metadata
+                        for file_href in ["repodata/repomd.xml.asc", "repodata/repomd.xml.key"]:
+                            try:
+                                downloader = self.remote.get_downloader(
+                                    url=urlpath_sanitize(self.remote_url, file_href),
+                                    silence_errors_for_response_status_codes={403, 404},
+                                )
+                                result = await downloader.run()
+                                store_metadata_for_mirroring(
+                                    self.repository, result.path, file_href
+                                )
+                                await metadata_pb.aincrement()
+                            except (ClientResponseError, FileNotFoundError):
+                                pass
+
+                        # extra files to copy, e.g. EULA, LICENSE
                         try:
                             downloader = self.remote.get_downloader(
-                                url=urlpath_sanitize(self.remote_url, file_href),
+                                url=urlpath_sanitize(self.remote_url, "extra_files.json"),
                                 silence_errors_for_response_status_codes={403, 404},
                             )
                             result = await downloader.run()
-                            store_metadata_for_mirroring(self.repository, result.path, file_href)
+                            store_metadata_for_mirroring(
+                                self.repository, result.path, "extra_files.json"
+                            )
                             await metadata_pb.aincrement()
                         except (ClientResponseError, FileNotFoundError):
                             pass
-
-                    # extra files to copy, e.g. EULA, LICENSE
-                    try:
-                        downloader = self.remote.get_downloader(
-                            url=urlpath_sanitize(self.remote_url, "extra_files.json"),
-                            silence_errors_for_response_status_codes={403, 404},
-                        )
-                        result = await downloader.run()
-                        store_metadata_for_mirroring(
-                            self.repository, result.path, "extra_files.json"
-                        )
-                        await metadata_pb.aincrement()
-                    except (ClientResponseError, FileNotFoundError):
-                        pass
-                    else:
-                        try:
-                            with open(result.path, "r") as f:
-                                extra_files = json.loads(f.read())
-                                for data in extra_files["data"]:
-                                    filtered_checksums = {
-                                        digest: value
-                                        for digest, value in data["checksums"].items()
-                                        if digest in ALLOWED_CONTENT_CHECKSUMS
-                                    }
-                                    downloader = self.remote.get_downloader(
-                                        url=urlpath_sanitize(self.remote_url, data["file"]),
-                                        expected_size=data["size"],
-                                        expected_digests=filtered_checksums,
-                                    )
-                                    result = await downloader.run()
-                                    store_metadata_for_mirroring(
-                                        self.repository, result.path, data["file"]
-                                    )
-                                    await metadata_pb.aincrement()
-                        except ClientResponseError as exc:
-                            raise RemoteFetchError(
-                                url=str(exc.request_info.url),
-                                status=exc.status,
-                                message=exc.message,
-                            )
-                        except FileNotFoundError:
-                            raise
+                        else:
+                            try:
+                                with open(result.path, "r") as f:
+                                    extra_files = json.loads(f.read())
+                                    for data in extra_files["data"]:
+                                        filtered_checksums = {
+                                            digest: value
+                                            for digest, value in data["checksums"].items()
+                                            if digest in ALLOWED_CONTENT_CHECKSUMS
+                                        }
+                                        downloader = self.remote.get_downloader(
+                                            url=urlpath_sanitize(self.remote_url, data["file"]),
+                                            expected_size=data["size"],
+                                            expected_digests=filtered_checksums,
+                                        )
+                                        result = await downloader.run()
+                                        store_metadata_for_mirroring(
+                                            self.repository, result.path, data["file"]
+                                        )
+                                        await metadata_pb.aincrement()
+                            except ClientResponseError as exc:
+                                raise RemoteFetchError(
+                                    url=str(exc.request_info.url),
+                                    status=exc.status,
+                                    message=exc.message,
+                                )
+                            except FileNotFoundError:
+                                raise
+
+                download_stats["items"] += metadata_pb.done
 
             await self.parse_repository_metadata(repomd, repomd_files)
 
+    async def put(self, item):
+        """Emit an item, counting it for the timings of the parse phases."""
+        self.emitted += 1
+        await super().put(item)
+
     async def parse_distribution_tree(self):
         """Parse content from the file treeinfo if present."""
         if self.treeinfo:
@@ -951,25 +1814,35 @@ class RpmFirstStage(Stage):
             # bellow only skip them if unsupported. If we cannot parse modulemd, package
             # can't be flagged as 'modular' thus broken repository!
             if modulemd_result.url.endswith("zck"):
-                raise UnsupportedModularCompressionError("zck")
-            modulemd_dcs, modulemd_list = await self.parse_modules_metadata(modulemd_result)
+                try:
+                    path = await asyncio.to_thread(decompress_zchunk, modulemd_result.path)
+                except Exception:
+                    raise UnsupportedModularCompressionError("zck")
+                modulemd_result = modulemd_result._replace(path=path)
+            with self.timings.phase("parse_modules", lambda: self.emitted) as modules_stats:
+                modulemd_dcs, modulemd_list = await self.parse_modules_metadata(modulemd_result)
+                modules_stats["items"] += len(modulemd_dcs)
 
         # **Now** we can successfully parse package-metadata
-        await self.parse_packages(
-            metadata_results.get("primary"),
-            metadata_results.get("filelists"),
-            metadata_results.get("other"),
-            modulemd_list=modulemd_list,
-        )
+        with self.timings.phase("parse_packages", lambda: self.emitted):
+            await self.parse_packages(
+                metadata_results.get("primary"),
+                metadata_results.get("filelists"),
+                metadata_results.get("other"),
+                modulemd_list=modulemd_list,
+            )
 
         groups_list = []
         comps_result = metadata_results.get("group", None)
         if comps_result:
-            groups_list = await self.parse_packages_components(comps_result)
+            with self.timings.phase("parse_comps", lambda: self.emitted) as comps_stats:
+                groups_list = await self.parse_packages_components(comps_result)
+                comps_stats["items"] += len(groups_list)
 
         updateinfo_result = metadata_results.get("updateinfo", None)
         if updateinfo_result:
-            await self.parse_advisories(updateinfo_result)
+            with self.timings.phase("parse_advisories", lambda: self.emitted):
+                await self.parse_advisories(updateinfo_result)
 
         # now send modules and groups down the pipeline since all relations have been set up
         for modulemd_dc in modulemd_dcs:
@@ -1025,6 +1898,20 @@ class RpmFirstStage(Stage):
         """
         modulemd_all, defaults_all, obsoletes_all = parse_modular(modulemd_result.path)
 
+        # Unchanged modulemds and defaults are passed on without building the model objects.
+        def _get_existing_modules():
+            return (
+                get_existing_content_by_digest(
+                    Modulemd, [modulemd["digest"] for modulemd in modulemd_all]
+                ),
+                get_existing_content_by_digest(
+                    ModulemdDefaults,
+                    [default[PULP_MODULEDEFAULTS_ATTR.DIGEST] for default in defaults_all],
+                ),
+            )
+
+        existing_modulemds, existing_defaults = await sync_to_async(_get_existing_modules)()
+
         modulemd_dcs = []
 
         # Parsing modules happens all at one time, and from here on no useful work happens.
@@ -1036,14 +1923,18 @@ class RpmFirstStage(Stage):
             modulemd_pb.done = modulemd_total
 
         for modulemd in modulemd_all:
-            modulemd_content = Modulemd(**modulemd)
+            existing_pk = existing_modulemds.get(modulemd["digest"])
+            if existing_pk:
+                modulemd_content = saved_content(Modulemd, existing_pk, digest=modulemd["digest"])
+            else:
+                modulemd_content = Modulemd(**modulemd)
             dc = DeclarativeContent(content=modulemd_content)
             dc.extra_data = defaultdict(list)
             modulemd_dcs.append(dc)
 
-            # dc.content.artifacts are Modulemd artifacts
-            if dc.content.artifacts:
-                for artifact in dc.content.artifacts:
+            # The relations to the packages are still needed, packages may be new.
+            if modulemd[PULP_MODULE_ATTR.ARTIFACTS]:
+                for artifact in modulemd[PULP_MODULE_ATTR.ARTIFACTS]:
                     self.nevra_to_module.setdefault(artifact, set()).add(dc)
 
         # Parsing module-defaults happens all at one time, and from here on no useful
@@ -1059,7 +1950,12 @@ class RpmFirstStage(Stage):
 
         default_content_dcs = []
         for default in defaults_all:
-            default_content = ModulemdDefaults(**default)
+            digest = default[PULP_MODULEDEFAULTS_ATTR.DIGEST]
+            existing_pk = existing_defaults.get(digest)
+            if existing_pk:
+                default_content = saved_content(ModulemdDefaults, existing_pk, digest=digest)
+            else:
+                default_content = ModulemdDefaults(**default)
             default_content_dcs.append(DeclarativeContent(content=default_content))
 
         if default_content_dcs:
@@ -1112,76 +2008,125 @@ class RpmFirstStage(Stage):
             comps_pb.total = comps_total
             comps_pb.done = comps_total
 
+        langpack_dict = None
         if comps.langpacks:
             langpack_dict = PackageLangpacks.libcomps_to_dict(comps.langpacks)
-            packagelangpack = PackageLangpacks(
-                matches=strdict_to_dict(comps.langpacks), digest=dict_digest(langpack_dict)
-            )
-            package_language_pack_dc = DeclarativeContent(content=packagelangpack)
-            package_language_pack_dc.extra_data = defaultdict(list)
+        category_dicts = []
+        for category in comps.categories:
+            category_dict = PackageCategory.libcomps_to_dict(category)
+            category_dict["digest"] = dict_digest(category_dict)
+            category_dicts.append(category_dict)
+        environment_dicts = []
+        for environment in comps.environments:
+            environment_dict = PackageEnvironment.libcomps_to_dict(environment)
+            environment_dict["digest"] = dict_digest(environment_dict)
+            environment_dicts.append(environment_dict)
+        group_dicts = []
+        for group in comps.groups:
+            group_dict = PackageGroup.libcomps_to_dict(group)
+            group_dict["digest"] = dict_digest(group_dict)
+            group_dicts.append(group_dict)
+
+        # Unchanged comps entries exist already, they are passed on without building the model
+        # objects or any of the relations between them.
+        def _get_existing_comps():
+            return {
+                PackageLangpacks: get_existing_content_by_digest(
+                    PackageLangpacks, [dict_digest(langpack_dict)] if langpack_dict else []
+                ),
+                PackageCategory: get_existing_content_by_digest(
+                    PackageCategory, [category_dict["digest"] for category_dict in category_dicts]
+                ),
+                PackageEnvironment: get_existing_content_by_digest(
+                    PackageEnvironment,
+                    [environment_dict["digest"] for environment_dict in environment_dicts],
+                ),
+                PackageGroup: get_existing_content_by_digest(
+                    PackageGroup, [group_dict["digest"] for group_dict in group_dicts]
+                ),
+            }
+
+        existing_comps = await sync_to_async(_get_existing_comps)()
+
+        def existing_dc(model, digest):
+            existing_pk = existing_comps[model].get(digest)
+            if not existing_pk:
+                return None
+            dc = DeclarativeContent(content=saved_content(model, existing_pk, digest=digest))
+            dc.extra_data = defaultdict(list)
+            return dc
+
+        if langpack_dict:
+            langpack_digest = dict_digest(langpack_dict)
+            package_language_pack_dc = existing_dc(PackageLangpacks, langpack_digest)
+            if not package_language_pack_dc:
+                packagelangpack = PackageLangpacks(
+                    matches=strdict_to_dict(comps.langpacks), digest=langpack_digest
+                )
+                package_language_pack_dc = DeclarativeContent(content=packagelangpack)
+                package_language_pack_dc.extra_data = defaultdict(list)
 
         # init categories declarative content
-        if comps.categories:
-            for category in comps.categories:
-                category_dict = PackageCategory.libcomps_to_dict(category)
-                category_dict["digest"] = dict_digest(category_dict)
-                packagecategory = PackageCategory(**category_dict)
-                dc = DeclarativeContent(content=packagecategory)
-                dc.extra_data = defaultdict(list)
-
-                if packagecategory.group_ids:
-                    for group_id in packagecategory.group_ids:
-                        group_to_categories[group_id["name"]].append(dc)
+        for category_dict in category_dicts:
+            dc = existing_dc(PackageCategory, category_dict["digest"])
+            if dc:
                 dc_categories.append(dc)
+                continue
+            packagecategory = PackageCategory(**category_dict)
+            dc = DeclarativeContent(content=packagecategory)
+            dc.extra_data = defaultdict(list)
 
-        # init environments declarative content
-        if comps.environments:
-            for environment in comps.environments:
-                environment_dict = PackageEnvironment.libcomps_to_dict(environment)
-                environment_dict["digest"] = dict_digest(environment_dict)
-                packageenvironment = PackageEnvironment(**environment_dict)
-                dc = DeclarativeContent(content=packageenvironment)
-                dc.extra_data = defaultdict(list)
-
-                if packageenvironment.option_ids:
-                    for option_id in packageenvironment.option_ids:
-                        optionalgroup_to_environments[option_id["name"]].append(dc)
-
-                if packageenvironment.group_ids:
-                    for group_id in packageenvironment.group_ids:
-                        group_to_environments[group_id["name"]].append(dc)
+            if packagecategory.group_ids:
+                for group_id in packagecategory.group_ids:
+                    group_to_categories[group_id["name"]].append(dc)
+            dc_categories.append(dc)
 
+        # init environments declarative content
+        for environment_dict in environment_dicts:
+            dc = existing_dc(PackageEnvironment, environment_dict["digest"])
+            if dc:
                 dc_environments.append(dc)
+                continue
+            packageenvironment = PackageEnvironment(**environment_dict)
+            dc = DeclarativeContent(content=packageenvironment)
+            dc.extra_data = defaultdict(list)
 
-        # init groups declarative content
-        if comps.groups:
-            for group in comps.groups:
-                group_dict = PackageGroup.libcomps_to_dict(group)
-                group_dict["digest"] = dict_digest(group_dict)
-                packagegroup = PackageGroup(**group_dict)
-                dc = DeclarativeContent(content=packagegroup)
-                dc.extra_data = defaultdict(list)
-
-                if packagegroup.packages:
-                    for package in packagegroup.packages:
-                        self.pkgname_to_groups[package["name"]].append(dc)
-
-                if dc.content.id in group_to_categories.keys():
-                    for dc_category in group_to_categories[dc.content.id]:
-                        dc.extra_data["category_relations"].append(dc_category)
-                        dc_category.extra_data["packagegroups"].append(dc)
-
-                if dc.content.id in group_to_environments.keys():
-                    for dc_environment in group_to_environments[dc.content.id]:
-                        dc.extra_data["environment_relations"].append(dc_environment)
-                        dc_environment.extra_data["packagegroups"].append(dc)
-
-                if dc.content.id in optionalgroup_to_environments.keys():
-                    for dc_environment in optionalgroup_to_environments[dc.content.id]:
-                        dc.extra_data["env_relations_optional"].append(dc_environment)
-                        dc_environment.extra_data["optionalgroups"].append(dc)
+            if packageenvironment.option_ids:
+                for option_id in packageenvironment.option_ids:
+                    optionalgroup_to_environments[option_id["name"]].append(dc)
+
+            if packageenvironment.group_ids:
+                for group_id in packageenvironment.group_ids:
+                    group_to_environments[group_id["name"]].append(dc)
 
+            dc_environments.append(dc)
+
+        # init groups declarative content
+        for group_dict in group_dicts:
+            dc = existing_dc(PackageGroup, group_dict["digest"])
+            if dc:
                 dc_groups.append(dc)
+                continue
+            packagegroup = PackageGroup(**group_dict)
+            dc = DeclarativeContent(content=packagegroup)
+            dc.extra_data = defaultdict(list)
+
+            if dc.content.id in group_to_categories.keys():
+                for dc_category in group_to_categories[dc.content.id]:
+                    dc.extra_data["category_relations"].append(dc_category)
+                    dc_category.extra_data["packagegroups"].append(dc)
+
+            if dc.content.id in group_to_environments.keys():
+                for dc_environment in group_to_environments[dc.content.id]:
+                    dc.extra_data["environment_relations"].append(dc_environment)
+                    dc_environment.extra_data["packagegroups"].append(dc)
+
+            if dc.content.id in optionalgroup_to_environments.keys():
+                for dc_environment in optionalgroup_to_environments[dc.content.id]:
+                    dc.extra_data["env_relations_optional"].append(dc_environment)
+                    dc_environment.extra_data["optionalgroups"].append(dc)
+
+            dc_groups.append(dc)
 
         if package_language_pack_dc:
             await self.put(package_language_pack_dc)
@@ -1195,7 +2140,15 @@ class RpmFirstStage(Stage):
         return dc_groups
 
     async def parse_packages(self, primary_xml, filelists_xml, other_xml, modulemd_list=None):
-        """Parse packages from the remote repository."""
+        """
+        Parse packages from the remote repository.
+
+        The metadata is parsed in a single pass. While parsing, every package is checked (and
+        the sync fails fast if something is wrong), the data needed to decide which packages to
+        skip is collected and the package is written to an on-disk spool. Once all decisions are
+        known, the spool is replayed and the packages which were not skipped are sent down the
+        pipeline.
+        """
         parser = cr.RepositoryReader.from_metadata_files(
             primary_xml.path,
             filelists_xml.path if filelists_xml else None,
@@ -1204,7 +2157,8 @@ class RpmFirstStage(Stage):
 
         # skip SRPM if defined
         skip_srpms = "srpm" in self.skip_types
-        nevras = set()
+        # pkgIds are only kept as compact keys, see compact_key. The indices are keyed by the
+        # NEVRA strings, which are shared by all the indices of a package.
         checksums = set()
         modular_artifact_nevras = set()
         pkgid_warning_triggered = False
@@ -1218,23 +2172,84 @@ class RpmFirstStage(Stage):
                 modular_artifact_nevras |= set(modulemd[PULP_MODULE_ATTR.ARTIFACTS])
 
         package_skip_nevras = set()
-        # The repository can contain packages of arbitrary arches, and they are not comparable.
-        # {"x86_64": {"glibc": [...]}, "i686": {"glibc": [...], "src": {"glibc": [...]}}
-        latest_packages_by_arch_and_name = defaultdict(lambda: defaultdict(list))
+        # The newest versions of the non-modular packages by arch and name, for retention
+        retained_versions = RetainedVersions(self.repository.retain_package_versions or 0)
         # duplicate NEVRA tiebreaker - if we have multiple packages with the same nevra then
         # we might want to pick the latest based on the build time.
         latest_build_time_by_nevra = {}
-        # A list of package names seen in which order - used to calculate heuristics used by caching
-        pkg_names_seen_order = []
+
+        # Pre-load an index of the existing packages from the latest repo version keyed by pkgId,
+        # holding only what is needed to pass them down the pipeline again. Cache hits are
+        # hydrated into saved model objects, causing QueryExistingContents to skip them (because
+        # _state.adding is False on already-saved objects).
+        def _build_existing_packages_cache():
+            cache = {}
+            latest_version = self.repository.latest_version()
+            if latest_version:
+                existing_packages = Package.objects.filter(
+                    pk__in=latest_version.content.all()
+                ).values_list("pkgId", "pk", "size_package", "checksum_type", "location_href")
+                checksum_types = {}
+                for pkgid, pk, size, checksum_type, location_href in existing_packages.iterator(
+                    chunk_size=EXISTING_CONTENT_BATCH_SIZE
+                ):
+                    checksum_type = checksum_types.setdefault(checksum_type, checksum_type)
+                    cache[pkgid] = (pk, size, checksum_type, location_href)
+            return cache
+
+        existing_packages = await sync_to_async(_build_existing_packages_cache)()
+
+        # Snapshot of the packages previously synced into the latest repo version from this
+        # remote, keyed by pkgId. It is derived from the RemoteArtifacts recorded by the last
+        # sync, so it always describes exactly the version it is compared against.
+        def _build_package_snapshot():
+            snapshot = {}
+            latest_version = self.repository.latest_version()
+            if not self.optimize or not latest_version:
+                return snapshot
+            remote_artifacts = RemoteArtifact.objects.filter(
+                remote=self.remote,
+                content_artifact__content__in=latest_version.content.filter(
+                    pulp_type=Package.get_pulp_type()
+                ),
+            ).values_list(
+                "content_artifact__content__rpm_package__pkgId",
+                "content_artifact__content_id",
+                "url",
+                "content_artifact__artifact_id",
+                "pk",
+            )
+            for (
+                pkgid,
+                content_pk,
+                url,
+                artifact_pk,
+                remote_artifact_pk,
+            ) in remote_artifacts.iterator(chunk_size=EXISTING_CONTENT_BATCH_SIZE):
+                snapshot[pkgid] = (content_pk, url, artifact_pk is not None, remote_artifact_pk)
+            return snapshot
+
+        package_snapshot = await sync_to_async(_build_package_snapshot)()
+
+        # The packages which an interrupted sync of the same metadata has saved already, by pkgId.
+        # Like unchanged packages, they only have to be added to the new version.
+        resumable_packages = {}
+        if self.checkpoint is not None:
+            resumable_packages = await sync_to_async(self.checkpoint.get_packages)()
+            if resumable_packages:
+                log.info(
+                    "Resuming an interrupted sync, {} packages are saved already".format(
+                        len(resumable_packages)
+                    )
+                )
 
         # Perform various checks and potentially filter out unwanted packages
-        # We parse all of primary.xml first and fail fast if something is wrong.
+        # We parse all of the metadata once and fail fast if something is wrong.
         # Collect a list of any package nevras() we don't want to include, and other checks
         def verification_and_skip_callback(pkg):
             nonlocal pkgid_warning_triggered
             nonlocal nevra_warning_triggered
             nonlocal package_skip_nevras
-            nonlocal latest_packages_by_arch_and_name
             nonlocal total_packages
             nonlocal latest_build_time_by_nevra
             nonlocal skipped_packages
@@ -1242,11 +2257,12 @@ class RpmFirstStage(Stage):
             total_packages += 1
             pkg_nevra = pkg.nevra()
             pkg_name = pkg.name
+            pkgid_key = compact_key(pkg.pkgId)
 
-            pkg_names_seen_order.append(pkg_name)
-
-            duplicate_nevra = pkg_nevra in nevras
-            duplicate_pkgid = pkg.pkgId in checksums
+            duplicate_nevra = pkg_nevra in latest_build_time_by_nevra
+            # a (most unlikely) collision of the pkgId keys only costs a spurious warning and
+            # converting the package in full
+            duplicate_pkgid = pkgid_key in checksums
 
             # Check for packages with duplicate pkgids
             if not pkgid_warning_triggered and duplicate_pkgid:
@@ -1264,8 +2280,7 @@ class RpmFirstStage(Stage):
             latest_build_time_by_nevra[pkg_nevra] = max(
                 pkg.time_build, latest_build_time_by_nevra.get(pkg_nevra, 0)
             )
-            nevras.add(pkg_nevra)
-            checksums.add(pkg.pkgId)
+            checksums.add(pkgid_key)
 
             # Check that all packages are within the root of the repo (if in mirror_complete mode).
             # We can't allow mirroring metadata that references packages outside of the repo
@@ -1290,245 +2305,265 @@ class RpmFirstStage(Stage):
             # purpose of this collection is deciding what to skip, and we never want to exclude
             # modular packages on the basis of being too old or nonmodular packages on the basis of
             # newer modular packages existing.
+            # Only the newest versions are kept, older ones are skipped as soon as they are known.
             if self.repository.retain_package_versions and pkg_nevra not in modular_artifact_nevras:
                 pkg_evr = Evr(pkg.epoch, pkg.version, pkg.release).sortkey()
-                latest_packages_by_arch_and_name[pkg.arch][pkg_name].append((pkg_evr, pkg_nevra))
-
-        # Ew, callback-based API, gross. The streaming API doesn't support optionally
-        # specifying particular files yet so we have to use the old way.
-        cr.xml_parse_primary(primary_xml.path, pkgcb=verification_and_skip_callback, do_files=False)
-
-        # Go through the package lists, sort them descending by EVR, ignore the first N and then
-        # add the remaining ones to the skip list.
-        for arch, packages in latest_packages_by_arch_and_name.items():
-            for name, versions in packages.items():
-                versions.sort(key=lambda p: p[0], reverse=True)
-                for pkg in versions[self.repository.retain_package_versions :]:
-                    evr, nevra = pkg
-                    package_skip_nevras.add(nevra)
+                outdated_key = retained_versions.add(pkg.arch, pkg_name, pkg_evr, pkg_nevra)
+                if outdated_key is not None:
+                    package_skip_nevras.add(outdated_key)
                     skipped_packages += 1
 
-        del latest_packages_by_arch_and_name
-
-        if skipped_packages:
-            msg = (
-                "Excluding {} packages "
-                "(duplicates, outdated or skipping was requested e.g. 'skip_types')"
-            )
-            log.info(msg.format(skipped_packages))
-
-        def score_grouping(items):
-            """
-            Score how well items are grouped together in a list.
-
-            Returns:
-                float: Score from 0 (completely scattered) to 1 (perfectly grouped)
-
-            Examples:
-                >>> score_grouping(["apple", "apple", "banana", "banana", "pear"])
-                1.0
-                >>> score_grouping(["apple", "banana", "apple", "banana", "pear"])
-                0.0 (or close to it)
-            """
-            if not items:
-                return 1.0
-
-            # Count actual number of runs (consecutive groups)
-            actual_runs = 1
-            for i in range(1, len(items)):
-                if items[i] != items[i - 1]:
-                    actual_runs += 1
-
-            # Count frequency of each item
-            from collections import Counter
-
-            counts = Counter(items)
-
-            # Minimum runs = number of unique items (best case: all grouped)
-            min_runs = len(counts)
-
-            # Maximum runs for this distribution (worst case: maximally scattered)
-            # Formula: min(total_items, 2 * sum_of_smaller_counts + 1)
-            sorted_counts = sorted(counts.values(), reverse=True)
-            other_counts_sum = sum(sorted_counts[1:])
-            max_runs = min(len(items), 2 * other_counts_sum + 1)
-
-            # Edge case: if all items are the same
-            if min_runs == max_runs:
-                return 1.0
-
-            # Normalize score: 1 = perfectly grouped, 0 = maximally scattered
-            score = (max_runs - actual_runs) / (max_runs - min_runs)
-
-            return score
-
-        last_seen_package_name = None
-        # for specific repos that are highly random but also have a small nubmer of unique names,
-        # let's use global caching for all packages instead of just like consecutive ones
-        pkg_names_count = len(set(pkg_names_seen_order))
-        repo_grouping_score = score_grouping(pkg_names_seen_order)
-        use_global_caching = repo_grouping_score < 0.25 and pkg_names_count < 25
-        log.debug(
-            f"use_global_caching: {use_global_caching} repo_grouping_score: {repo_grouping_score} "
-            f" pkg_names_count: {pkg_names_count}"
-        )
+            return pkg_nevra, duplicate_pkgid
 
-        progress_data = {
-            "message": "Skipping Packages",
-            "code": "sync.skipped.packages",
-            "done": skipped_packages,
-            "total": skipped_packages,
-        }
-        async with ProgressReport(**progress_data) as skipped_pb:
-            await skipped_pb.asave()
+        # Spool every package which might be synced to disk, so that the metadata only needs
+        # to be parsed once. Packages which will be served from the existing-packages cache
+        # only need their location and EVRA, the full data is converted and spooled for
+        # everything else.
+        with tempfile.TemporaryFile(dir=".") as spool_file:
+            spool = pickle.Pickler(spool_file, protocol=pickle.HIGHEST_PROTOCOL)
+            for pkg in parser.iter_packages():
+                pkg_nevra, duplicate_pkgid = verification_and_skip_callback(pkg)
+                if pkg_nevra in package_skip_nevras:
+                    continue
+                resumable = (
+                    pkg.pkgId in resumable_packages and pkg_nevra not in modular_artifact_nevras
+                )
+                if duplicate_pkgid or (pkg.pkgId not in existing_packages and not resumable):
+                    package_data = Package.createrepo_to_dict(pkg)
+                else:
+                    # just enough to hydrate the existing package, see below
+                    package_data = {
+                        PULP_PACKAGE_ATTRS.EPOCH: pkg.epoch or "0",
+                        PULP_PACKAGE_ATTRS.VERSION: pkg.version,
+                        PULP_PACKAGE_ATTRS.RELEASE: pkg.release,
+                        PULP_PACKAGE_ATTRS.ARCH: pkg.arch,
+                    }
+                spool.dump(
+                    (
+                        pkg.pkgId,
+                        pkg_nevra,
+                        pkg.name,
+                        pkg.time_build,
+                        pkg.location_href,
+                        pkg.location_base,
+                        package_data,
+                    )
+                )
+                # the memo would keep every spooled package alive
+                spool.clear_memo()
+                del pkg
+            del spool, parser
+            # free them, the callback which uses them is done
+            retained_versions = checksums = None
+
+            if skipped_packages:
+                msg = (
+                    "Excluding {} packages "
+                    "(duplicates, outdated or skipping was requested e.g. 'skip_types')"
+                )
+                log.info(msg.format(skipped_packages))
 
-        progress_data = {
-            "message": "Parsed Packages",
-            "code": "sync.parsing.packages",
-            "total": total_packages,
-        }
-        async with ProgressReport(**progress_data) as packages_pb:
-            # Pre-load existing packages from the latest repo version keyed by pkgId.
-            # Cache hits reuse the saved model object, causing QueryExistingContents to
-            # skip them (because _state.adding is False on already-saved objects).
-            def _build_existing_packages_cache():
-                cache = {}
-                latest_version = self.repository.latest_version()
-                if latest_version:
-                    # ignore particularly expensive metadata which we do not need to handle for already-synced packages
-                    for existing_pkg in (
-                        Package.objects.filter(pk__in=latest_version.content.all())
-                        .defer(
-                            "files",
-                            "requires",
-                            "provides",
-                            "changelogs",
-                        )
-                        .iterator()
-                    ):
-                        cache[existing_pkg.pkgId] = existing_pkg
-                return cache
+            progress_data = {
+                "message": "Skipping Packages",
+                "code": "sync.skipped.packages",
+                "done": skipped_packages,
+                "total": skipped_packages,
+            }
+            async with ProgressReport(**progress_data) as skipped_pb:
+                await skipped_pb.asave()
 
-            existing_packages = await sync_to_async(_build_existing_packages_cache)()
+            progress_data = {
+                "message": "Parsed Packages",
+                "code": "sync.parsing.packages",
+                "total": total_packages,
+            }
+            async with ProgressReport(**progress_data) as packages_pb:
+                spool_file.seek(0)
+                spooled_packages = pickle.Unpickler(spool_file)
+                while True:
+                    try:
+                        spooled_package = spooled_packages.load()
+                    except EOFError:
+                        break
+                    (
+                        pkgid,
+                        pkg_nevra,
+                        pkg_name,
+                        time_build,
+                        location_href,
+                        location_base,
+                        package_data,
+                    ) = spooled_package
+                    del spooled_package
+                    # Skip over packages (retention feature, skip_types feature)
+                    if package_skip_nevras and pkg_nevra in package_skip_nevras:
+                        continue
+                    # Same heuristic as DNF / Yum / Zypper - in the event we encounter multiple
+                    # package entries with the same NEVRA, pick the one with the larger build time.
+                    # Ties are broken by first-seen: after the first package passes, the entry is
+                    # replaced with a sentinel so that any subsequent package with the same NEVRA is
+                    # filtered out.
+                    elif time_build != latest_build_time_by_nevra[pkg_nevra]:
+                        continue
+                    latest_build_time_by_nevra[pkg_nevra] = ALREADY_SEEN
+
+                    # Packages which are unchanged since the previous sync (same pkgId and, for the
+                    # immediate policy, already downloaded) need no further processing, they only
+                    # have to be kept in the new version, and their url updated if it changed.
+                    # Modular packages still go the long way because their relations to the
+                    # (possibly new) modulemds must be created.
+                    snapshot_entry = package_snapshot.pop(pkgid, None)
+                    if snapshot_entry is not None and pkg_nevra not in self.nevra_to_module:
+                        content_pk, snapshot_url, downloaded, remote_artifact_pk = snapshot_entry
+                        if self.deferred_download or downloaded:
+                            url = urlpath_sanitize(location_base or self.remote_url, location_href)
+                            if url != snapshot_url:
+                                self.moved_remote_artifacts.append((remote_artifact_pk, url))
+                            store_package_for_mirroring(self.repository, pkgid, location_href)
+                            self.unchanged_package_pks.append(content_pk)
+                            existing_packages.pop(pkgid, None)
+                            await packages_pb.aincrement()
+                            continue
 
-            string_cache = {}
-            tuple_cache = {}
+                    content_pk = resumable_packages.pop(pkgid, None)
+                    if content_pk is not None and pkg_nevra not in self.nevra_to_module:
+                        store_package_for_mirroring(self.repository, pkgid, location_href)
+                        self.resumed_package_pks.append(content_pk)
+                        existing_packages.pop(pkgid, None)
+                        await packages_pb.aincrement()
+                        continue
 
-            for pkg in parser.iter_packages():
-                pkg_nevra = pkg.nevra()
-                # Skip over packages (retention feature, skip_types feature)
-                if package_skip_nevras and pkg_nevra in package_skip_nevras:
-                    continue
-                # Same heuristic as DNF / Yum / Zypper - in the event we encounter multiple package
-                # entries with the same NEVRA, pick the one with the larger build time. Ties are
-                # broken by first-seen: after the first package passes, the entry is replaced with
-                # a sentinel so that any subsequent package with the same NEVRA is filtered out.
-                elif pkg.time_build != latest_build_time_by_nevra[pkg_nevra]:
-                    continue
-                latest_build_time_by_nevra[pkg_nevra] = ALREADY_SEEN
-                # Typically (not always, but 90% of the time) like (same name, different arch
-                # or version) packages are grouped together metadata - this means that re-using
-                # the cache for runs of consecutive like packages is highly effective at saving
-                # memory yet while avoiding the overhead of the cache when it will go unused.
-                if pkg.name != last_seen_package_name and not use_global_caching:
-                    string_cache.clear()
-                    tuple_cache.clear()
-
-                # If we see a package that's in the cache (generated from latest repo_version)
-                # avoid generating a new empty Package and instead pass the saved one. This avoids
-                # more expensive queries down the line in QueryExistingContents.
-                cached = existing_packages.pop(pkg.pkgId, None)
-                if cached is not None:
-                    base_url = pkg.location_base or self.remote_url
-                    url = urlpath_sanitize(base_url, pkg.location_href)
-                    store_package_for_mirroring(self.repository, cached.pkgId, pkg.location_href)
-                    last_seen_package_name = pkg.name
-                    del pkg
-
-                    artifact = Artifact(size=cached.size_package)
-                    checksum_type = getattr(CHECKSUM_TYPES, cached.checksum_type.upper())
-                    setattr(artifact, checksum_type, cached.pkgId)
-                    da = DeclarativeArtifact(
-                        artifact=artifact,
-                        url=url,
-                        relative_path=cached.location_href,
-                        remote=self.remote,
-                        deferred_download=self.deferred_download,
-                    )
-                    dc = DeclarativeContent(content=cached, d_artifacts=[da])
-                    dc.extra_data = defaultdict(list)
-                else:
-                    # Implicit: There can be multiple package entries that are completely
-                    # identical (same NEVRA, same build time, same checksum / pkgid) and the
-                    # same or different location_href. We're not explicitly handling this, the
-                    # pipeline will deduplicate.
-                    package = Package(
-                        **Package.createrepo_to_dict(
-                            pkg, string_cache=string_cache, tuple_cache=tuple_cache
+                    # If we see a package that's in the cache (generated from latest repo_version)
+                    # avoid generating a new empty Package and instead pass the saved one. This
+                    # avoids more expensive queries down the line in QueryExistingContents.
+                    cached = existing_packages.pop(pkgid, None)
+                    if cached is not None:
+                        content_pk, size_package, checksum_type, cached_location_href = cached
+                        cached = saved_content(
+                            Package,
+                            content_pk,
+                            pkgId=pkgid,
+                            name=pkg_name,
+                            epoch=package_data[PULP_PACKAGE_ATTRS.EPOCH],
+                            version=package_data[PULP_PACKAGE_ATTRS.VERSION],
+                            release=package_data[PULP_PACKAGE_ATTRS.RELEASE],
+                            arch=package_data[PULP_PACKAGE_ATTRS.ARCH],
+                            checksum_type=checksum_type,
+                            size_package=size_package,
+                            location_href=cached_location_href,
+                        )
+                        del package_data
+                        base_url = location_base or self.remote_url
+                        url = urlpath_sanitize(base_url, location_href)
+                        store_package_for_mirroring(self.repository, pkgid, location_href)
+
+                        artifact = Artifact(size=size_package)
+                        setattr(artifact, getattr(CHECKSUM_TYPES, checksum_type.upper()), pkgid)
+                        da = DeclarativeArtifact(
+                            artifact=artifact,
+                            url=url,
+                            relative_path=cached_location_href,
+                            remote=self.remote,
+                            deferred_download=self.deferred_download,
+                        )
+                        dc = DeclarativeContent(content=cached, d_artifacts=[da])
+                        dc.extra_data = defaultdict(list)
+                    else:
+                        # Implicit: There can be multiple package entries that are completely
+                        # identical (same NEVRA, same build time, same checksum / pkgid) and the
+                        # same or different location_href. We're not explicitly handling this, the
+                        # pipeline will deduplicate.
+
+                        # Interning doesn't survive the round trip through the spool, so replace the
+                        # file entries and dependencies with the equal objects of the sync's pool,
+                        # to take advantage of Python's refcounting behavior.
+                        package_data[PULP_PACKAGE_ATTRS.FILES] = self.intern_pool.intern_files(
+                            package_data[PULP_PACKAGE_ATTRS.FILES]
+                        )
+                        for attr in DEPENDENCY_ATTRS:
+                            package_data[attr] = self.intern_pool.intern_dependencies(
+                                package_data[attr]
+                            )
+                        package = Package(**package_data)
+                        # TODO: set signing_keys when we support package signing during sync
+                        package.signing_keys = None
+                        base_url = location_base or self.remote_url
+                        url = urlpath_sanitize(base_url, package.location_href)
+                        del package_data  # delete & free the memory as soon as we're done with it
+
+                        # Location_href is not a property of the Package in isolation [0], and
+                        # Pulp has a well defined way of generating the layout/locations on
+                        # publication time. We only need to use the original location_href for
+                        # metadata mirroring.
+                        # [0] https://github.com/pulp/pulp_rpm/issues/2580
+                        original_location_href = package.location_href
+                        package.location_href = package.filename
+                        store_package_for_mirroring(
+                            self.repository, package.pkgId, original_location_href
                         )
-                    )
-                    # TODO: set signing_keys when we support package signing during sync
-                    package.signing_keys = None
-                    base_url = pkg.location_base or self.remote_url
-                    url = urlpath_sanitize(base_url, package.location_href)
-                    last_seen_package_name = pkg.name
-                    del pkg  # delete & free the memory as soon as we're done with it
-
-                    # Location_href is not a property of the Package in isolation [0], and
-                    # Pulp has a well defined way of generating the layout/locations on
-                    # publication time. We only need to use the original location_href for
-                    # metadata mirroring.
-                    # [0] https://github.com/pulp/pulp_rpm/issues/2580
-                    original_location_href = package.location_href
-                    package.location_href = package.filename
-                    store_package_for_mirroring(
-                        self.repository, package.pkgId, original_location_href
-                    )
 
-                    artifact = Artifact(size=package.size_package)
-                    checksum_type = getattr(CHECKSUM_TYPES, package.checksum_type.upper())
-                    setattr(artifact, checksum_type, package.pkgId)
-                    da = DeclarativeArtifact(
-                        artifact=artifact,
-                        url=url,
-                        relative_path=package.location_href,
-                        remote=self.remote,
-                        deferred_download=self.deferred_download,
-                    )
-                    dc = DeclarativeContent(content=package, d_artifacts=[da])
-                    dc.extra_data = defaultdict(list)
-
-                # find if a package relates to a modulemd
-                if dc.content.nevra in self.nevra_to_module.keys():
-                    if dc.content._state.adding:  # don't edit existing packages though
-                        dc.content.is_modular = True
-                    for dc_modulemd in self.nevra_to_module[dc.content.nevra]:
-                        dc.extra_data["modulemd_relation"].append(dc_modulemd)
-                        dc_modulemd.extra_data["package_relation"].append(dc)
-
-                if dc.content.name in self.pkgname_to_groups.keys():
-                    for dc_group in self.pkgname_to_groups[dc.content.name]:
-                        dc.extra_data["group_relations"].append(dc_group)
-                        dc_group.extra_data["related_packages"].append(dc)
-
-                await packages_pb.aincrement()  # TODO: don't do this for every individual package
-                await self.put(dc)
+                        artifact = Artifact(size=package.size_package)
+                        checksum_type = getattr(CHECKSUM_TYPES, package.checksum_type.upper())
+                        setattr(artifact, checksum_type, package.pkgId)
+                        da = DeclarativeArtifact(
+                            artifact=artifact,
+                            url=url,
+                            relative_path=package.location_href,
+                            remote=self.remote,
+                            deferred_download=self.deferred_download,
+                        )
+                        dc = DeclarativeContent(content=package, d_artifacts=[da])
+                        dc.extra_data = defaultdict(list)
+                        # Only the packages which are new to the repository are worth recording in
+                        # the checkpoint, the others are cheap to process again on a retry. Modular
+                        # packages are never resumed, see above.
+                        if pkg_nevra not in self.nevra_to_module:
+                            dc.extra_data["resumable"] = True
+
+                    # find if a package relates to a modulemd
+                    # The modulemds are emitted after all the packages, so they only keep the pkgId
+                    # of their packages (not the DeclarativeContent, which would keep the whole
+                    # package alive until then), see RpmInterrelateContent.
+                    if dc.content.nevra in self.nevra_to_module.keys():
+                        if dc.content._state.adding:  # don't edit existing packages though
+                            dc.content.is_modular = True
+                        for dc_modulemd in self.nevra_to_module[dc.content.nevra]:
+                            dc.extra_data["modulemd_relation"].append(dc_modulemd)
+                            dc_modulemd.extra_data["package_relation"].append(pkgid)
+
+                    # TODO: don't do this for every individual package
+                    await packages_pb.aincrement()
+                    await self.put(dc)
 
     async def parse_advisories(self, result):
         """Parse advisories from the remote repository."""
         updateinfo_xml_path = result.path
 
         updates = await RpmFirstStage.parse_updateinfo(updateinfo_xml_path)
+        digests = [hash_update_record(update) for update in updates]
+        existing_update_records = await sync_to_async(get_existing_content_by_digest)(
+            UpdateRecord, digests
+        )
         progress_data = {
             "message": "Parsed Advisories",
             "code": "sync.parsing.advisories",
             "total": len(updates),
         }
         async with ProgressReport(**progress_data) as advisories_pb:
-            for update in updates:
+            for update, digest in zip(updates, digests):
+                existing_pk = existing_update_records.get(digest)
+                if existing_pk:
+                    # Unchanged advisory, its collections and references exist already.
+                    update_record = saved_content(UpdateRecord, existing_pk, digest=digest)
+                    await advisories_pb.aincrement()
+                    dc = DeclarativeContent(content=update_record)
+                    dc.extra_data = {"collections": {}, "references": []}
+                    await self.put(dc)
+                    continue
+
                 update_record = UpdateRecord(**UpdateRecord.createrepo_to_dict(update))
                 update_record.pulp_domain = get_domain()
-                update_record.digest = hash_update_record(update)
+                update_record.digest = digest
                 future_relations = {"collections": defaultdict(list), "references": []}
 
                 for collection in update.collections:
@@ -1559,8 +2594,18 @@ class RpmInterrelateContent(Stage):
 
     This stage creates relationships Packages and Modulemd, PackageGroup, PackageCatagory and
     PackageEnvironment models.
+
+    Modulemds reference their packages by pkgId. The pks of the modular packages are collected
+    as the packages pass (saved) through this stage, the modulemds always come after them.
     """
 
+    def __init__(self, *args, **kwargs):
+        """
+        Initialize the stage.
+        """
+        super().__init__(*args, **kwargs)
+        self.modular_package_pks = {}
+
     async def run(self):
         """
         Create all the relationships.
@@ -1578,15 +2623,20 @@ class RpmInterrelateContent(Stage):
                             continue
 
                         if isinstance(d_content.content, Modulemd):
-                            for pkg in d_content.extra_data["package_relation"]:
-                                if not pkg.content._state.adding:
+                            for pkgid in set(d_content.extra_data["package_relation"]):
+                                package_pk = self.modular_package_pks.get(pkgid)
+                                if package_pk:
                                     module_package = ModulemdPackages(
-                                        package_id=pkg.content.pk,
+                                        package_id=package_pk,
                                         modulemd_id=d_content.content.pk,
                                     )
                                     modulemd_pkgs_to_save.append(module_package)
 
                         elif isinstance(d_content.content, Package):
+                            if d_content.extra_data["modulemd_relation"]:
+                                self.modular_package_pks[d_content.content.pkgId] = (
+                                    d_content.content.pk
+                                )
                             for modulemd in d_content.extra_data["modulemd_relation"]:
                                 if not modulemd.content._state.adding:
                                     module_package = ModulemdPackages(
@@ -1605,6 +2655,209 @@ class RpmInterrelateContent(Stage):
                 await self.put(declarative_content)
 
 
+class RpmACSArtifactHandler(Stage):
+    """
+    A stage that points the artifacts to download at the RPM Alternate Content Sources.
+
+    The packages of a batch are looked up in the package index of the ACS paths with a single
+    query on their pkgIds (see `index_acs_path`), instead of a lookup by checksum among all the
+    remote artifacts. Other artifacts, e.g. the images of distribution trees, and packages
+    missing from the index (of a path not refreshed since it was added) are looked up among the
+    remote artifacts of the ACSs by their digests, like pulpcore's ACSArtifactHandler does.
+
+    When several ACSs provide a package, the ACS whose name sorts first is used, and among its
+    paths the one which sorts first. When several remote artifacts match, the oldest one is used.
+    The same sources are thus used from one sync to the next.
+    """
+
+    async def run(self):
+        """
+        Prepend the urls found in the ACSs to the urls of the artifacts, batch by batch.
+        """
+        domain = await sync_to_async(get_domain)()
+        acs_exists = await RpmAlternateContentSource.objects.filter(pulp_domain=domain).aexists()
+        remotes = {}
+
+        async def get_remote(remote_pk):
+            if remote_pk not in remotes:
+                remotes[remote_pk] = await RpmRemote.objects.aget(pk=remote_pk)
+            return remotes[remote_pk]
+
+        def use_acs(d_artifacts, remote, url):
+            for d_artifact in d_artifacts:
+                d_artifact.urls = [url] + d_artifact.urls
+                d_artifact.remote = remote
+
+        async for batch in self.batches():
+            if acs_exists:
+                packages = defaultdict(list)
+                others = []
+                for d_content in batch:
+                    for d_artifact in d_content.d_artifacts:
+                        if isinstance(d_content.content, Package):
+                            packages[d_content.content.pkgId].append(d_artifact)
+                        else:
+                            others.append(d_artifact)
+
+                if packages:
+                    indexed_packages = (
+                        RpmAlternateContentSourcePackage.objects.filter(
+                            pkgId__in=list(packages),
+                            acs_path__alternate_content_source__pulp_domain=domain,
+                        )
+                        .order_by("acs_path__alternate_content_source__name", "acs_path__path")
+                        .values_list(
+                            "pkgId",
+                            "location_href",
+                            "acs_path__path",
+                            "acs_path__alternate_content_source__remote",
+                        )
+                    )
+                    async for pkgid, location_href, path, remote_pk in indexed_packages:
+                        # the first ACS path in the order above is used
+                        d_artifacts = packages.pop(pkgid, None)
+                        if d_artifacts:
+                            remote = await get_remote(remote_pk)
+                            url = urlpath_sanitize(acs_path_url(remote.url, path), location_href)
+                            use_acs(d_artifacts, remote, url)
+                    for d_artifacts in packages.values():
+                        others.extend(d_artifacts)
+
+                checksums = defaultdict(set)
+                for d_artifact in others:
+                    for checksum_type in Artifact.COMMON_DIGEST_FIELDS:
+                        checksum = getattr(d_artifact.artifact, checksum_type)
+                        if checksum:
+                            checksums[checksum_type].add(checksum)
+
+                if checksums:
+                    query = Q()
+                    for checksum_type, values in checksums.items():
+                        query |= Q(**{f"{checksum_type}__in": list(values)})
+                    remote_artifacts = (
+                        RemoteArtifact.objects.filter(
+                            remote__in=RpmAlternateContentSource.objects.filter(
+                                pulp_domain=domain
+                            ).values("remote"),
+                        )
+                        .filter(query)
+                        .order_by("pulp_created", "pk")
+                        .values_list("url", "remote", *Artifact.COMMON_DIGEST_FIELDS)
+                    )
+                    found = {}
+                    async for url, remote_pk, *digests in remote_artifacts:
+                        for checksum in digests:
+                            # the oldest remote artifact is used
+                            if checksum:
+                                found.setdefault(checksum, (url, remote_pk))
+                    for d_artifact in others:
+                        for checksum_type in Artifact.COMMON_DIGEST_FIELDS:
+                            match = found.get(getattr(d_artifact.artifact, checksum_type))
+                            if match:
+                                url, remote_pk = match
+                                use_acs([d_artifact], await get_remote(remote_pk), url)
+                                break
+
+            for d_content in batch:
+                await self.put(d_content)
+
+
+class RpmCarryOverContent(Stage):
+    """
+    A stage that keeps packages which are unchanged since the previous sync.
+
+    The first stage does not send unchanged packages down the pipeline, they never visit any of
+    the artifact or content stages. This stage updates the urls of their RemoteArtifacts in bulk,
+    where they changed. The new repository version starts out with the content of the previous
+    one, so the unchanged packages are in it already. Only in mirror mode, once all other content
+    has passed through, a lightweight placeholder is emitted for each of them so that content
+    association does not remove them.
+
+    Packages saved by an interrupted sync are skipped by the first stage the same way, a
+    placeholder is always emitted for them since they are not in the previous version.
+    """
+
+    def __init__(self, first_stage, mirror=False):
+        """
+        Args:
+            first_stage (RpmFirstStage): The stage which collects the unchanged packages.
+            mirror (bool): Whether content which is not emitted is removed from the new version.
+        """
+        super().__init__()
+        self.first_stage = first_stage
+        self.mirror = mirror
+
+    def update_remote_artifact_urls(self):
+        """Update the urls of the RemoteArtifacts of unchanged packages which have moved."""
+        moved = self.first_stage.moved_remote_artifacts
+        for i in range(0, len(moved), EXISTING_CONTENT_BATCH_SIZE):
+            RemoteArtifact.objects.bulk_update(
+                [
+                    RemoteArtifact(pk=pk, url=url)
+                    for pk, url in moved[i : i + EXISTING_CONTENT_BATCH_SIZE]
+                ],
+                fields=["url"],
+            )
+
+    async def run(self):
+        """
+        Pass everything through, then take care of the unchanged packages.
+        """
+        async for declarative_content in self.items():
+            await self.put(declarative_content)
+
+        await sync_to_async(self.update_remote_artifact_urls)()
+
+        if self.mirror:
+            for content_pk in self.first_stage.unchanged_package_pks:
+                await self.put(DeclarativeContent(content=saved_content(Package, content_pk)))
+        for content_pk in self.first_stage.resumed_package_pks:
+            await self.put(DeclarativeContent(content=saved_content(Package, content_pk)))
+
+
+class RpmCheckpointSaver(Stage):
+    """
+    A stage that records the new packages which have been saved in the sync checkpoint.
+
+    Packages reaching this stage are saved along with their artifacts and remote artifacts. If
+    the sync is interrupted, a retry of the same metadata resumes with them, see
+    RpmSyncCheckpoint. Only the packages which the first stage marked as resumable are recorded,
+    the ones which were in the repository already are cheap to process again.
+    """
+
+    def __init__(self, checkpoint):
+        """
+        Args:
+            checkpoint (RpmSyncCheckpoint): The checkpoint to record the packages in, if any.
+        """
+        super().__init__()
+        self.checkpoint = checkpoint
+
+    def record_packages(self, batch):
+        """Record the saved resumable packages of a batch."""
+        checkpoint_packages = [
+            RpmSyncCheckpointPackage(
+                checkpoint=self.checkpoint,
+                pkgId=declarative_content.content.pkgId,
+                content_id=declarative_content.content.pk,
+            )
+            for declarative_content in batch
+            if declarative_content.extra_data.get("resumable")
+        ]
+        if checkpoint_packages:
+            RpmSyncCheckpointPackage.objects.bulk_create(checkpoint_packages, ignore_conflicts=True)
+
+    async def run(self):
+        """
+        Record the packages of every batch, then pass the batch on.
+        """
+        async for batch in self.batches():
+            if self.checkpoint is not None:
+                await sync_to_async(self.record_packages)(batch)
+            for declarative_content in batch:
+                await self.put(declarative_content)
+
+
 class RpmContentSaver(ContentSaver):
     """
     A modification of ContentSaver stage that additionally saves RPM plugin specific items.
@@ -1676,7 +2929,27 @@ class RpmContentSaver(ContentSaver):
         update_collection_to_save = []
         update_references_to_save = []
         update_collection_packages_to_save = []
-        seen_updaterecords = []
+        seen_updaterecords = set()
+
+        # Find the update_records of the batch which already have relations with one query,
+        # instead of counting the collections and references of each of them.
+        update_record_pks = [
+            declarative_content.content.pk
+            for declarative_content in batch
+            if declarative_content is not None
+            and isinstance(declarative_content.content, UpdateRecord)
+        ]
+        update_records_with_relations = set()
+        if update_record_pks:
+            update_records_with_relations = set(
+                UpdateCollection.objects.filter(update_record__in=update_record_pks)
+                .values_list("update_record_id", flat=True)
+                .union(
+                    UpdateReference.objects.filter(update_record__in=update_record_pks).values_list(
+                        "update_record_id", flat=True
+                    )
+                )
+            )
 
         for declarative_content in batch:
             if declarative_content is None:
@@ -1688,10 +2961,7 @@ class RpmContentSaver(ContentSaver):
             elif isinstance(declarative_content.content, UpdateRecord):
                 update_record = declarative_content.content
 
-                relations_exist = (
-                    update_record.collections.count() or update_record.references.count()
-                )
-                if relations_exist:
+                if update_record.pk in update_records_with_relations:
                     # existing content which was retrieved from the db at earlier stages
                     continue
 
@@ -1701,7 +2971,7 @@ class RpmContentSaver(ContentSaver):
                 # It can happen easily during pulp 2to3 migration, or in case of a bad repo.
                 if update_record.digest in seen_updaterecords:
                     continue
-                seen_updaterecords.append(update_record.digest)
+                seen_updaterecords.add(update_record.digest)
 
                 future_relations = declarative_content.extra_data
                 update_collections = future_relations.get("collections", {})
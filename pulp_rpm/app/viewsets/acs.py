@@ -1,5 +1,3 @@
-import os
-
 from django.utils.timezone import now
 from drf_spectacular.utils import extend_schema
 from rest_framework.decorators import action
@@ -17,7 +15,6 @@ from pulpcore.plugin.viewsets import (
 )
 
 from pulp_rpm.app import tasks
-from pulp_rpm.app.constants import SYNC_POLICIES
 from pulp_rpm.app.models import (
     RpmAlternateContentSource,
     RpmRepository,
@@ -26,6 +23,7 @@ from pulp_rpm.app.serializers import (
     RpmAlternateContentSourceSerializer,
     RpmRepositorySyncURLSerializer,
 )
+from pulp_rpm.app.shared_utils import acs_path_url
 
 
 class RpmAlternateContentSourceViewSet(AlternateContentSourceViewSet, RolesMixin):
@@ -152,19 +150,17 @@ class RpmAlternateContentSourceViewSet(AlternateContentSourceViewSet, RolesMixin
             if created:
                 acs_path.repository = repo
                 acs_path.save()
-            acs_url = (
-                os.path.join(acs.remote.url, acs_path.path) if acs_path.path else acs.remote.url
-            )
+            acs_url = acs_path_url(acs.remote.url, acs_path.path)
 
             # Dispatching ACS path to own task and assign it to common TaskGroup
             dispatch(
-                tasks.synchronize,
+                tasks.refresh_acs_path,
                 shared_resources=[acs.remote, acs],
                 task_group=task_group,
                 kwargs={
+                    "acs_path_pk": str(acs_path.pk),
                     "remote_pk": str(acs.remote.pk),
                     "repository_pk": str(acs_path.repository.pk),
-                    "sync_policy": SYNC_POLICIES.MIRROR_CONTENT_ONLY,
                     "skip_types": skip_types,
                     "optimize": optimize,
                     "url": acs_url,
@@ -0,0 +1,391 @@
+import asyncio
+import functools
+import hashlib
+import os
+import tempfile
+from logging import getLogger
+from typing import NamedTuple
+
+import createrepo_c as cr
+
+log = getLogger(__name__)
+
+ZCK_MAGIC = b"\0ZCK1"
+
+# zchunk checksum type ids: (hashlib name, digest size). Type 3 is SHA-512/128, the first
+# 16 bytes of a SHA-512 digest.
+ZCK_CHECKSUM_TYPES = {
+    0: ("sha1", 20),
+    1: ("sha256", 32),
+    2: ("sha512", 64),
+    3: ("sha512", 16),
+}
+
+# Flags in the preface of the header.
+ZCK_FLAG_STREAMS = 1
+ZCK_FLAG_OPTIONAL_ELEMENTS = 2
+
+# Missing chunks closer to each other than this many bytes are fetched with a single range
+# request, re-downloading the chunks in between is cheaper than another request.
+ZCK_RANGE_MERGE_GAP = 64 * 1024
+
+# Enough to read the lead of any zchunk file, whatever the checksum type.
+ZCK_MAX_LEAD_SIZE = 128
+
+
+class ZchunkError(ValueError):
+    """
+    Raised when a zchunk file cannot be parsed or verified.
+    """
+
+
+class ZchunkChunk(NamedTuple):
+    """
+    A chunk of a zchunk file.
+
+    Attributes:
+        checksum (bytes): Checksum of the compressed chunk.
+        offset (int): Position of the chunk in the file.
+        length (int): Compressed length of the chunk.
+    """
+
+    checksum: bytes
+    offset: int
+    length: int
+
+
+class ZchunkHeader(NamedTuple):
+    """
+    The parts of a zchunk header needed to download a file as a delta.
+
+    Attributes:
+        size (int): Size of the lead and the header, the chunks start right after it.
+        chunk_checksum_type (tuple): (hashlib name, digest size) of the chunk checksums.
+        chunks (list): The chunks of the file, the dictionary chunk first.
+    """
+
+    size: int
+    chunk_checksum_type: tuple
+    chunks: list
+
+
+def _read_compint(data, offset):
+    """
+    Read a zchunk compressed integer: 7 bits per byte, little-endian, the last byte has the
+    highest bit set.
+    """
+    value = 0
+    shift = 0
+    while True:
+        if offset >= len(data):
+            raise ZchunkError("Truncated zchunk header")
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+def _read_checksum_type(data, offset):
+    type_id, offset = _read_compint(data, offset)
+    try:
+        return ZCK_CHECKSUM_TYPES[type_id], offset
+    except KeyError:
+        raise ZchunkError("Unknown zchunk checksum type {}".format(type_id))
+
+
+def _digest(checksum_type, data):
+    name, size = checksum_type
+    return hashlib.new(name, data).digest()[:size]
+
+
+def parse_lead(data):
+    """
+    Parse the lead of a zchunk file.
+
+    Args:
+        data (bytes): The beginning of the file, at least the lead.
+
+    Returns:
+        int: Size of the lead and the header.
+
+    """
+    if not data.startswith(ZCK_MAGIC):
+        raise ZchunkError("Not a zchunk file")
+    (_, digest_size), offset = _read_checksum_type(data, len(ZCK_MAGIC))
+    header_size, offset = _read_compint(data, offset)
+    return offset + digest_size + header_size
+
+
+def parse_header(data):
+    """
+    Parse and verify the header of a zchunk file.
+
+    Args:
+        data (bytes): The beginning of the file, at least the lead and the header.
+
+    Returns:
+        ZchunkHeader: The parsed header.
+
+    Raises:
+        ZchunkError: If the header is malformed or its checksum does not match.
+
+    """
+    if not data.startswith(ZCK_MAGIC):
+        raise ZchunkError("Not a zchunk file")
+    header_checksum_type, offset = _read_checksum_type(data, len(ZCK_MAGIC))
+    header_size, offset = _read_compint(data, offset)
+    digest_size = header_checksum_type[1]
+    header_checksum = data[offset : offset + digest_size]
+    lead_size = offset + digest_size
+    size = lead_size + header_size
+    if len(data) < size:
+        raise ZchunkError("Truncated zchunk header")
+    # The header checksum covers everything up to the end of the header except itself.
+    if _digest(header_checksum_type, data[:offset] + data[lead_size:size]) != header_checksum:
+        raise ZchunkError("Zchunk header checksum does not match")
+
+    # preface: data checksum, flags, compression type and optional elements
+    offset = lead_size + digest_size
+    flags, offset = _read_compint(data, offset)
+    _, offset = _read_compint(data, offset)
+    if flags & ZCK_FLAG_STREAMS:
+        raise ZchunkError("Zchunk files with streams are not supported")
+    if flags & ZCK_FLAG_OPTIONAL_ELEMENTS:
+        count, offset = _read_compint(data, offset)
+        for _ in range(count):
+            _, offset = _read_compint(data, offset)
+            element_size, offset = _read_compint(data, offset)
+            offset += element_size
+
+    # index: chunk checksum type and the chunks, the dictionary chunk first
+    _, offset = _read_compint(data, offset)
+    chunk_checksum_type, offset = _read_checksum_type(data, offset)
+    chunk_count, offset = _read_compint(data, offset)
+    chunks = []
+    chunk_offset = size
+    for _ in range(chunk_count):
+        checksum = data[offset : offset + chunk_checksum_type[1]]
+        offset += chunk_checksum_type[1]
+        length, offset = _read_compint(data, offset)
+        _, offset = _read_compint(data, offset)
+        chunks.append(ZchunkChunk(checksum=checksum, offset=chunk_offset, length=length))
+        chunk_offset += length
+    if offset > size:
+        raise ZchunkError("Truncated zchunk header")
+
+    return ZchunkHeader(size=size, chunk_checksum_type=chunk_checksum_type, chunks=chunks)
+
+
+def read_header(path):
+    """
+    Read and parse the header of a local zchunk file.
+
+    Args:
+        path (str): Path of the zchunk file.
+
+    Returns:
+        ZchunkHeader: The parsed header.
+
+    """
+    with open(path, "rb") as f:
+        data = f.read(ZCK_MAX_LEAD_SIZE)
+        size = parse_lead(data)
+        if size > len(data):
+            data += f.read(size - len(data))
+    return parse_header(data)
+
+
+def missing_ranges(header, old_header, merge_gap=ZCK_RANGE_MERGE_GAP):
+    """
+    Find the byte ranges of the chunks which are not in the old file.
+
+    Args:
+        header (ZchunkHeader): Header of the new file.
+        old_header (ZchunkHeader): Header of the old file, or None if there is none.
+        merge_gap (int): Ranges which are closer than this many bytes are merged.
+
+    Returns:
+        tuple: A dict of {chunk checksum: offset in the old file} of the chunks to reuse, and a
+            list of (start, end) byte ranges (both inclusive) of the new file to download.
+
+    """
+    old_chunks = {}
+    if old_header is not None and old_header.chunk_checksum_type == header.chunk_checksum_type:
+        old_chunks = {(chunk.checksum, chunk.length): chunk.offset for chunk in old_header.chunks}
+
+    reusable = {}
+    ranges = []
+    for chunk in header.chunks:
+        if not chunk.length:
+            continue
+        old_offset = old_chunks.get((chunk.checksum, chunk.length))
+        if old_offset is not None:
+            reusable[chunk.checksum] = old_offset
+            continue
+        start, end = chunk.offset, chunk.offset + chunk.length - 1
+        if ranges and start - ranges[-1][1] <= merge_gap:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return reusable, ranges
+
+
+def assemble(header_data, header, old_path, reusable, fetched, expected_digests):
+    """
+    Write the new zchunk file from its header, the old file and the downloaded ranges.
+
+    Args:
+        header_data (bytes): The lead and header of the new file.
+        header (ZchunkHeader): The parsed header of the new file.
+        old_path (str): Path of the old file, or None.
+        reusable (dict): {chunk checksum: offset in the old file} of the chunks to copy.
+        fetched (list): (start, path) of the downloaded ranges.
+        expected_digests (dict): {checksum type: digest} the whole file must match.
+
+    Returns:
+        str: Path of the new zchunk file.
+
+    Raises:
+        ZchunkError: If a chunk or the whole file does not match its checksum.
+
+    """
+    hashers = {name: hashlib.new(name) for name in expected_digests}
+    range_files = []
+    old_file = open(old_path, "rb") if old_path and reusable else None
+    new_file = tempfile.NamedTemporaryFile(dir=".", suffix=".zck", delete=False)
+    try:
+        range_files = [(start, open(path, "rb")) for start, path in fetched]
+
+        def write(data):
+            new_file.write(data)
+            for hasher in hashers.values():
+                hasher.update(data)
+
+        write(header_data[: header.size])
+        for chunk in header.chunks:
+            if not chunk.length:
+                continue
+            if chunk.checksum in reusable:
+                old_file.seek(reusable[chunk.checksum])
+                data = old_file.read(chunk.length)
+            else:
+                start, range_file = next(
+                    (start, f) for start, f in reversed(range_files) if start <= chunk.offset
+                )
+                range_file.seek(chunk.offset - start)
+                data = range_file.read(chunk.length)
+            if _digest(header.chunk_checksum_type, data) != chunk.checksum:
+                raise ZchunkError("Zchunk chunk at offset {} is corrupted".format(chunk.offset))
+            write(data)
+    finally:
+        new_file.close()
+        if old_file:
+            old_file.close()
+        for _, range_file in range_files:
+            range_file.close()
+
+    for name, hasher in hashers.items():
+        if hasher.hexdigest() != expected_digests[name]:
+            raise ZchunkError("Zchunk file does not match the checksum in repomd.xml")
+    return new_file.name
+
+
+async def download_zchunk(remote, url, header_size, expected_digests, old_path=None):
+    """
+    Download a zchunk file, reusing the chunks of an older version of it.
+
+    First the header is downloaded, then only the chunks which are not in the old file are
+    fetched with HTTP range requests. Without an old file the whole file is downloaded.
+
+    Args:
+        remote (RpmRemote): The remote to download with.
+        url (str): Url of the zchunk file.
+        header_size (int): Size of the lead and header, as published in repomd.xml.
+        expected_digests (dict): {checksum type: digest} of the whole file.
+        old_path (str): Path of the zchunk file from the previous sync, or None.
+
+    Returns:
+        tuple: Path of the downloaded file and the number of bytes downloaded.
+
+    """
+    if old_path is None or not header_size:
+        downloader = remote.get_downloader(url=url, expected_digests=expected_digests)
+        result = await downloader.run()
+        return result.path, result.artifact_attributes["size"]
+
+    downloader = remote.get_downloader(
+        url=url, byte_range=(0, header_size - 1), expected_size=header_size
+    )
+    result = await downloader.run()
+    with open(result.path, "rb") as f:
+        header_data = f.read()
+    header = parse_header(header_data)
+
+    old_header = await asyncio.to_thread(read_header, old_path)
+    reusable, ranges = missing_ranges(header, old_header)
+
+    async def fetch(start, end):
+        downloader = remote.get_downloader(
+            url=url, byte_range=(start, end), expected_size=end - start + 1
+        )
+        return start, (await downloader.run()).path
+
+    fetched = await asyncio.gather(*(fetch(start, end) for start, end in ranges))
+    path = await asyncio.to_thread(
+        assemble, header_data, header, old_path, reusable, fetched, expected_digests
+    )
+    downloaded = header_size + sum(end - start + 1 for start, end in ranges)
+    log.info(
+        "Downloaded {} of {} bytes of {} ({} chunks reused)".format(
+            downloaded, os.path.getsize(path), url, len(reusable)
+        )
+    )
+    return path, downloaded
+
+
+@functools.cache
+def zchunk_supported():
+    """
+    Check whether createrepo_c was built with zchunk support.
+    """
+    with tempfile.TemporaryDirectory(dir=".") as tmpdir:
+        try:
+            zck_file = cr.CrFile(
+                os.path.join(tmpdir, "test.zck"), cr.MODE_WRITE, cr.ZCK_COMPRESSION
+            )
+            zck_file.write("zchunk")
+            zck_file.close()
+        except Exception:
+            return False
+    return True
+
+
+def decompress(path, expected_digests=None):
+    """
+    Decompress a zchunk file.
+
+    Args:
+        path (str): Path of the zchunk file.
+        expected_digests (dict): {checksum type: digest} of the uncompressed file, e.g. the
+            open-checksum from repomd.xml.
+
+    Returns:
+        str: Path of the uncompressed file.
+
+    Raises:
+        ZchunkError: If the uncompressed file does not match the expected checksum.
+
+    """
+    with tempfile.NamedTemporaryFile(dir=".", delete=False) as uncompressed_file:
+        pass
+    cr.decompress_file(path, uncompressed_file.name, cr.ZCK_COMPRESSION)
+    for name, expected_digest in (expected_digests or {}).items():
+        hasher = hashlib.new(name)
+        with open(uncompressed_file.name, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                hasher.update(block)
+        if hasher.hexdigest() != expected_digest:
+            raise ZchunkError("Uncompressed zchunk file does not match its open-checksum")
+    return uncompressed_file.name
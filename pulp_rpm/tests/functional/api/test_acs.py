@@ -75,3 +75,10 @@ def test_acs_simple(
     repo = rpm_repository_api.read(repo.pulp_href)
     present_summary = get_content_summary(repo)["present"]
     assert present_summary == content_summary
+
+    # Refresh again, the unchanged paths are skipped
+    acs_refresh = rpm_acs_api.refresh(acs.pulp_href)
+    task_group = monitor_task_group(acs_refresh.task_group)
+    for task in task_group.tasks:
+        task = monitor_task(task.pulp_href)
+        assert any(report.code == "acs.refresh.was_skipped" for report in task.progress_reports)
@@ -446,6 +446,34 @@ def test_optimize(
     assert any(report.code == "sync.was_skipped" for report in task.progress_reports)
 
 
+@pytest.mark.parallel
+@pytest.mark.parametrize("sync_policy", ["additive", "mirror_content_only"])
+def test_optimize_unchanged_packages_are_kept(
+    sync_policy, init_and_sync, rpm_repository_api, monitor_task, get_content, get_content_summary
+):
+    """Test that an optimized re-sync keeps packages unchanged since the previous sync.
+
+    Only the package removed from the repository in between is processed and added again, the
+    other packages are carried over and neither added nor removed.
+    """
+    repository, remote = init_and_sync(policy="on_demand")
+
+    content = choice(get_content(repository)["present"][RPM_PACKAGE_CONTENT_NAME])
+    response = rpm_repository_api.modify(
+        repository.pulp_href, {"remove_content_units": [content["pulp_href"]]}
+    )
+    monitor_task(response.task)
+
+    repository, _ = init_and_sync(repository=repository, remote=remote, sync_policy=sync_policy)
+    content_summary = get_content_summary(repository)
+
+    assert content_summary["present"] == RPM_FIXTURE_SUMMARY
+    assert content_summary["added"] == {RPM_PACKAGE_CONTENT_NAME: {"count": 1}}
+    assert content_summary["removed"] == {}
+    added_package = get_content(repository)["added"][RPM_PACKAGE_CONTENT_NAME][0]
+    assert added_package["pkgId"] == content["pkgId"]
+
+
 @pytest.mark.parallel
 def test_sync_advisory_new_version(init_and_sync, get_content):
     """Sync a repository and re-sync with newer version of Advisory.
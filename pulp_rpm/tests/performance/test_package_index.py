@@ -0,0 +1,165 @@
+"""Benchmark the memory used while parsing the packages of a large repository."""
+
+import logging
+import time
+import tracemalloc
+from collections import defaultdict
+
+from pulp_rpm.app.package_index import InternPool, RetainedVersions, compact_key
+
+log = logging.getLogger(__name__)
+
+PACKAGE_COUNT = 250_000
+VERSIONS_PER_NAME = 5
+
+
+def generate_packages():
+    """Yield (name, epoch, version, release, arch, pkgId, time_build) like a big primary.xml."""
+    for i in range(PACKAGE_COUNT):
+        name = f"package-{i // VERSIONS_PER_NAME}"
+        version = f"1.{i % VERSIONS_PER_NAME}"
+        pkgid = f"{i:064x}"
+        yield name, "0", version, "1.el9", "x86_64", pkgid, 1700000000 + i
+
+
+def evr_sortkey(epoch, version, release):
+    return (int(epoch), tuple(version.split(".")), tuple(release.split(".")))
+
+
+def build_plain_indices(packages):
+    """The indices as they used to be: full NEVRA strings, pkgIds and lists of versions."""
+    nevras = set()
+    checksums = set()
+    latest_build_time_by_nevra = {}
+    names = []
+    versions_by_arch_and_name = defaultdict(lambda: defaultdict(list))
+    for name, epoch, version, release, arch, pkgid, time_build in packages:
+        nevra = f"{name}-{epoch}:{version}-{release}.{arch}"
+        names.append(name)
+        latest_build_time_by_nevra[nevra] = max(
+            time_build, latest_build_time_by_nevra.get(nevra, 0)
+        )
+        nevras.add(nevra)
+        checksums.add(pkgid)
+        evr = evr_sortkey(epoch, version, release)
+        versions_by_arch_and_name[arch][name].append((evr, nevra))
+    return nevras, checksums, latest_build_time_by_nevra, names, versions_by_arch_and_name
+
+
+def build_compact_indices(packages):
+    """The compact indices used by the sync, keyed by NEVRA strings shared between them."""
+    checksums = set()
+    latest_build_time_by_nevra = {}
+    retained = RetainedVersions(1)
+    skip = set()
+    for name, epoch, version, release, arch, pkgid, time_build in packages:
+        nevra = f"{name}-{epoch}:{version}-{release}.{arch}"
+        latest_build_time_by_nevra[nevra] = max(
+            time_build, latest_build_time_by_nevra.get(nevra, 0)
+        )
+        checksums.add(compact_key(pkgid))
+        outdated = retained.add(arch, name, evr_sortkey(epoch, version, release), nevra)
+        if outdated is not None:
+            skip.add(outdated)
+    return checksums, latest_build_time_by_nevra, retained, skip
+
+
+def measure(build, packages):
+    tracemalloc.start()
+    started = time.perf_counter()
+    indices = build(packages)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del indices
+    return elapsed, peak
+
+
+def test_compact_indices_benchmark():
+    """The compact indices of a 250k package repository need less memory than the plain ones."""
+    plain_time, plain_peak = measure(build_plain_indices, generate_packages())
+    compact_time, compact_peak = measure(build_compact_indices, generate_packages())
+
+    log.info(
+        f"{PACKAGE_COUNT} packages: plain indices {plain_peak / 2**20:.1f} MiB in "
+        f"{plain_time:.2f}s, compact indices {compact_peak / 2**20:.1f} MiB in {compact_time:.2f}s"
+    )
+    assert compact_peak < plain_peak
+
+
+FILELISTS_PACKAGE_COUNT = 20_000
+VERSIONS_PER_FILELISTS_NAME = 4
+LANGUAGES = [f"lang{i}" for i in range(15)]
+
+
+def generate_filelists():
+    """
+    Yield (name, files, dependencies) like a big filelists repository, as they leave the spool.
+
+    The strings are built anew for each package, like unpickling does. The versions of a package
+    are spread over the repository, they share their files and most of their dependencies.
+    """
+    names_count = FILELISTS_PACKAGE_COUNT // VERSIONS_PER_FILELISTS_NAME
+    for i in range(FILELISTS_PACKAGE_COUNT):
+        name = f"package-{i % names_count}"
+        version = f"1.{i // names_count}"
+        files = [("", "/usr/lib64/", f"lib{name}.so.{k}") for k in range(3)]
+        files += [
+            ("", f"/usr/share/locale/{lang}/LC_MESSAGES/", f"{name}.mo") for lang in LANGUAGES
+        ]
+        files += [("", f"/usr/share/doc/{name}/", doc) for doc in ("README", "COPYING", "NEWS")]
+        files += [("", f"/usr/share/{name}/", f"file-{j}.dat") for j in range(20)]
+        files.append(("dir", "/usr/share/", name))
+        dependencies = [
+            ("".join(["libc.so.6()", "(64bit)"]), None, None, None, None, False),
+            ("".join(["libm.so.6()", "(64bit)"]), None, None, None, None, False),
+            ("".join(["rtld(GNU_HASH)"]), None, None, None, None, False),
+            (f"{name}-common", "EQ", "0", version, "1.el9", False),
+            (name, "EQ", "0", version, "1.el9", False),
+            (f"lib{name}.so.0()(64bit)", None, None, None, None, False),
+        ]
+        yield name, files, dependencies
+
+
+def keep_per_name_caches(packages):
+    """Intern the file entries the way the sync used to, with caches cleared on a new name."""
+    string_cache = {}
+    tuple_cache = {}
+    last_seen_name = None
+    kept = []
+    for name, files, dependencies in packages:
+        if name != last_seen_name:
+            string_cache.clear()
+            tuple_cache.clear()
+        files = [
+            tuple_cache.setdefault(entry, entry)
+            for entry in (
+                (typ, string_cache.setdefault(parent_dir, parent_dir), base)
+                for typ, parent_dir, base in files
+            )
+        ]
+        kept.append((files, dependencies))
+        last_seen_name = name
+    return kept
+
+
+def keep_interned(packages):
+    """Intern the file entries and dependencies with the sync-wide pool."""
+    pool = InternPool()
+    kept = []
+    for _, files, dependencies in packages:
+        kept.append((pool.intern_files(files), pool.intern_dependencies(dependencies)))
+    return kept
+
+
+def test_intern_pool_benchmark():
+    """The packages of a large filelists repository need less memory with the sync-wide pool."""
+    cached_time, cached_peak = measure(keep_per_name_caches, generate_filelists())
+    pooled_time, pooled_peak = measure(keep_interned, generate_filelists())
+
+    log.info(
+        f"{FILELISTS_PACKAGE_COUNT} packages with their files: per-name caches "
+        f"{cached_peak / 2**20:.1f} MiB in {cached_time:.2f}s, sync-wide pool "
+        f"{pooled_peak / 2**20:.1f} MiB in {pooled_time:.2f}s"
+    )
+    assert pooled_peak < cached_peak
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
+import createrepo_c as cr
+from django.test import TransactionTestCase
+
+from pulpcore.plugin.stages import DeclarativeContent
+
+from pulp_rpm.app.models import Package, RpmRemote, RpmRepository, RpmSyncCheckpoint
+from pulp_rpm.app.tasks import synchronizing
+from pulp_rpm.app.tasks.synchronizing import (
+    RpmCarryOverContent,
+    RpmCheckpointSaver,
+    RpmFirstStage,
+)
+
+
+class FakeProgressReport:
+    """A ProgressReport which is not saved, the tests don't run in a task."""
+
+    def __init__(self, **kwargs):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def aincrement(self):
+        pass
+
+    async def asave(self):
+        pass
+
+
+def make_package(name):
+    """A createrepo_c package as found in the primary.xml of a repository."""
+    pkg = cr.Package()
+    pkg.name = name
+    pkg.epoch = "0"
+    pkg.version = "1.0"
+    pkg.release = "1"
+    pkg.arch = "noarch"
+    pkg.pkgId = "{}-checksum".format(name)
+    pkg.checksum_type = "sha256"
+    pkg.summary = name
+    pkg.description = name
+    pkg.url = "https://example.com/{}".format(name)
+    pkg.time_file = 1700000000
+    pkg.time_build = 1700000000
+    pkg.rpm_license = "MIT"
+    pkg.rpm_vendor = ""
+    pkg.rpm_group = "Unspecified"
+    pkg.rpm_buildhost = "localhost"
+    pkg.rpm_sourcerpm = "{}-1.0-1.src.rpm".format(name)
+    pkg.rpm_header_start = 4504
+    pkg.rpm_header_end = 5000
+    pkg.rpm_packager = ""
+    pkg.size_package = 6000
+    pkg.size_installed = 100
+    pkg.size_archive = 400
+    pkg.location_href = "Packages/{}-1.0-1.noarch.rpm".format(name)
+    return pkg
+
+
+class TestRpmSyncCheckpoint(TransactionTestCase):
+    """Test resuming an interrupted sync from its checkpoint."""
+
+    def setUp(self):
+        """Set up a repository, a remote and the metadata of two packages."""
+        self.repository = RpmRepository.objects.create(name="checkpoint-repo")
+        self.remote = RpmRemote.objects.create(
+            name="checkpoint-remote", url="https://example.com/repo/", policy="on_demand"
+        )
+
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.primary_xml_path = os.path.join(tmp_dir.name, "primary.xml")
+        primary = cr.PrimaryXmlFile(self.primary_xml_path, cr.NO_COMPRESSION)
+        primary.set_num_of_pkgs(2)
+        for name in ("first", "second"):
+            primary.add_pkg(make_package(name))
+        primary.close()
+
+        # the parser spools the packages to the working directory
+        cwd = os.getcwd()
+        os.chdir(tmp_dir.name)
+        self.addCleanup(os.chdir, cwd)
+
+        patcher = mock.patch.object(synchronizing, "ProgressReport", FakeProgressReport)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def parse_packages(self, checkpoint):
+        """Run the package parsing of a sync, return the first stage and what it emitted."""
+        stage = RpmFirstStage(
+            self.remote,
+            self.repository,
+            deferred_download=True,
+            mirror_metadata=False,
+            optimize=True,
+            checkpoint=checkpoint,
+        )
+        emitted = []
+
+        async def put(declarative_content):
+            emitted.append(declarative_content)
+
+        stage.put = put
+        primary_xml = SimpleNamespace(path=self.primary_xml_path)
+        asyncio.run(stage.parse_packages(primary_xml, None, None, modulemd_list=[]))
+        return stage, emitted
+
+    def interrupted_sync(self):
+        """Sync the metadata until the first package is saved, return the checkpoint."""
+        checkpoint = RpmSyncCheckpoint.for_sync(self.repository, self.remote, "repomd-checksum")
+        _, emitted = self.parse_packages(checkpoint)
+        self.assertEqual([dc.content.name for dc in emitted], ["first", "second"])
+
+        # the pipeline only got as far as saving the first package
+        saved = emitted[0]
+        saved.content.save()
+        RpmCheckpointSaver(checkpoint).record_packages([saved])
+        return checkpoint
+
+    def test_retry_skips_saved_packages(self):
+        """A retry of the same metadata resumes with the packages which were saved."""
+        checkpoint = self.interrupted_sync()
+        saved = Package.objects.get(name="first")
+
+        retry_checkpoint = RpmSyncCheckpoint.for_sync(
+            self.repository, self.remote, "repomd-checksum"
+        )
+        self.assertEqual(retry_checkpoint.pk, checkpoint.pk)
+        self.assertEqual(retry_checkpoint.get_packages(), {"first-checksum": saved.pk})
+
+        stage, emitted = self.parse_packages(retry_checkpoint)
+        self.assertEqual([dc.content.pkgId for dc in emitted], ["second-checksum"])
+        self.assertEqual(stage.resumed_package_pks, [saved.pk])
+
+    def test_changed_metadata_starts_over(self):
+        """A sync of other metadata doesn't resume, the checkpoint is replaced."""
+        checkpoint = self.interrupted_sync()
+
+        new_checkpoint = RpmSyncCheckpoint.for_sync(
+            self.repository, self.remote, "other-repomd-checksum"
+        )
+        self.assertNotEqual(new_checkpoint.pk, checkpoint.pk)
+        self.assertFalse(RpmSyncCheckpoint.objects.filter(pk=checkpoint.pk).exists())
+        self.assertEqual(new_checkpoint.get_packages(), {})
+
+        stage, emitted = self.parse_packages(new_checkpoint)
+        self.assertEqual(len(emitted), 2)
+        self.assertEqual(stage.resumed_package_pks, [])
+
+    def test_only_new_packages_are_recorded(self):
+        """Packages which were in the repository before the sync are not recorded."""
+        checkpoint = RpmSyncCheckpoint.for_sync(self.repository, self.remote, "repomd-checksum")
+        _, emitted = self.parse_packages(checkpoint)
+        for declarative_content in emitted:
+            self.assertTrue(declarative_content.extra_data.get("resumable"))
+            declarative_content.content.save()
+        existing = DeclarativeContent(content=emitted[0].content)
+
+        RpmCheckpointSaver(checkpoint).record_packages([existing, emitted[1]])
+        self.assertEqual(checkpoint.get_packages(), {"second-checksum": emitted[1].content.pk})
+
+    def test_resumed_packages_are_carried_over(self):
+        """The resumed packages are added to the new version, also outside of mirror mode."""
+        checkpoint = self.interrupted_sync()
+        saved = Package.objects.get(name="first")
+        first_stage, _ = self.parse_packages(checkpoint)
+
+        stage = RpmCarryOverContent(first_stage, mirror=False)
+        emitted = []
+
+        async def items():
+            return
+            yield
+
+        async def put(declarative_content):
+            emitted.append(declarative_content)
+
+        stage.items = items
+        stage.put = put
+        asyncio.run(stage.run())
+        self.assertEqual([dc.content.pk for dc in emitted], [saved.pk])
+        self.assertFalse(emitted[0].content._state.adding)
@@ -0,0 +1,99 @@
+import asyncio
+
+from pulp_rpm.app import concurrency
+from pulp_rpm.app.concurrency import LARGE_DOWNLOAD_SIZE, AdaptiveConcurrency, HostConcurrency
+
+
+def test_small_downloads_are_admitted_first():
+    """Waiting large downloads let smaller ones pass, up to LARGE_DOWNLOAD_DELAY of them."""
+    admitted = []
+
+    async def download(host, name, size):
+        await host.acquire(size)
+        admitted.append(name)
+        await asyncio.sleep(0)
+        host.release()
+
+    async def main():
+        host = HostConcurrency(1, 1, 1)
+        await host.acquire()
+        tasks = [asyncio.create_task(download(host, "large", LARGE_DOWNLOAD_SIZE))]
+        for i in range(concurrency.LARGE_DOWNLOAD_DELAY + 5):
+            tasks.append(asyncio.create_task(download(host, f"small-{i}", 1024)))
+        await asyncio.sleep(0)
+        host.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+    assert admitted[0] == "small-0"
+    assert 0 < admitted.index("large") <= concurrency.LARGE_DOWNLOAD_DELAY
+    assert len(admitted) == concurrency.LARGE_DOWNLOAD_DELAY + 6
+
+
+def test_cancelled_waiter_does_not_hold_a_slot():
+    """A download cancelled while waiting for a slot doesn't take it."""
+
+    async def main():
+        host = HostConcurrency(1, 1, 1)
+        await host.acquire()
+        waiter = asyncio.create_task(host.acquire())
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        host.release()
+        assert host.in_flight == 0
+        await host.acquire()
+        assert host.in_flight == 1
+
+    asyncio.run(main())
+
+
+def test_limit_adapts(monkeypatch):
+    """The limit grows with the throughput, halves on errors, and stays within its bounds."""
+    now = [0.0]
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: now[0])
+    host = HostConcurrency(4, 2, 6)
+
+    def window(size, latency=0.1):
+        for _ in range(max(host.limit, 4)):
+            now[0] += 1
+            host.record(size, latency)
+
+    window(1000)
+    assert host.limit == 5
+    window(2000)
+    assert host.limit == 6
+    window(3000)
+    assert host.limit == 6
+
+    for _ in range(6):
+        host.record_error()
+    assert host.limit == 3
+    for _ in range(4):
+        host.record_error()
+    assert host.limit == 2
+
+    # more throughput, but the downloads queue up at the host
+    window(10000, latency=1.0)
+    assert host.limit == 2
+    window(20000, latency=0.1)
+    assert host.limit == 3
+    window(5000, latency=0.1)
+    assert host.limit == 2
+
+
+def test_adaptive_concurrency_per_host():
+    """Each host of a loop gets its own limit."""
+    adaptive = AdaptiveConcurrency(7, 2, 32)
+
+    async def hosts():
+        return (
+            adaptive.for_url("https://mirror.example.com/repo/foo.rpm"),
+            adaptive.for_url("https://mirror.example.com/repo/bar.rpm"),
+            adaptive.for_url("https://cdn.example.com/repo/foo.rpm"),
+        )
+
+    first, same, other = asyncio.run(hosts())
+    assert first is same
+    assert other is not first
+    assert first.limit == 7
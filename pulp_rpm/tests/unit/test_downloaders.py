@@ -0,0 +1,90 @@
+import asyncio
+import os
+
+from pulp_rpm.app import downloaders
+from pulp_rpm.app.downloaders import UlnSessionKeys, link_file
+
+
+def test_uln_session_keys_expire(monkeypatch):
+    """A session key is shared until it expires."""
+    now = [1000.0]
+    monkeypatch.setattr(downloaders.time, "monotonic", lambda: now[0])
+    keys = UlnSessionKeys(lifetime=60)
+    account = keys.account("https://linux-update.oracle.com/rpc/api", "user", "secret")
+    assert keys.get(account) is None
+
+    keys.set(account, "key")
+    assert keys.get(account) == "key"
+    now[0] += 59
+    assert keys.get(account) == "key"
+    now[0] += 1
+    assert keys.get(account) is None
+
+
+def test_uln_session_keys_accounts():
+    """Keys are not shared by different credentials, and the password is not kept."""
+    keys = UlnSessionKeys()
+    account = keys.account("https://linux-update.oracle.com/rpc/api", "user", "secret")
+    other = keys.account("https://linux-update.oracle.com/rpc/api", "user", "other")
+    keys.set(account, "key")
+    assert keys.get(other) is None
+    assert "secret" not in account
+
+
+def test_uln_session_keys_invalidate():
+    """A rejected key is forgotten, unless it was renewed in the meantime."""
+    keys = UlnSessionKeys()
+    account = keys.account("https://linux-update.oracle.com/rpc/api", "user", "secret")
+    keys.set(account, "old")
+    keys.invalidate(account, "old")
+    assert keys.get(account) is None
+
+    keys.set(account, "new")
+    keys.invalidate(account, "old")
+    assert keys.get(account) == "new"
+
+
+def test_uln_session_keys_lock_per_loop():
+    """The login lock of an account is shared within an event loop, not across loops."""
+    keys = UlnSessionKeys()
+    account = keys.account("https://linux-update.oracle.com/rpc/api", "user", "secret")
+
+    async def get_locks():
+        return keys.lock(account), keys.lock(account)
+
+    first, same = asyncio.run(get_locks())
+    assert first is same
+    other, _ = asyncio.run(get_locks())
+    assert other is not first
+
+
+def test_link_file_hardlink(tmp_path):
+    """With hardlinks allowed, a file on the same filesystem is always linked."""
+    source = tmp_path / "foo.rpm"
+    source.write_bytes(b"rpm")
+    destination = tmp_path / "artifact"
+    assert link_file(str(source), str(destination), hardlink=True)
+    assert destination.read_bytes() == b"rpm"
+
+
+def test_link_file_unsupported(tmp_path, monkeypatch):
+    """Without reflink support nor hardlinks allowed, nothing is created."""
+
+    def ioctl(*args):
+        raise OSError("not supported")
+
+    monkeypatch.setattr(downloaders.fcntl, "ioctl", ioctl)
+    source = tmp_path / "foo.rpm"
+    source.write_bytes(b"rpm")
+    destination = tmp_path / "artifact"
+    assert not link_file(str(source), str(destination))
+    assert not destination.exists()
+    assert link_file(str(source), str(destination), hardlink=True)
+    assert os.stat(source).st_ino == os.stat(destination).st_ino
+
+
+def test_link_file_missing_source(tmp_path):
+    """A missing source is left to the regular download to report."""
+    destination = tmp_path / "artifact"
+    assert not link_file(str(tmp_path / "missing.rpm"), str(destination), hardlink=True)
+    assert not destination.exists()
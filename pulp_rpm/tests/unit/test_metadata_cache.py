@@ -0,0 +1,60 @@
+import hashlib
+import os
+
+from pulp_rpm.app.metadata_cache import MetadataCache
+
+
+def write_file(path, content):
+    with open(path, "wb") as f:
+        f.write(content)
+    return path
+
+
+def test_add_and_get(tmp_path, monkeypatch):
+    """A cached file is handed out as a copy in the current directory."""
+    monkeypatch.chdir(tmp_path)
+    cache = MetadataCache(str(tmp_path / "cache"), max_size=1024)
+    content = b"<metadata/>"
+    checksum = hashlib.sha256(content).hexdigest()
+
+    assert cache.get("sha256", checksum) is None
+    cache.add("sha256", checksum, write_file(tmp_path / "primary.xml", content))
+
+    path = cache.get("sha256", checksum)
+    assert os.path.dirname(path) == str(tmp_path)
+    with open(path, "rb") as f:
+        assert f.read() == content
+
+
+def test_corrupted_file_is_removed(tmp_path, monkeypatch):
+    """A cached file which doesn't match its checksum is not used."""
+    monkeypatch.chdir(tmp_path)
+    cache = MetadataCache(str(tmp_path / "cache"), max_size=1024)
+    checksum = hashlib.sha256(b"<metadata/>").hexdigest()
+    cache.add("sha256", checksum, write_file(tmp_path / "primary.xml", b"<corrupted/>"))
+
+    assert cache.get("sha256", checksum) is None
+    assert not os.path.exists(tmp_path / "cache" / "sha256" / checksum)
+
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    """Files used least recently are removed once the cache exceeds its size."""
+    monkeypatch.chdir(tmp_path)
+    cache = MetadataCache(str(tmp_path / "cache"), max_size=1024)
+    checksums = []
+    for i in range(3):
+        content = bytes([i]) * 100
+        checksum = hashlib.sha256(content).hexdigest()
+        cache.add("sha256", checksum, write_file(tmp_path / f"file{i}", content))
+        # make the order of use unambiguous
+        cached_path = tmp_path / "cache" / "sha256" / checksum
+        os.utime(cached_path, (i, i))
+        checksums.append(checksum)
+    os.utime(tmp_path / "cache" / "sha256" / checksums[0], (10, 10))
+
+    cache.max_size = 250
+    cache.evict()
+
+    assert cache.get("sha256", checksums[0]) is not None
+    assert cache.get("sha256", checksums[1]) is None
+    assert cache.get("sha256", checksums[2]) is not None
@@ -0,0 +1,80 @@
+import hashlib
+
+from pulp_rpm.app.metalink import is_metalink, parse_metalink, verify_repomd
+
+REPOMD = b"<repomd><revision>1700000000</revision></repomd>"
+OLD_REPOMD = b"<repomd><revision>1600000000</revision></repomd>"
+
+sample_metalink = f"""<?xml version="1.0" encoding="utf-8"?>
+<metalink version="3.0" xmlns="http://www.metalinker.org/" type="dynamic"
+    xmlns:mm0="http://fedorahosted.org/mirrormanager">
+ <files>
+  <file name="repomd.xml">
+   <mm0:timestamp>1700000000</mm0:timestamp>
+   <size>{len(REPOMD)}</size>
+   <verification>
+    <hash type="md5">{hashlib.md5(REPOMD).hexdigest()}</hash>
+    <hash type="sha256">{hashlib.sha256(REPOMD).hexdigest()}</hash>
+   </verification>
+   <mm0:alternates>
+    <mm0:alternate>
+     <mm0:timestamp>1600000000</mm0:timestamp>
+     <verification>
+      <hash type="sha256">{hashlib.sha256(OLD_REPOMD).hexdigest()}</hash>
+     </verification>
+    </mm0:alternate>
+   </mm0:alternates>
+   <resources maxconnections="1">
+    <url protocol="rsync" type="rsync" preference="100">rsync://a.example/epel/repodata/repomd.xml</url>
+    <url protocol="https" type="https" preference="99">https://b.example/epel/repodata/repomd.xml</url>
+    <url protocol="https" type="https" preference="100">https://c.example/epel/repodata/repomd.xml</url>
+    <url protocol="http" type="http" preference="99">http://d.example/epel/repodata/repomd.xml</url>
+   </resources>
+  </file>
+ </files>
+</metalink>
+"""
+
+
+def test_parse_metalink(tmp_path):
+    """The checksums and the mirrors of repomd.xml are read from the metalink."""
+    path = tmp_path / "metalink"
+    path.write_text(sample_metalink)
+
+    assert is_metalink(path)
+    metalink = parse_metalink(path)
+
+    assert metalink.size == len(REPOMD)
+    assert metalink.hashes[0]["sha256"] == hashlib.sha256(REPOMD).hexdigest()
+    assert len(metalink.hashes) == 2
+    # most preferred first, only http(s), the metalink's order among equal preferences
+    assert metalink.mirror_urls == [
+        "https://c.example/epel/",
+        "https://b.example/epel/",
+        "http://d.example/epel/",
+    ]
+
+
+def test_plain_mirrorlist_is_not_a_metalink(tmp_path):
+    """A line-based mirrorlist is not mistaken for a metalink."""
+    path = tmp_path / "mirrorlist"
+    path.write_text("# comment\nhttps://a.example/epel/\n")
+
+    assert not is_metalink(path)
+
+
+def test_verify_repomd(tmp_path):
+    """A repomd.xml matching the current checksums or an alternate one is accepted."""
+    metalink_path = tmp_path / "metalink"
+    metalink_path.write_text(sample_metalink)
+    metalink = parse_metalink(metalink_path)
+
+    repomd_path = tmp_path / "repomd.xml"
+    repomd_path.write_bytes(REPOMD)
+    assert verify_repomd(metalink, repomd_path)
+
+    repomd_path.write_bytes(OLD_REPOMD)
+    assert verify_repomd(metalink, repomd_path)
+
+    repomd_path.write_bytes(b"<repomd><revision>1</revision></repomd>")
+    assert not verify_repomd(metalink, repomd_path)
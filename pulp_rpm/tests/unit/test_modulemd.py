@@ -2,7 +2,12 @@ import os
 
 import yaml
 
-from pulp_rpm.app.modulemd import disable_pyyaml_magic_casting, parse_modular
+from pulp_rpm.app.modulemd import (
+    ModulemdLoader,
+    disable_pyyaml_magic_casting,
+    parse_modular,
+    split_modulemd_file,
+)
 
 sample_file_data = """
 ---
@@ -173,3 +178,28 @@ def test_disabling_pyyaml_magic_casting():
     assert result["inty"] == 83
     assert result["dicty"]["inty"] == 83
     assert result["listy"]["inty"] == 83
+
+
+def test_modulemd_loader_keeps_unquoted_numbers():
+    """The modulemd loader never casts unquoted numbers, without affecting SafeLoader."""
+    text = """
+  floaty: 00.123
+  inty: 00123
+  listy:
+    - 1.10
+  """
+    result = yaml.load(text, Loader=ModulemdLoader)
+    assert result == {"floaty": "00.123", "inty": "00123", "listy": ["1.10"]}
+    assert yaml.load(text, Loader=yaml.SafeLoader)["inty"] == 83
+
+
+def test_split_modulemd_file(tmp_path):
+    """Documents are split at the lines starting them and normalized."""
+    os.chdir(tmp_path)
+    with open("modulemd.yaml", "w") as file:
+        file.write("document: first\n...\n---\ndocument: second\ndata: ---\n...\n")
+
+    assert list(split_modulemd_file("modulemd.yaml")) == [
+        "---\ndocument: first\n...",
+        "---\ndocument: second\ndata: ---\n...",
+    ]
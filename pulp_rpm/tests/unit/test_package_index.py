@@ -0,0 +1,42 @@
+from pulp_rpm.app.package_index import InternPool, RetainedVersions
+
+
+def test_retained_versions():
+    """Only the newest versions are retained, among equal versions the first seen."""
+    retained = RetainedVersions(2)
+    assert retained.add("x86_64", "foo", (1,), "foo-1") is None
+    assert retained.add("x86_64", "foo", (3,), "foo-3") is None
+    assert retained.add("x86_64", "foo", (2,), "foo-2") == "foo-1"
+    assert retained.add("x86_64", "foo", (0,), "foo-0") == "foo-0"
+    assert retained.add("i686", "foo", (0,), "foo-0.i686") is None
+    assert retained.add("x86_64", "foo", (3,), "foo-3-again") == "foo-2"
+    assert retained.add("x86_64", "foo", (3,), "foo-3-once-more") == "foo-3-once-more"
+
+
+def test_intern_pool_shares_values():
+    """Equal file entries and dependencies of different packages become the same objects."""
+    pool = InternPool()
+    first = pool.intern_files([("", "/usr/lib64/" + "foo", "libfoo.so")])
+    second = pool.intern_files([("", "/usr/lib64/" + "foo", "libfoo.so")])
+    assert first == second
+    assert first[0] is second[0]
+
+    requires = [("libc.so.6()(64bit)", None, None, None, None, False)]
+    first = pool.intern_dependencies([tuple(dep) for dep in requires])
+    second = pool.intern_dependencies([("libc.so." + "6()(64bit)", None, None, None, None, False)])
+    assert first == second
+    assert first[0] is second[0]
+
+
+def test_intern_pool_evicts_least_recently_used():
+    """The pool stays bounded, dropping the values which were not used for the longest time."""
+    pool = InternPool(max_size=4)
+    a = pool.intern("a" * 10)
+    pool.intern("b" * 10)
+    pool.intern("c" * 10)
+    pool.intern("a" * 10)
+    pool.intern("d" * 10)
+    assert len(pool) == 3
+    assert pool.intern("a" * 10) is a
+    b = "b" * 10
+    assert pool.intern(b) is b
@@ -0,0 +1,341 @@
+import asyncio
+import os
+import tempfile
+import threading
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from pulpcore.plugin.models import RemoteArtifact
+
+from pulp_rpm.app.downloaders import NotModified
+from pulp_rpm.app.tasks import synchronizing
+from pulp_rpm.app.tasks.synchronizing import (
+    MetadataFetchCache,
+    MirroringStore,
+    RpmCarryOverContent,
+    SyncTimings,
+    is_unmodified_since_last_sync,
+    rank_mirrors,
+    run_concurrently,
+)
+
+
+class TestRunConcurrently(TestCase):
+    """Test the helper used to probe and sync sub-repos concurrently."""
+
+    def test_results_keep_order(self):
+        """Results are returned in the order of the callables, whatever the worker count."""
+        calls = [lambda i=i: i * 2 for i in range(10)]
+        self.assertEqual([i * 2 for i in range(10)], run_concurrently(calls))
+        self.assertEqual([i * 2 for i in range(10)], run_concurrently(calls, max_workers=4))
+
+    def test_single_worker_runs_in_current_thread(self):
+        """With one worker everything runs in the calling thread, as before."""
+        calls = [threading.get_ident for _ in range(3)]
+        self.assertEqual({threading.get_ident()}, set(run_concurrently(calls)))
+
+    def test_exceptions_are_raised(self):
+        """An exception in one of the threads is raised in the caller."""
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            run_concurrently([lambda: 1, fail], max_workers=2)
+
+
+class TestMetadataFetchCache(TestCase):
+    """Test the per-sync cache of repomd.xml and treeinfo."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "repomd.xml")
+        with open(self.path, "w") as f:
+            f.write("<repomd/>")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_result_is_reused(self):
+        """A cached download result is returned for the same url only."""
+        cache = MetadataFetchCache()
+        result = SimpleNamespace(path=self.path)
+        cache.add_result("http://example.com/repodata/repomd.xml", result)
+
+        self.assertIs(result, cache.get_result("http://example.com/repodata/repomd.xml"))
+        self.assertIsNone(cache.get_result("http://example.org/repodata/repomd.xml"))
+
+    def test_treeinfo(self):
+        """Treeinfo data is cached per repository url, including 'no treeinfo'."""
+        cache = MetadataFetchCache()
+        self.assertIsNone(cache.get_treeinfo("http://example.com/"))
+        self.assertEqual({}, cache.add_treeinfo("http://example.com/", {}))
+        self.assertEqual({}, cache.get_treeinfo("http://example.com/"))
+
+
+class TestRankMirrors(TestCase):
+    """Test how mirrors from a mirrorlist are ranked."""
+
+    def test_fastest_mirror_wins(self):
+        """Among mirrors serving the same metadata, the lowest latency wins."""
+        probes = [("http://slow/", 2.5, "1700000000"), ("http://fast/", 0.1, "1700000000")]
+        self.assertEqual(["http://fast/", "http://slow/"], rank_mirrors(probes))
+
+    def test_freshest_mirror_wins(self):
+        """A mirror serving an older revision is only used if nothing fresher answered."""
+        probes = [("http://stale/", 0.1, "1600000000"), ("http://fresh/", 1.0, "1700000000")]
+        self.assertEqual(["http://fresh/", "http://stale/"], rank_mirrors(probes))
+
+    def test_non_numeric_revisions(self):
+        """Revisions which cannot be compared leave only the latency to rank by."""
+        probes = [("http://a/", 0.5, "abc"), ("http://b/", 0.2, None)]
+        self.assertEqual(["http://b/", "http://a/"], rank_mirrors(probes))
+        self.assertEqual([], rank_mirrors([]))
+
+
+class TestSyncTimings(TestCase):
+    """Test the collection of per-stage sync timings."""
+
+    class Stage:
+        """A stand-in for a pipeline stage passing batches of items through."""
+
+        def __init__(self, batches):
+            self.in_batches = batches
+            self.out = []
+
+        async def items(self):
+            for batch in self.in_batches:
+                for item in batch:
+                    yield item
+
+        async def batches(self, minsize=500):
+            for batch in self.in_batches:
+                yield batch
+
+        async def put(self, item):
+            self.out.append(item)
+
+        async def run(self):
+            async for batch in self.batches():
+                for item in batch:
+                    await self.put(item)
+
+    def test_instrument(self):
+        """Items and peak batch size of an instrumented stage are recorded."""
+        timings = SyncTimings()
+        stage = timings.instrument(self.Stage([[1, 2], [3, 4, 5], [6]]))
+        asyncio.run(stage.run())
+
+        self.assertEqual([1, 2, 3, 4, 5, 6], stage.out)
+        stats = timings.summary()["Stage"]
+        self.assertEqual(6, stats["items"])
+        self.assertEqual(3, stats["peak_batch_size"])
+        self.assertGreaterEqual(stats["wall_time"], stats["input_wait"])
+
+    def test_phase(self):
+        """The items of a phase are counted from the counter and what the caller adds."""
+        timings = SyncTimings()
+        emitted = [0]
+        with timings.phase("parse_packages", lambda: emitted[0]) as stats:
+            emitted[0] += 4
+            stats["items"] += 1
+
+        self.assertEqual(5, timings.summary()["parse_packages"]["items"])
+
+
+class TestMirroringStore(TestCase):
+    """Test the task-scoped store of the data needed to mirror the metadata."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = MirroringStore(os.path.join(self.tmpdir.name, "mirroring.sqlite3"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_metadata_files(self):
+        """Metadata files are stored per repository, the last path stored wins."""
+        self.store.add_metadata_file("repo1", "repodata/repomd.xml", "/tmp/a")
+        self.store.add_metadata_file("repo1", "repodata/repomd.xml", "/tmp/b")
+        self.store.add_metadata_file("repo2", "repodata/repomd.xml.asc", "/tmp/c")
+
+        self.assertEqual(
+            [("repodata/repomd.xml", "/tmp/b")], self.store.get_metadata_files("repo1")
+        )
+        self.assertTrue(self.store.has_metadata_file("repo2", "repodata/repomd.xml.asc"))
+        self.assertFalse(self.store.has_metadata_file("repo1", "repodata/repomd.xml.asc"))
+
+    def test_package_locations(self):
+        """A package can have several locations, each stored once."""
+        self.store.add_package_location("repo1", "abc", "Packages/a/a.rpm")
+        self.store.add_package_location("repo1", "abc", "Packages/a/a.rpm")
+        self.store.add_package_location("repo1", "abc", "other/a.rpm")
+        self.store.add_package_location("repo2", "def", "Packages/d/d.rpm")
+
+        locations = self.store.get_package_locations("repo1", ["abc", "def"])
+        self.assertEqual({"abc"}, set(locations))
+        self.assertEqual({"Packages/a/a.rpm", "other/a.rpm"}, set(locations["abc"]))
+
+    def test_many_package_locations(self):
+        """Lookups of more packages than fit in one query are batched."""
+        pkgids = [str(i) for i in range(MirroringStore.QUERY_BATCH_SIZE * 2 + 1)]
+        for pkgid in pkgids:
+            self.store.add_package_location("repo1", pkgid, f"{pkgid}.rpm")
+
+        self.assertEqual(len(pkgids), len(self.store.get_package_locations("repo1", pkgids)))
+
+
+class TestRpmCarryOverContent(TestCase):
+    """Test the stage which keeps the packages unchanged since the previous sync."""
+
+    def run_stage(self, mirror):
+        first_stage = SimpleNamespace(
+            unchanged_package_pks=["pk1", "pk2"],
+            moved_remote_artifacts=[
+                ("ra1", "https://example.com/a.rpm"),
+                ("ra2", "https://example.com/b.rpm"),
+                ("ra3", "https://example.com/c.rpm"),
+            ],
+            resumed_package_pks=[],
+        )
+        stage = RpmCarryOverContent(first_stage, mirror=mirror)
+        passed = SimpleNamespace(content="passed through")
+        out = []
+
+        async def items():
+            yield passed
+
+        async def put(item):
+            out.append(item)
+
+        stage.items = items
+        stage.put = put
+        with (
+            mock.patch.object(synchronizing, "EXISTING_CONTENT_BATCH_SIZE", 2),
+            mock.patch.object(RemoteArtifact.objects, "bulk_update") as bulk_update,
+        ):
+            asyncio.run(stage.run())
+        return passed, out, bulk_update
+
+    def test_moved_remote_artifacts(self):
+        """The urls of moved packages are updated in bulk, in batches."""
+        _, _, bulk_update = self.run_stage(mirror=False)
+
+        updated = [
+            [(remote_artifact.pk, remote_artifact.url) for remote_artifact in call.args[0]]
+            for call in bulk_update.call_args_list
+        ]
+        self.assertEqual(
+            [
+                [("ra1", "https://example.com/a.rpm"), ("ra2", "https://example.com/b.rpm")],
+                [("ra3", "https://example.com/c.rpm")],
+            ],
+            updated,
+        )
+        for call in bulk_update.call_args_list:
+            self.assertEqual(["url"], call.kwargs["fields"])
+
+    def test_unchanged_packages_are_not_emitted(self):
+        """Outside of mirror mode, unchanged packages never reach content association."""
+        passed, out, _ = self.run_stage(mirror=False)
+
+        self.assertEqual([passed], out)
+
+    def test_unchanged_packages_in_mirror_mode(self):
+        """In mirror mode, a saved placeholder is emitted for each unchanged package."""
+        passed, out, _ = self.run_stage(mirror=True)
+
+        self.assertIs(passed, out[0])
+        self.assertEqual(["pk1", "pk2"], [dc.content.pk for dc in out[1:]])
+        self.assertTrue(all(not dc.content._state.adding for dc in out[1:]))
+
+
+class TestIsUnmodifiedSinceLastSync(TestCase):
+    """Test skipping a sync with conditional requests for repomd.xml and treeinfo."""
+
+    REPOMD_URL = "https://example.com/repo/repodata/repomd.xml"
+    TREEINFO_URL = "https://example.com/repo/.treeinfo"
+    MISSING_TREEINFO_URL = "https://example.com/repo/treeinfo"
+
+    class Remote:
+        url = "https://example.com/repo/"
+        policy = "immediate"
+
+        def __init__(self, responses):
+            self.responses = responses
+            self.requests = {}
+
+        def get_downloader(self, url, **kwargs):
+            self.requests[url] = kwargs
+            response = self.responses[url]
+
+            def fetch():
+                if isinstance(response, Exception):
+                    raise response
+                return response
+
+            return SimpleNamespace(fetch=fetch)
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.repository = SimpleNamespace(
+            last_sync_details={
+                "url": self.Remote.url,
+                "download_policy": "immediate",
+                "sync_policy": "additive",
+                "most_recent_version": 3,
+                "revision": "1700000000",
+                "repomd_checksum": "a" * 64,
+                "treeinfo_checksum": "b" * 64,
+                "retain_package_versions": 0,
+                "http_validators": {
+                    self.REPOMD_URL: {"etag": '"repomd-1"', "last_modified": None},
+                    self.TREEINFO_URL: {"etag": None, "last_modified": "Mon, 02 Jan 2023"},
+                    self.MISSING_TREEINFO_URL: {"missing": True},
+                },
+            },
+            latest_version=lambda: SimpleNamespace(number=3),
+            retain_package_versions=0,
+        )
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmpdir.cleanup()
+
+    def test_not_modified(self):
+        """The sync is skipped when every file is answered with 304, or 404 again."""
+        remote = self.Remote(
+            {
+                self.REPOMD_URL: NotModified(),
+                self.TREEINFO_URL: NotModified(),
+                self.MISSING_TREEINFO_URL: FileNotFoundError(),
+            }
+        )
+
+        self.assertTrue(is_unmodified_since_last_sync(remote, self.repository, "additive"))
+        self.assertEqual(
+            {"etag": '"repomd-1"', "last_modified": None},
+            remote.requests[self.REPOMD_URL]["validators"],
+        )
+
+    def test_changed_etag(self):
+        """The sync is not skipped when the server sends a new repomd.xml."""
+        remote = self.Remote(
+            {
+                self.REPOMD_URL: SimpleNamespace(headers={"ETag": '"repomd-2"'}),
+                self.TREEINFO_URL: NotModified(),
+                self.MISSING_TREEINFO_URL: FileNotFoundError(),
+            }
+        )
+
+        self.assertFalse(is_unmodified_since_last_sync(remote, self.repository, "additive"))
+
+    def test_changed_sync_parameters(self):
+        """Nothing is requested when the sync parameters changed since the previous sync."""
+        remote = self.Remote({})
+
+        self.assertFalse(is_unmodified_since_last_sync(remote, self.repository, "mirror_complete"))
+        self.assertEqual({}, remote.requests)
@@ -0,0 +1,94 @@
+import hashlib
+
+import pytest
+
+from pulp_rpm.app.zchunk import ZchunkError, assemble, missing_ranges, parse_header, read_header
+
+
+def compint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if not value:
+            out.append(byte | 0x80)
+            return bytes(out)
+        out.append(byte)
+
+
+def make_zchunk(chunks):
+    """Build an (uncompressed) zchunk file with sha256 checksums from the given chunks."""
+    data = b"".join(chunks)
+    index = compint(1) + compint(len(chunks) + 1)
+    # empty dictionary chunk
+    index += bytes(32) + compint(0) + compint(0)
+    for chunk in chunks:
+        index += hashlib.sha256(chunk).digest() + compint(len(chunk)) + compint(len(chunk))
+    header = hashlib.sha256(data).digest() + compint(0) + compint(0)
+    header += compint(len(index)) + index + compint(0)
+    lead = b"\0ZCK1" + compint(1) + compint(len(header))
+    checksum = hashlib.sha256(lead + header).digest()
+    return lead + checksum + header + data
+
+
+def test_parse_header():
+    """The chunks and their position in the file are read from the header."""
+    chunks = [b"a" * 10, b"b" * 300, b"c" * 5]
+    zck = make_zchunk(chunks)
+    header = parse_header(zck)
+
+    assert header.size == len(zck) - 315
+    assert [chunk.length for chunk in header.chunks] == [0, 10, 300, 5]
+    for chunk, data in zip(header.chunks[1:], chunks):
+        assert zck[chunk.offset : chunk.offset + chunk.length] == data
+
+
+def test_corrupted_header():
+    """A header which does not match its checksum is refused."""
+    zck = bytearray(make_zchunk([b"a" * 10]))
+    zck[-11] ^= 0xFF  # inside the index
+    with pytest.raises(ZchunkError):
+        parse_header(bytes(zck))
+    with pytest.raises(ZchunkError):
+        parse_header(b"<?xml")
+
+
+def test_delta(tmp_path, monkeypatch):
+    """Only the changed chunks are downloaded, the file is assembled from both sources."""
+    monkeypatch.chdir(tmp_path)
+    old_zck = make_zchunk([b"a" * 100, b"b" * 100, b"c" * 100])
+    new_zck = make_zchunk([b"a" * 100, b"x" * 50, b"c" * 100, b"y" * 20])
+    old_path = tmp_path / "old.zck"
+    old_path.write_bytes(old_zck)
+
+    header = parse_header(new_zck)
+    reusable, ranges = missing_ranges(header, read_header(old_path), merge_gap=0)
+    assert len(reusable) == 2
+    assert ranges == [
+        (header.chunks[2].offset, header.chunks[2].offset + 49),
+        (header.chunks[4].offset, header.chunks[4].offset + 19),
+    ]
+
+    fetched = []
+    for i, (start, end) in enumerate(ranges):
+        range_path = tmp_path / f"range{i}"
+        range_path.write_bytes(new_zck[start : end + 1])
+        fetched.append((start, str(range_path)))
+
+    digests = {"sha256": hashlib.sha256(new_zck).hexdigest()}
+    path = assemble(new_zck, header, str(old_path), reusable, fetched, digests)
+    with open(path, "rb") as f:
+        assert f.read() == new_zck
+
+    with pytest.raises(ZchunkError):
+        assemble(new_zck, header, str(old_path), reusable, fetched, {"sha256": "0" * 64})
+
+
+def test_merge_close_ranges():
+    """Missing chunks close to each other are fetched with one request."""
+    header = parse_header(make_zchunk([b"x" * 10, b"a" * 10, b"y" * 10]))
+    old_header = parse_header(make_zchunk([b"a" * 10]))
+    reusable, ranges = missing_ranges(header, old_header)
+
+    assert reusable == {header.chunks[2].checksum: old_header.chunks[1].offset}
+    assert ranges == [(header.chunks[1].offset, header.chunks[3].offset + 9)]